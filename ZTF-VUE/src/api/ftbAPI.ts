@@ -163,6 +163,59 @@ export const sendMessage = async (
   }
 }
 
+/**
+ * 流式发送消息到后端
+ * 功能：调用/chat_stream接口，逐块接收系统回复（SSE格式）
+ * 参数：
+ *   - user_msg: 用户输入的消息内容
+ *   - sessionid: 当前会话ID
+ *   - userid: 用户ID
+ *   - story_type: 话题类型（可选）
+ *   - onDelta: 每收到一段增量文本时的回调
+ * 返回值：
+ *   - Promise<SendMessageResponse>: 流结束后返回会话ID和完整系统回复
+ */
+export const sendMessageStream = async (
+  user_msg: string,
+  sessionid: string,
+  userid: string,
+  story_type: string = '',
+  onDelta: (delta: string) => void = () => {}
+): Promise<SendMessageResponse> => {
+  const params = new URLSearchParams({ userid, sessionid, user_msg, story_type })
+  const response = await fetch(`${API_BASE_URL}/chat_stream?${params.toString()}`)
+  if (!response.ok || !response.body) {
+    throw new Error(`流式请求失败: ${response.status}`)
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder('utf-8')
+  let buffer = ''
+  let system_msg = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    // SSE事件之间以空行分隔
+    const events = buffer.split('\n\n')
+    buffer = events.pop() || ''
+    for (const event of events) {
+      if (!event.startsWith('data: ')) continue
+      const data = JSON.parse(event.slice(6))
+      if (data.error) {
+        throw new Error(data.error)
+      }
+      if (data.delta) {
+        system_msg += data.delta
+        onDelta(data.delta)
+      }
+      if (data.done) {
+        return { sessionid: data.sessionid, system_msg: data.system_msg }
+      }
+    }
+  }
+  return { sessionid, system_msg }
+}
+
 /**
  * 加载特定会话的历史记录
  * 功能：根据会话ID和用户ID加载特定会话的历史记录
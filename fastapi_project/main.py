@@ -1,24 +1,19 @@
-from fastapi_project.util.chat_util import (
-    initialize_llamaindex,
-    get_user_keywords,
-    get_es_docs,
-    find_paragraphs_with_keyword,
-    get_paras_from_kws
-)
 import asyncio
-from fastapi_project.util.db_util import get_docs_from_summaryindex
-from fastapi_project.settings import settings
+from fastapi_project.util.retrieval_util import gather_chat_context
+from fastapi_project.util.session_store import create_session_store
+from fastapi_project.util.llm_gateway import get_llm_gateway
+from fastapi_project.util.es_util import get_es_client
+from fastapi_project.util.kw_cache import keyword_cache
+from fastapi_project.util.history_util import select_history_window, afold_into_summary, build_history_prompt
+from fastapi_project.util.resource_registry import registry
 from fastapi_project.util import db_util
 from fastapi_project.util.speech_recognition import recognize_audio_file
 from fastapi_project.util.text_to_speech import synthesize_text
-from fastapi_project.util.spider_util import get_baidu_hot_news,get_topics,save_to_db
+from fastapi_project.util.job_util import JobManager
 import uuid
 import json
-from llama_index.core import StorageContext, get_response_synthesizer, load_index_from_storage
-# 初始化llm和embed模型 - 只调用一次
-llm, embed_model = initialize_llamaindex(deepseekapi=settings.DEEPSEEK_API)
-# 加载索引时使用已初始化的模型
-summary_index,simple_index = db_util.load_indexes()
+from contextlib import asynccontextmanager
+# 嵌入模型和simpleindex、summaryindex、news_summaryindex在lifespan中由registry统一加载一次
 # chat_history = [
 #     {"role": "assistant", "content": "你好"},
 #     {"role": "user", "content": "邹韬奋是谁？"},
@@ -26,18 +21,39 @@ summary_index,simple_index = db_util.load_indexes()
 #     {"role": "user", "content": "他在监狱里面经历了什么？"},
 
 # ]
-#加载新闻索引
-storage_context = StorageContext.from_defaults(persist_dir="fastapi_project\\store\\news_summaryindex")
-loaded_news_sum_index = load_index_from_storage(storage_context)
   
 
-from fastapi import FastAPI, Query, File, UploadFile, Form
+from fastapi import FastAPI, Query, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from openai import OpenAI
 import os
 from datetime import datetime
-app = FastAPI()
+
+#所有LLM调用共用一个网关（连接池、重试、并发限制）
+llm_gateway = get_llm_gateway()
+#会话存储：内存LRU/TTL缓存 + 后台写入message表，会话在第一次访问时才加载；建表等操作在lifespan中执行
+session_store = None
+#热点时评后台任务
+job_manager = JobManager()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global session_store
+    session_store = await asyncio.to_thread(create_session_store)
+    #启动时加载嵌入模型和索引，只加载一次
+    await asyncio.to_thread(registry.load)
+    print(f"资源加载完成: {registry.status()}")
+    yield
+    await job_manager.close()
+    #先把未写入的会话落盘，再关闭进程级数据库连接池和LLM连接
+    session_store.close()
+    db_util.close_pool()
+    await llm_gateway.aclose()
+    await get_es_client().aclose()
+    registry.close()
+
+app = FastAPI(lifespan=lifespan)
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -50,136 +66,77 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
-client = OpenAI(api_key=settings.DEEPSEEK_API, base_url="https://api.deepseek.com")
-msg_pool = {
-    'user1':{'session1':[{"role": "system", "content": "You are a helpful assistant"},
-        {"role": "user", "content": "Hello"}],
-        'session2':[{"role": "system", "content": "You are a helpful assistant"},
-        {"role": "user", "content": "Hello"}]
-    },
-    'user2':{'session1':[{"role": "system", "content": "You are a helpful assistant"},
-        {"role": "user", "content": "Hello"}],
-        'session2':[{"role": "system", "content": "You are a helpful assistant"},
-        {"role": "user", "content": "Hello"}]
-    }
-    
-}
+#get_docs_from_summaryindex(registry.news_summary_index)
+
+@app.post("/topic_jobs")
+async def submit_topic_job(force: bool = Query(False, description="已有未完成任务时是否仍然提交新任务")):
+    """
+    提交热点时评任务（爬虫、总结、入库、检索、生成评论），立即返回job_id
+    已有未完成的任务时返回该任务，避免重复爬虫
+    """
+    job, created = job_manager.submit(force=force)
+    return {'job_id': job.job_id, 'status': job.status, 'created': created}
+
+@app.get("/topic_jobs/{job_id}")
+async def get_topic_job(job_id: str):
+    """任务状态：当前阶段，以及各阶段的状态、进度(done/total)和耗时"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.status_dict()
 
-#get_docs_from_summaryindex(loaded_news_sum_index)
+@app.get("/topic_jobs/{job_id}/result")
+async def get_topic_job_result(job_id: str):
+    """任务结果：按热点顺序排列的评论，任务未完成时返回已生成的部分"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {'job_id': job.job_id, 'status': job.status, 'msg': job.sorted_results()}
 
 @app.get("/generate_topic_and_comments")
-async def generate_topic_and_comments():
+async def generate_topic_and_comments(poll_interval: float = Query(1.0, description="检查任务进度的间隔（秒）")):
     """
-    进行爬虫、入库、选择最新热点，调取index、产生时评
+    提交（或复用未完成的）热点时评任务，并以SSE格式推送任务进度：
+    data: {"job_id": "..."} 为任务id，data: {"stage": "..."} 为当前阶段，
+    每个热点生成完成后立即返回 data: {"index": i, "news": {...}}（失败时为 {"index": i, "error": "..."}），
+    最后一条为 data: {"done": true, "count": 热点数} 或 data: {"error": "..."}
+    客户端断开不影响任务继续执行，之后可通过/topic_jobs/{job_id}读取
     """
-    #1.爬虫和入库
-    news_text = get_baidu_hot_news()
-    # 过滤掉空列表的情况
-    filtered_news_text = {key: value for key, value in news_text.items() if value}
-    res = get_topics(filtered_news_text)
-    save_to_db(res,filtered_news_text)
-    #2.从数据库取出最新热点数据
-    query = """
-    select * from(
-select distinct on(content_length)* from(
-SELECT * FROM baidu_news 
-WHERE DATE_TRUNC('minute', created_at) = (
-    SELECT MAX(DATE_TRUNC('minute', created_at)) FROM baidu_news
-) and content_length > 100) as result) as b
-order by  hottopic;
-    """
-    res = db_util.execute_query(query)
-    import pandas as pd
-    df = pd.DataFrame(res)
-    groups = df.groupby(by=[1])
-    titles=[]
-    abstracts=[]
-    keywords_list=[]
-    contexts=[]
-    for name,group in groups:
-        titles.append(group.iloc[0][1])
-        abstracts.append(group.iloc[0][9])
-        keywords_list.append(group.iloc[0][10])
-        context = ''
-        for cont in group.iloc[:,3]:
-            context +='报道：\n\n'+ cont + '\n'+'------------------------------------\n'
-        contexts.append(context)
-    df_news=pd.DataFrame({'title':titles,'abstract':abstracts,'keywords':keywords_list,'context':contexts})
-    print(df_news['keywords'][0])
-    llm, embed_model = initialize_llamaindex(deepseekapi=settings.DEEPSEEK_API)
-    #加载新闻索引
-    storage_context = StorageContext.from_defaults(persist_dir="fastapi_project\\store\\news_summaryindex")
-    loaded_news_sum_index = load_index_from_storage(storage_context)
-    # 检索
-    ref_source = []
-    for keywords in df_news['keywords']:
-        query = f"""
-        用户希望查询的主题是：{keywords},
-        哪些文档的主题和用户查询的主题相符合？
-        """
-        ref_docs = get_docs_from_summaryindex(loaded_news_sum_index,query=query,k=3)
-        # 选择text最长的ref_doc
-        ref_doc = max(ref_docs, key=lambda x: len(x['text'])) if ref_docs else None
-        ref_source.append(ref_doc['text'])
-    df_news['ref_resource'] = ref_source
-    #开始获取评论
-    print(len(df_news))
-    from openai import OpenAI
-    client = OpenAI(api_key=settings.DEEPSEEK_API, base_url="https://api.deepseek.com")
-    system_msg_list = []
-    one_comment_list = []
-    for i in range(len(df_news)):
-        se = df_news.iloc[i]
-        context = se['context']
-        ref_resource= se['ref_resource']
-        GET_COMMENTS_PROMPT=f"""
-        任务：你将扮演邹韬奋对时事新闻进行评论。你需要参考时事新闻的相关报道，并模仿目标文本纂写评论。
-        评论的长度和目标文本类似。
-        注意：
-        1.你需要解析目标文本所使用的叙述结构、修辞手法和语言风格，以及重要的态度，并在评论中体现这些特点。
-        2.你需要围绕时事新闻进行评论，而不能超出给定的时事新闻的范围。
-        3.最大限度利用时事新闻的信息。
-        4.你需要尽可能改写目标文本中的描述，以适应对时事新闻的评论。
-        ==============================
-        你参考的时事新闻是：
-        {context}
-        ===============================
-        你需要仿照的目标文本是：
-        {ref_resource}
-        ===============================
-        你的评论：
-        """
-        response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": GET_COMMENTS_PROMPT},
-        ],
-        stream=False
-        )
-        system_msg = response.choices[0].message.content
-        system_msg_list.append(system_msg)
-        GET_ONE_COMMENT_PROMPT = f"""
-        你将扮演邹韬奋，依据下列评论文本，总结评论内容，形成一句掷地有声的概括性评论。
-        概括性评论需要吸人眼球，具有口语特征，不要使用书面语的特殊用法。不超过20个字，仅返回概括性评论内容，不需要附加其余的解释，不要含有双引号，不要含有冒号。
-        评论文本是：
-        {system_msg}
-        你的评论：
-        """
-        response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": GET_ONE_COMMENT_PROMPT},
-        ],
-        stream=False
-        )
-        one_comment = response.choices[0].message.content
-        one_comment_list.append(one_comment)
-    df_news['comments'] = system_msg_list
-    df_news['one_comment'] = one_comment_list
-    return_msg = df_news.loc[:,['title','one_comment','abstract','comments','keywords','ref_resource']]
-    return {'msg':return_msg}
+    job, created = job_manager.submit()
+
+    def event(data):
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def event_generator():
+        yield event({'job_id': job.job_id})
+        stage, sent, idle = None, 0, 0.0
+        while True:
+            if job.current_stage and job.current_stage != stage:
+                stage = job.current_stage
+                idle = 0.0
+                yield event({'stage': stage})
+            for result in job.results[sent:]:
+                idle = 0.0
+                yield event(result)
+            sent = len(job.results)
+            if job.finished:
+                break
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+            # 长时间没有新事件时发送注释，避免反向代理判定连接空闲
+            if idle >= 15:
+                idle = 0.0
+                yield ": keepalive\n\n"
+        if job.status == 'failed':
+            yield event({'error': job.error})
+        else:
+            yield event({'done': True, 'count': sent})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 
@@ -190,36 +147,32 @@ order by  hottopic;
 
 
 @app.get("/chat")
-def chat(
+async def chat(
     userid: str = Query(..., description="用户ID"),
     sessionid: str = Query(..., description="会话ID"), 
     user_msg: str = Query(..., description="用户消息"),
     story_type: str = Query(..., description="故事类型"),
     func_control: dict = Form(default={'Vector': True, 'knowledge': True, 'EsSearch': True, 'Model_enhance': True})
 ):
-    #获取msg_pool中user_id和seession_id对应的msg列表
-    msg_list = msg_pool[userid][sessionid]
+    #获取user_id和seession_id对应的msg列表
+    # 在副本上追加，回复生成成功后再整体写回，失败时不会在缓存中留下半轮对话
+    msg_list = list(await asyncio.to_thread(session_store.get, userid, sessionid, create=True))
     msg_list.append({"role": "user", "content": user_msg})
-    ######根据关键词查询的信息，渲染为关键词模板,可能会出错
-    try:
-        an_kw = get_user_keywords(msg_list)
-        # 处理 get_user_keywords 的结果，避免 "Expression value is unused" 错误
-        if an_kw.get('is_about_ztaofen'):
-            kws = an_kw['keywords']
-            kw_paragraphs_list = get_paras_from_kws(kws)
-        #循环写入prompt
-        KW_PARA_PROMPT = """"""
-        for ky,kw_paragraphs in zip(kws,kw_paragraphs_list):
-            KW_PARA_PROMPT += f"用户的关键词是'{ky}'，\n相关段落是:{kw_paragraphs}\n\n"
-    except Exception as e:  
-        KW_PARA_PROMPT = ""
-    #######根据语义去向量数据库查询的信息
-    res = db_util.get_final_nodes_text(summary_index,simple_index,user_query=user_msg)
+    ######只保留最近几轮对话，更早的对话折叠进摘要，摘要更新和检索并发进行
+    summary = await asyncio.to_thread(session_store.get_summary, userid, sessionid)
+    window, to_fold = select_history_window(msg_list, summary)
+    ######关键词+ES查询与语义向量检索并发进行，任一阶段超时或出错按空处理
+    (KW_PARA_PROMPT, res, timings), summary = await asyncio.gather(
+        gather_chat_context(window, user_msg, registry.simple_index, registry.summary_index),
+        afold_into_summary(summary, to_fold)
+    )
+    await asyncio.to_thread(session_store.set_summary, userid, sessionid, summary)
+    history_prompt = build_history_prompt(window, summary)
     #######制作模板
     GET_AI_ANSWER=f"""
     你要扮演我国历史上的著名人物邹韬奋和用户进行对话。
     你们已经进行了如下对话:
-    {msg_list}
+    {history_prompt}
     当前的用户发言是：
     {user_msg}
     从用户发言中提取的关键词以及从数据库中抽取的该关键词相关文档是：
@@ -228,23 +181,75 @@ def chat(
     {res}
     请给出对用户合适的回应：
 """
-    response = client.chat.completions.create(
-    model="deepseek-chat",
-    messages=[
-        {"role": "system", "content": "You are a helpful assistant"},
-        {"role": "user", "content": GET_AI_ANSWER},
-    ],
-    stream=False
-    )
-    system_msg = response.choices[0].message.content
+    system_msg = await llm_gateway.acomplete(GET_AI_ANSWER)
     msg_list.append({"role": "system", "content":"{system_msg}".format(system_msg=system_msg)})
-    msg_pool[userid][sessionid] = msg_list
+    await asyncio.to_thread(session_store.set, userid, sessionid, msg_list)
     with open('temp.txt', 'w', encoding='utf-8') as f:
         f.write(str(msg_list))
-    print('调用chat后的msg_pool',msg_pool)
     print('调用chat后的当前用户msg_list',msg_list)
     return {'sessionid':sessionid,'system_msg':system_msg}
 
+@app.get("/chat_stream")
+async def chat_stream(
+    userid: str = Query(..., description="用户ID"),
+    sessionid: str = Query(..., description="会话ID"), 
+    user_msg: str = Query(..., description="用户消息"),
+    story_type: str = Query(..., description="故事类型")
+):
+    """
+    /chat的流式版本，以SSE格式逐块返回邹韬奋的回复：
+    data: {"delta": "..."} 为增量文本，最后一条 data: {"done": true, "system_msg": "..."} 为完整回复。
+    回复完整生成后才写入会话历史，中途出错则发送 {"error": "..."} 且不写入历史。
+    """
+    # 在副本上追加，回复生成成功后再整体写回，失败时不会在缓存中留下半轮对话
+    msg_list = list(await asyncio.to_thread(session_store.get, userid, sessionid, create=True))
+    msg_list.append({"role": "user", "content": user_msg})
+    summary = await asyncio.to_thread(session_store.get_summary, userid, sessionid)
+    window, to_fold = select_history_window(msg_list, summary)
+    (KW_PARA_PROMPT, res, timings), summary = await asyncio.gather(
+        gather_chat_context(window, user_msg, registry.simple_index, registry.summary_index),
+        afold_into_summary(summary, to_fold)
+    )
+    await asyncio.to_thread(session_store.set_summary, userid, sessionid, summary)
+    history_prompt = build_history_prompt(window, summary)
+    GET_AI_ANSWER = f"""
+    你要扮演我国历史上的著名人物邹韬奋和用户进行对话。
+    你们已经进行了如下对话:
+    {history_prompt}
+    当前的用户发言是：
+    {user_msg}
+    从用户发言中提取的关键词以及从数据库中抽取的该关键词相关文档是：
+    {KW_PARA_PROMPT}
+    你还可以参考如下信息：
+    {res}
+    请给出对用户合适的回应：
+"""
+
+    async def event_generator():
+        chunks = []
+        try:
+            async for delta in llm_gateway.astream_chat([
+                {"role": "system", "content": "You are a helpful assistant"},
+                {"role": "user", "content": GET_AI_ANSWER},
+            ]):
+                chunks.append(delta)
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"流式回复失败: {e}")
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        system_msg = ''.join(chunks)
+        # 流结束后再写入会话历史，和/chat保持一致
+        msg_list.append({"role": "system", "content": system_msg})
+        await asyncio.to_thread(session_store.set, userid, sessionid, msg_list)
+        yield f"data: {json.dumps({'done': True, 'sessionid': sessionid, 'system_msg': system_msg}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        # 禁止反向代理缓冲，保证首个token尽快到达前端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 # @app.get("/chat")
@@ -320,14 +325,21 @@ def chat(
 #         'audio_duration': audio_duration
 #     }
 
+@app.get("/resources")
+def resources():
+    #嵌入模型和索引的加载状态及耗时
+    return registry.status()
+
+@app.get("/cache_stats")
+def cache_stats():
+    #关键词提取缓存的命中情况，查询向量化服务的批次、排队时间和缓存命中情况
+    return {"keyword_cache": keyword_cache.stats(), "embedding": registry.embed_stats()}
+
 @app.get("/load_history")
 def load_history(
     userid: str = Query(..., description="用户ID")
 ):
-    excute_query = f"""
-    SELECT session_id,update_time,abstract FROM message WHERE user_id = '{userid}' ;
-    """
-    history = db_util.execute_query(excute_query)
+    history = session_store.list_sessions(userid)
     # print('没有历史数据的情况',history)
     if not history:
         return {"msg": [{'session_id':10001,'abstrc':'10001','update_time':'1999/01/01 12:00:00'}]}
@@ -339,7 +351,7 @@ def load_history(
             'update_time': update_time.strftime('%Y/%m/%d %H:%M:%S')
         })
     print('load_history',formatted_history)
-    #此时只加载用户历史记录，但是不加入msg_pool，等到用户前端点击某条历史记录，或者创造新的聊天记录时才加入msg_pool
+    #此时只加载用户历史记录列表，会话内容等到用户前端点击某条历史记录时才加载到内存
     
     return {"msg": formatted_history}
 
@@ -348,41 +360,21 @@ def load_specific_session(
     userid: str = Query(..., description="用户ID"),
     sessionid: str = Query(..., description="会话ID")
 ):
-    excute_query = f"""
-    SELECT user_id,session_id,history FROM message WHERE user_id = '{userid}' AND session_id = '{sessionid}';
-    """
-    history = db_util.execute_query(excute_query)
+    #会话不在内存中时从后端加载，之后的聊天直接使用内存中的会话
+    history = session_store.get(userid, sessionid)
     formatted_history = []
-    if history:
-        for user_id, session_id, history in history:
-            formatted_history.append({
-                'user_id': user_id,
-                'session_id': session_id,
-                'history': history
-            })
-    if formatted_history:
-        history_data = formatted_history[0]['history']
-        if isinstance(history_data, str):
-            history_data = json.loads(history_data)
-        if userid not in msg_pool:
-            msg_pool[userid] = {}
-        if sessionid not in msg_pool[userid]:
-            msg_pool[userid][sessionid] = []
-        msg_pool[userid][sessionid] = history_data
-        print('加载了特定旧历史记录后的msg_pool',msg_pool)
+    if history is not None:
+        formatted_history.append({
+            'user_id': userid,
+            'session_id': sessionid,
+            'history': json.dumps(history, ensure_ascii=False)
+        })
     return {"msg": formatted_history}
 
 @app.get("/create_user")
 def create_user():
     user_id = str(uuid.uuid4())
-    session_id = 'session_'+str(uuid.uuid4())
-    #只需要返回用户id，不需要写入数据库，等到用户离开的时候自然会写入，除非用户没有聊天
-    # excute_query = f"""
-    # INSERT INTO message (user_id, session_id) VALUES ('{user_id}', '{session_id}');
-    # """
-    # db_util.execute_query(excute_query)
-    msg_pool[user_id] = {session_id: []}
-    print('创建了新用户后的msg_pool',msg_pool)
+    #只需要返回用户id，不需要写入数据库，会话在第一次访问时由session_store创建，这里不需要预先占位
     return {"user_id": user_id}
 
 @app.get("/create_new_chat")
@@ -390,12 +382,9 @@ def create_new_chat(
     userid: str = Query(..., description="用户ID")
 ):
     session_id = 'session_'+str(uuid.uuid4())
-    excute_query = f"""
-    INSERT INTO message (user_id, session_id) VALUES ('{userid}', '{session_id}');
-    """
-    db_util.execute_query(excute_query)
-    msg_pool[userid] = {session_id: []}
-    print('创建了新会话后的msg_pool',msg_pool)
+    #创建空会话并立即写入后端，使其出现在历史记录列表中
+    session_store.create(userid, session_id)
+    print('创建了新会话',userid,session_id)
     return {"user_id": userid, "session_id": session_id}
 
 @app.get("/chat/delete_session")
@@ -403,90 +392,59 @@ def delete_session(
     userid: str = Query(..., description="用户ID"),
     sessionid: str = Query(..., description="会话ID")
 ):
-    #deletesession就是从列表删除，但是在create_new_chat中会重新创建一个会话,所以可能会要求删除内存中的会话
-    if userid in msg_pool and sessionid in msg_pool[userid]:
-        del msg_pool[userid][sessionid]
-    print('删除会话后的msg_pool',msg_pool)
-    #删除数据库中的会话
-    excute_query = f"""
-    DELETE FROM message WHERE user_id = '{userid}' AND session_id = '{sessionid}';
-    """
-    db_util.execute_query(excute_query)
+    #同时删除内存中和数据库中的会话
+    session_store.delete(userid, sessionid)
+    print('删除会话',userid,sessionid)
     return {"msg": "删除成功"}
 
 @app.get("/chat/save_usermsg")
 def save_usermsg(
     userid: str = Query(..., description="用户ID")
 ):
-    # 获取该用户的所有会话消息，如果用户没有聊天，则不保存
-    if userid not in msg_pool:
+    # 获取该用户在内存中的所有会话消息，如果用户没有聊天，则不保存
+    user_sessions = session_store.user_sessions(userid)
+    if not user_sessions:
         return {"msg": "用户没有聊天"}
-    user_sessions = msg_pool.get(userid, {})    
+    # 历史记录由session_store在后台写入，这里立即落盘一次，之后只需要更新摘要
+    session_store.flush([(userid, session_id) for session_id in user_sessions])
     for session_id, history in user_sessions.items():
-        # 将历史记录转换为JSON字符串
-        history_json = json.dumps(history, ensure_ascii=False)
-        print('history_json',history_json)
         GET_ABSTRCT_PROMPT = f"""
         你是一个历史学家，擅长从历史人物的对话中总结讨论主题。
         用户的历史对话是：
         {history}
         请总结讨论主题，不要超过20个字。
         """
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "system", "content": GET_ABSTRCT_PROMPT},],
-            stream=False
-        )
-        abstract = response.choices[0].message.content
+        abstract = llm_gateway.chat([{"role": "system", "content": GET_ABSTRCT_PROMPT},])
         print('abstract',abstract)
-        # 更新数据库中的历史记录
-        update_query = f"""
-        UPDATE message 
-        SET history = '{history_json}',
-            update_time = CURRENT_TIMESTAMP,
-            abstract = '{abstract}'
-        WHERE user_id = '{userid}' 
-        AND session_id = '{session_id}';
-        """
-        db_util.execute_query(update_query)
+        # 更新数据库中的会话摘要
+        session_store.update_abstract(userid, session_id, abstract)
     return {"msg": "保存成功"}
 
-def process_chat_internal(userid: str, sessionid: str, user_msg: str, story_type: str, func_control: dict) -> str:
+async def process_chat_internal(userid: str, sessionid: str, user_msg: str, story_type: str, func_control: Optional[dict] = None) -> str:
     """
     内部聊天处理函数，返回AI回复
     """
     try:
-        # 获取msg_pool中user_id和session_id对应的msg列表
-        msg_list = msg_pool[userid][sessionid]
+        # 获取user_id和session_id对应的msg列表
+        msg_list = list(await asyncio.to_thread(session_store.get, userid, sessionid, create=True))
         msg_list.append({"role": "user", "content": user_msg})
         
-        # 根据关键词查询的信息，渲染为关键词模板
-        KW_PARA_PROMPT = ""
-        try:
-            an_kw = get_user_keywords(msg_list)
-            if an_kw.get('is_about_ztaofen'):
-                kws = an_kw.get('keywords', [])
-                if kws:  # 确保keywords不为空
-                    kw_paragraphs_list = get_paras_from_kws(kws)
-                    # 循环写入prompt
-                    for ky, kw_paragraphs in zip(kws, kw_paragraphs_list):
-                        KW_PARA_PROMPT += f"用户的关键词是'{ky}'，\n相关段落是:{kw_paragraphs}\n\n"
-        except Exception as e:  
-            KW_PARA_PROMPT = ""
-            print(f"关键词处理失败: {e}")
-        
-        # 根据语义去向量数据库查询的信息
-        try:
-            res = db_util.get_final_nodes_text(summary_index, simple_index, user_query=user_msg)
-        except Exception as e:
-            res = ""
-            print(f"向量数据库查询失败: {e}")
+        # 只保留最近几轮对话，更早的对话折叠进摘要
+        summary = await asyncio.to_thread(session_store.get_summary, userid, sessionid)
+        window, to_fold = select_history_window(msg_list, summary)
+        # 关键词+ES查询与语义向量检索、摘要更新并发进行，各阶段失败时按空结果处理
+        (KW_PARA_PROMPT, res, timings), summary = await asyncio.gather(
+            gather_chat_context(window, user_msg, registry.simple_index, registry.summary_index),
+            afold_into_summary(summary, to_fold)
+        )
+        await asyncio.to_thread(session_store.set_summary, userid, sessionid, summary)
+        history_prompt = build_history_prompt(window, summary)
         
         # 制作模板
         GET_AI_ANSWER = f"""
         你要扮演我国历史上的著名人物邹韬奋和用户进行对话。
         你们已经进行了如下对话:
-        {msg_list}
+        {history_prompt}
         当前的用户发言是：
         {user_msg}
         从用户发言中提取的关键词以及从数据库中抽取的该关键词相关文档是：
@@ -496,20 +454,10 @@ def process_chat_internal(userid: str, sessionid: str, user_msg: str, story_type
         请给出对用户合适的回应，回复中不需要加入动作或神情描述，只需要给出当事人的语言回复：
         """
         
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant"},
-                {"role": "user", "content": GET_AI_ANSWER},
-            ],
-            stream=False
-        )
-        
-        system_msg = response.choices[0].message.content or "抱歉，我无法生成回复。"
+        system_msg = await llm_gateway.acomplete(GET_AI_ANSWER) or "抱歉，我无法生成回复。"
         msg_list.append({"role": "system", "content": system_msg})
-        msg_pool[userid][sessionid] = msg_list
+        await asyncio.to_thread(session_store.set, userid, sessionid, msg_list)
         
-        print(f'语音聊天后的msg_pool: {msg_pool}')
         print(f'语音聊天后的当前用户msg_list: {msg_list}')
         
         return system_msg
@@ -590,14 +538,8 @@ async def upload_audio(
         ai_response = None
         if recognized_text and "失败" not in recognized_text and "不可用" not in recognized_text:
             try:
-                # 确保用户和会话在msg_pool中存在
-                if user_id not in msg_pool:
-                    msg_pool[user_id] = {}
-                if session_id not in msg_pool[user_id]:
-                    msg_pool[user_id][session_id] = []
-                
                 # 调用内部聊天处理函数
-                ai_response = process_chat_internal(user_id, session_id, recognized_text, story_type)
+                ai_response = await process_chat_internal(user_id, session_id, recognized_text, story_type, func_control)
                 
             except Exception as e:
                 print(f"AI回复生成失败: {str(e)}")
@@ -617,7 +559,7 @@ async def upload_audio(
         
         # 确保ai_response不为None再添加到消息池
         if ai_response is not None:
-            msg_pool[user_id][session_id].append({"role": "assistant", "content": ai_response})
+            await asyncio.to_thread(session_store.append, user_id, session_id, {"role": "assistant", "content": ai_response})
         
         return {
             "msg": "语音处理成功",
@@ -11,6 +11,107 @@ class Settings(BaseSettings):
     ALIBABA_CLOUD_ACCESS_KEY_SECRET: str
     DASHSCOPE_API_KEY: str
     DASHSCOPE_BASE_URL: str
+    #检索阶段的超时时间（秒），超时后该阶段结果按空处理
+    KEYWORD_TIMEOUT: float = 8.0
+    ES_TIMEOUT: float = 3.0
+    VECTOR_TIMEOUT: float = 5.0
+    #两级向量检索：摘要索引选出的文档数、选中文档中检索的段落数、至少返回的段落数
+    VECTOR_DOC_TOP_K: int = 3
+    VECTOR_CHUNK_TOP_K: int = 5
+    VECTOR_MIN_CHUNKS: int = 3
+    #向量库后端：simple为llama_index默认的JSON向量库，hnsw为近似最近邻索引，mmap为内存映射的向量矩阵（后两者需先执行vector_store convert）
+    VECTOR_BACKEND: str = "simple"
+    #mmap向量矩阵的存储类型：float16或float32
+    VECTOR_MMAP_DTYPE: str = "float16"
+    #查询向量化服务：是否合并批次、收集一批的等待时间（秒）、每批最多查询数、计算线程数、缓存的查询向量数
+    EMBED_BATCHING: bool = True
+    EMBED_BATCH_WINDOW: float = 0.01
+    EMBED_MAX_BATCH_SIZE: int = 32
+    EMBED_WORKERS: int = 1
+    EMBED_CACHE_SIZE: int = 2000
+    #嵌入模型推理后端：torch为PyTorch的HuggingFaceEmbedding，onnx为ONNX Runtime（需先执行onnx_embedding export）
+    EMBED_BACKEND: str = "torch"
+    #ONNX模型目录、是否使用int8量化模型、推理线程数（0为自动）、一致性检查要求的最小余弦相似度
+    ONNX_MODEL_DIR: str = "models/bge-large-zh-v1.5-onnx"
+    ONNX_QUANTIZED: bool = True
+    ONNX_THREADS: int = 0
+    ONNX_MIN_COSINE: float = 0.99
+    #HNSW参数：M和EF_CONSTRUCTION在建索引时生效，EF_SEARCH在查询时生效，越大召回率越高、越慢
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    #postgres连接池配置
+    DB_HOST: str = "localhost"
+    DB_PORT: str = "5432"
+    DB_POOL_MIN: int = 1
+    DB_POOL_MAX: int = 10
+    #连接空闲超过该秒数后，取出时先做一次健康检查
+    DB_HEALTHCHECK_INTERVAL: float = 30.0
+    #批量写入时每个批次（一个事务）的行数
+    BULK_BATCH_SIZE: int = 500
+    #会话存储：postgres（生产）或sqlite（本地测试）
+    SESSION_BACKEND: str = "postgres"
+    SESSION_SQLITE_PATH: str = "fastapi_project/sessions.db"
+    #内存中最多缓存的会话数、会话未访问多久后淘汰（秒）、后台写入间隔（秒）
+    SESSION_CACHE_SIZE: int = 1000
+    SESSION_TTL: float = 1800.0
+    SESSION_FLUSH_INTERVAL: float = 5.0
+    #prompt中原样保留的最近对话轮数和token预算，更早的对话折叠进摘要
+    HISTORY_MAX_TURNS: int = 6
+    HISTORY_TOKEN_BUDGET: int = 1500
+    #窗口外未摘要的消息达到该数量时才调用一次LLM更新摘要
+    HISTORY_FOLD_BATCH: int = 4
+    #LLM网关配置
+    LLM_BASE_URL: str = "https://api.deepseek.com"
+    LLM_MODEL: str = "deepseek-chat"
+    LLM_TIMEOUT: float = 60.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_MAX_CONCURRENCY: int = 8
+    #关键词提取缓存：条数上限、有效期（秒）、参与哈希的前文用户发言条数
+    KW_CACHE_SIZE: int = 1000
+    KW_CACHE_TTL: float = 3600.0
+    KW_CACHE_CONTEXT_TURNS: int = 1
+    #是否启用bge嵌入相似度查找，以及命中阈值
+    KW_CACHE_SEMANTIC: bool = False
+    KW_CACHE_SIMILARITY: float = 0.92
+    #爬虫配置：浏览器数量、同一域名的请求间隔(秒)和并发数、页面显式等待的超时(秒)
+    CRAWLER_WORKERS: int = 4
+    CRAWLER_DOMAIN_INTERVAL: float = 1.0
+    CRAWLER_DOMAIN_CONCURRENCY: int = 2
+    CRAWLER_PAGE_TIMEOUT: float = 10.0
+    #HTTP直接抓取：并发连接数、超时(秒)、条件请求缓存的url数、正文少于该字数时改用浏览器渲染
+    HTTP_FETCH_CONCURRENCY: int = 16
+    HTTP_FETCH_TIMEOUT: float = 10.0
+    HTTP_CACHE_SIZE: int = 2000
+    HTTP_MIN_TEXT_LENGTH: int = 100
+    #热点总结：同时进行的总结请求数、解析失败时的重试次数
+    TOPIC_CONCURRENCY: int = 6
+    TOPIC_MAX_RETRIES: int = 2
+    #时评生成：同时生成评论的热点数
+    COMMENT_WORKERS: int = 4
+    #热点时评后台任务：同时执行的任务数（爬虫阶段始终只有一个任务在执行）
+    JOB_WORKERS: int = 2
+    #新闻去重：内存中保留指纹的天数、url在多少秒内抓取过则不再重新抓取、SimHash近似重复的汉明距离阈值
+    DEDUP_WINDOW_DAYS: int = 30
+    DEDUP_URL_TTL: float = 21600.0
+    DEDUP_SIMHASH_DISTANCE: int = 3
+    #ES关键词检索：地址、索引、每个关键词返回的文档数、每篇文档的片段数和片段长度
+    ES_URL: str = "http://localhost:9200"
+    ES_INDEX: str = "article"
+    ES_TOP_K: int = 5
+    ES_MAX_FRAGMENTS: int = 5
+    ES_FRAGMENT_SIZE: int = 200
+    #段落索引：每个段落一个文档，关键词直接检索段落；关闭时在文章索引上用高亮片段
+    #段落索引由es_index写入，执行过python -m fastapi_project.util.es_index后再开启
+    ES_PARAGRAPH_SEARCH: bool = False
+    ES_PARAGRAPH_INDEX: str = "article_paragraph"
+    ES_PARAGRAPH_TOP_K: int = 10
+    #ES批量索引：中文分词器（默认standard，不需要插件；安装ik插件后可设为ik_max_word/ik_smart，smartcn插件为smartcn）、
+    #查询分词器（为空时与ES_ANALYZER相同）、每批文章数、并发写入数
+    ES_ANALYZER: str = "standard"
+    ES_SEARCH_ANALYZER: str = ""
+    ES_BULK_CHUNK_SIZE: int = 500
+    ES_BULK_WORKERS: int = 4
     
     class Config:
         #注意：这里需要指定env文件的路径，否则会报错，从fastapi主项目入口开始写
@@ -62,6 +62,21 @@ def split_txt_files(source_file='fastapi_project//chat//txt_file', output_file='
                         f.write(section.strip())
 #split_txt_files()
 
+EMBED_MODEL_NAME = "BAAI/bge-large-zh-v1.5"
+
+#PyTorch版本的bge嵌入模型，也是ONNX模型一致性检查的参照
+def load_hf_embedding(cache_dir):
+    return HuggingFaceEmbedding(
+        model_name=EMBED_MODEL_NAME,
+        trust_remote_code=True,
+        cache_folder=cache_dir,
+        model_kwargs={
+            "trust_remote_code": True,
+            "revision": "main",
+            "local_files_only": True
+        }
+    )
+
 #初始化llamaindex相关配置,.默认使用deepseek
 def initialize_llamaindex(deepseekapi, offline_mode=False):
     # 初始化 DeepSeek 客户端
@@ -75,19 +90,15 @@ def initialize_llamaindex(deepseekapi, offline_mode=False):
     os.makedirs(cache_dir, exist_ok=True)
     print(f"模型缓存目录: {cache_dir}")
     
-    # 初始化嵌入模型
+    # 初始化嵌入模型，EMBED_BACKEND=onnx且已导出并通过一致性检查时使用ONNX Runtime，否则使用PyTorch
     try:
-        embed_model = HuggingFaceEmbedding(
-            model_name="BAAI/bge-large-zh-v1.5",
-            trust_remote_code=True,
-            cache_folder=cache_dir,
-            model_kwargs={
-                "trust_remote_code": True,
-                "revision": "main",
-                "local_files_only": True
-            }
-        )
-        print("成功加载 BAAI/bge-large-zh-v1.5 嵌入模型")
+        embed_model = None
+        if settings.EMBED_BACKEND == "onnx":
+            from fastapi_project.util.onnx_embedding import load_onnx_embedding
+            embed_model = load_onnx_embedding()
+        if embed_model is None:
+            embed_model = load_hf_embedding(cache_dir)
+            print(f"成功加载 {EMBED_MODEL_NAME} 嵌入模型")
     except Exception as e:
         print(f"模型加载失败: {str(e)}")
         raise
@@ -119,41 +130,24 @@ def show_doc_summaries(index: DocumentSummaryIndex):
             print(f"\n=== 文档 {doc_id} 的摘要 ===")
             print(summary_text)
 
-def find_paragraphs_with_keyword(content, keyword: str,n=5) -> list:
-    """
-    在文本文件中查找包含关键词的段落
-    
-    Args:
-        file_path: 文本文件路径
-        keyword: 要查找的关键词
-        
-    Returns:
-        包含关键词的段落列表
-    """
+def get_user_keywords(chat_history):
+    """提取用户关键词，相同或相近的提问直接使用缓存结果"""
+    from .kw_cache import keyword_cache
+    cached = keyword_cache.get(chat_history)
+    if cached is not None:
+        return cached
     try:
-        # with open(file_path, 'r', encoding='utf-8') as f:
-        #     content = f.read()
-            
-        # 按\n\n分割成段落
-        paragraphs = content.split('\n\n')
-        
-        # 过滤出包含关键词的段落
-        matching_paragraphs = [p.strip() for p in paragraphs if keyword in p]
-        
-        return matching_paragraphs[:n] #返回前5个段落
-        
+        json_data = extract_user_keywords(chat_history)
     except Exception as e:
-        print(f"发生错误: {str(e)}")
-        return []
+        return {"is_about_ztaofen":False,"keywords":[]}
+    # 只缓存成功解析的结果
+    keyword_cache.put(chat_history, json_data)
+    return json_data
 
-def get_user_keywords(chat_history):
-    from llama_index.llms.deepseek import DeepSeek
+def extract_user_keywords(chat_history):
+    """调用LLM判断是否在讨论邹韬奋并提取关键词，解析失败时抛出异常"""
     import json
-    llm = DeepSeek(
-            api_key=settings.DEEPSEEK_API,  # 替换为你的 DeepSeek API key
-            model="deepseek-chat"
-        )
-        # 使用llm进行查询
+    from .llm_gateway import get_llm_gateway
 
     # chat_history=[
     #         {"role": "assistant", "content": "你好"},
@@ -171,49 +165,23 @@ def get_user_keywords(chat_history):
     {chat_history}
     """
     GET_USER_KEYWORDS = GET_USER_KEYWORDS.replace("{chat_history}",str(chat_history))
-    try:
-        response = llm.complete(GET_USER_KEYWORDS)
-        json_str = response.text.strip('```json\n').strip('```')
-        json_data = json.loads(json_str)
-        return json_data
-    except Exception as e:
-        return {"is_about_ztaofen":False,"keywords":[]}
-
-# 使用 requests 库发送 GET 请求到 Elasticsearch,获取k个文档
-def get_es_docs(kw,k=5):
-    import requests,json
-    # 构建查询 URL
-    url = "http://localhost:9200/article/_search"
-    params = {
-        "q": "body:{kw}".format(kw=kw),
-        "size": "{k}".format(k=k),
-        "pretty": "true"
-    }
-    # 发送 GET 请求
-    response = requests.get(url, params=params)
-    # print('params',params)
-    body_list = []
-    res_list = json.loads(response.text)['hits']['hits']
-    for res in res_list:
-        body_list.append(res['_source']['body'])
-    return body_list
+    # 通过共享的LLM网关查询，不再每次新建客户端
+    response_text = get_llm_gateway().complete(GET_USER_KEYWORDS, system_prompt=None)
+    json_str = response_text.strip('```json\n').strip('```')
+    json_data = json.loads(json_str)
+    return json_data
 
 def get_paras_from_kws(kws):
-    kw_paragraphs_list = []  # 期望得到: [ [邹韬奋的段落], [生活的段落] ]   
-    for kw in kws:
-        docs = get_es_docs(kw)
-        
-        # 这是为当前关键词找到的所有段落
-        paragraphs_for_this_kw = [] 
-        
-        for doc in docs:
-            paragraphs = find_paragraphs_with_keyword(doc, kw,n=5)
-            #不是append，因此不会产生嵌套列表
-            paragraphs_for_this_kw.extend(paragraphs)
-            
-        # 修正：将当前关键词的段落列表添加到最终结果中
-        kw_paragraphs_list.append(paragraphs_for_this_kw)
-    return kw_paragraphs_list
+    #所有关键词合并为一个_msearch请求，期望得到: [ [邹韬奋的段落], [生活的段落] ]
+    from .es_util import get_es_client
+    return get_es_client().get_paras_from_kws(kws)
+
+#把关键词和对应段落渲染为prompt片段
+def build_kw_para_prompt(kws,kw_paragraphs_list):
+    KW_PARA_PROMPT = ""
+    for ky,kw_paragraphs in zip(kws,kw_paragraphs_list):
+        KW_PARA_PROMPT += f"用户的关键词是'{ky}'，\n相关段落是:{kw_paragraphs}\n\n"
+    return KW_PARA_PROMPT
 
 if __name__=="__main__":
     print(settings.DEEPSEEK_API)
@@ -0,0 +1,122 @@
+"""
+热点时评生成：从数据库取出最新一批热点，检索邹韬奋的参考文章，再生成评论和一句话评论
+- 所有热点的参考文章检索在生成评论之前一次性并发完成
+- 每个热点的评论链（评论 -> 一句话评论）并发执行，同时进行的热点数有上限
+- 每个热点生成完成后立即产出，不等待其余热点
+"""
+import time
+import asyncio
+from fastapi_project.settings import settings
+from fastapi_project.util import db_util
+from fastapi_project.util.db_util import get_docs_from_summaryindex
+from fastapi_project.util.llm_gateway import get_llm_gateway
+#最新一个爬虫批次的文章，近似重复的文章在入库时已合并
+from fastapi_project.util.crawl_batch import LATEST_BATCH_NEWS_QUERY
+
+
+def group_news(rows):
+    """把baidu_news的行按热点归类，返回[{'title','abstract','keywords','context'}]"""
+    import pandas as pd
+    if not rows:
+        return []
+    df = pd.DataFrame(rows)
+    news_list = []
+    for name,group in df.groupby(by=[1]):
+        context = ''
+        for cont in group.iloc[:,3]:
+            context +='报道：\n\n'+ cont + '\n'+'------------------------------------\n'
+        news_list.append({
+            'title': group.iloc[0][1],
+            'abstract': group.iloc[0][9],
+            'keywords': group.iloc[0][10],
+            'context': context
+        })
+    return news_list
+
+async def aload_latest_news():
+    rows = await db_util.aexecute_query(LATEST_BATCH_NEWS_QUERY)
+    return group_news(rows)
+
+def retrieve_ref_resource(news_sum_index, keywords):
+    """检索和热点主题相符的文章，选择text最长的一篇作为仿写的目标文本"""
+    query = f"""
+        用户希望查询的主题是：{keywords},
+        哪些文档的主题和用户查询的主题相符合？
+        """
+    ref_docs = get_docs_from_summaryindex(news_sum_index,query=query,k=3)
+    ref_doc = max(ref_docs, key=lambda x: len(x['text'])) if ref_docs else None
+    return ref_doc['text'] if ref_doc else ''
+
+async def aretrieve_ref_resources(news_sum_index, keywords_list):
+    """所有热点的检索一次性并发完成，结果与keywords_list顺序一致"""
+    start_time = time.time()
+    ref_resources = await asyncio.gather(
+        *(asyncio.to_thread(retrieve_ref_resource, news_sum_index, keywords) for keywords in keywords_list),
+        return_exceptions=True
+    )
+    print(f"检索 {len(keywords_list)} 个热点的参考文章，耗时: {time.time() - start_time:.2f} 秒")
+    return ['' if isinstance(r, Exception) else r for r in ref_resources]
+
+async def agenerate_comment(news, ref_resource):
+    """一个热点的评论链：先生成评论，再概括为一句话评论"""
+    gateway = get_llm_gateway()
+    GET_COMMENTS_PROMPT=f"""
+        任务：你将扮演邹韬奋对时事新闻进行评论。你需要参考时事新闻的相关报道，并模仿目标文本纂写评论。
+        评论的长度和目标文本类似。
+        注意：
+        1.你需要解析目标文本所使用的叙述结构、修辞手法和语言风格，以及重要的态度，并在评论中体现这些特点。
+        2.你需要围绕时事新闻进行评论，而不能超出给定的时事新闻的范围。
+        3.最大限度利用时事新闻的信息。
+        4.你需要尽可能改写目标文本中的描述，以适应对时事新闻的评论。
+        ==============================
+        你参考的时事新闻是：
+        {news['context']}
+        ===============================
+        你需要仿照的目标文本是：
+        {ref_resource}
+        ===============================
+        你的评论：
+        """
+    comments = await gateway.acomplete(GET_COMMENTS_PROMPT)
+    GET_ONE_COMMENT_PROMPT = f"""
+        你将扮演邹韬奋，依据下列评论文本，总结评论内容，形成一句掷地有声的概括性评论。
+        概括性评论需要吸人眼球，具有口语特征，不要使用书面语的特殊用法。不超过20个字，仅返回概括性评论内容，不需要附加其余的解释，不要含有双引号，不要含有冒号。
+        评论文本是：
+        {comments}
+        你的评论：
+        """
+    one_comment = await gateway.acomplete(GET_ONE_COMMENT_PROMPT)
+    return {
+        'title': news['title'],
+        'one_comment': one_comment,
+        'abstract': news['abstract'],
+        'comments': comments,
+        'keywords': news['keywords'],
+        'ref_resource': ref_resource
+    }
+
+async def agenerate_comment_stream(news_list, ref_resources, workers=None):
+    """
+    各热点的评论链并发执行，按完成顺序逐个产出
+
+    Yields:
+        dict: {'index': 热点在news_list中的位置, 'news': 评论结果} 或 {'index', 'error'}
+    """
+    semaphore = asyncio.Semaphore(workers or settings.COMMENT_WORKERS)
+
+    async def run(index, news, ref_resource):
+        async with semaphore:
+            try:
+                return {'index': index, 'news': await agenerate_comment(news, ref_resource)}
+            except Exception as e:
+                print(f"热点“{news['title']}”评论生成失败: {e}")
+                return {'index': index, 'error': str(e)}
+
+    tasks = [asyncio.create_task(run(i, news, ref)) for i, (news, ref) in enumerate(zip(news_list, ref_resources))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 调用方提前退出时取消尚未完成的热点
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,70 @@
+"""
+爬虫批次：每次入库创建一条crawl_batches记录，本次插入和更新的baidu_news行都写入该批次的batch_id
+- 最新一批热点 = 最新一个已完成批次的文章，按(batch_id, hottopic)索引直接读取，不再扫描全表计算MAX(DATE_TRUNC(...))
+- 已有文章在新的批次中再次出现时，batch_id更新为新批次，所以每个批次的文章只在该批次是最新批次时完整
+"""
+import threading
+from fastapi_project.util import db_util
+
+LATEST_BATCH_NEWS_QUERY = """
+SELECT * FROM baidu_news
+WHERE batch_id = (
+    SELECT batch_id FROM crawl_batches WHERE finished_at IS NOT NULL ORDER BY batch_id DESC LIMIT 1
+) and content_length > 100
+order by hottopic;
+"""
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema():
+    """创建crawl_batches表、baidu_news的batch_id列和索引；第一次使用时把已有的最新一批文章登记为一个批次"""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with db_util.transaction() as cursor:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_batches (
+                batch_id SERIAL PRIMARY KEY,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                topic_count INTEGER,
+                inserted INTEGER,
+                touched INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_crawl_batches_finished ON crawl_batches (batch_id) WHERE finished_at IS NOT NULL;
+            ALTER TABLE baidu_news ADD COLUMN IF NOT EXISTS batch_id INTEGER;
+            CREATE INDEX IF NOT EXISTS idx_baidu_news_batch_topic ON baidu_news (batch_id, hottopic);
+            """)
+            # 与原来读取最新一批的查询一致：created_at截断到分钟后最大的一组文章
+            cursor.execute("""
+            INSERT INTO crawl_batches (started_at, finished_at)
+            SELECT MAX(DATE_TRUNC('minute', created_at)), MAX(created_at) FROM baidu_news
+            WHERE NOT EXISTS (SELECT 1 FROM crawl_batches)
+            HAVING COUNT(*) > 0
+            RETURNING batch_id, started_at
+            """)
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.execute("""
+                UPDATE baidu_news SET batch_id = %s WHERE DATE_TRUNC('minute', created_at) = %s
+                """, row)
+                print(f"已有的最新一批文章登记为批次 {row[0]}，共 {cursor.rowcount} 篇")
+        _schema_ready = True
+
+
+def start_batch(started_at):
+    ensure_schema()
+    with db_util.transaction() as cursor:
+        cursor.execute("INSERT INTO crawl_batches (started_at) VALUES (%s) RETURNING batch_id", (started_at,))
+        return cursor.fetchone()[0]
+
+
+def finish_batch(batch_id, topic_count, inserted, touched):
+    """批次写入完成后才标记finished_at，读取最新一批时不会读到写了一半的批次"""
+    db_util.execute_query("""
+    UPDATE crawl_batches SET finished_at = CURRENT_TIMESTAMP, topic_count = %s, inserted = %s, touched = %s
+    WHERE batch_id = %s
+    """, (topic_count, inserted, touched, batch_id))
@@ -0,0 +1,270 @@
+"""
+爬虫引擎：可复用的无头浏览器池 + 共享任务队列 + 按域名限速
+"""
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (WebDriverException, TimeoutException,
+                                        InvalidSessionIdException, NoSuchWindowException)
+from fastapi_project.settings import settings
+
+
+def create_chrome_driver():
+    """按get_baidu_hot_news原有的优化配置创建无头Chrome"""
+    options = webdriver.ChromeOptions()
+    # 基础性能优化选项
+    options.add_argument('--headless') #不需要界面
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-web-security')
+    options.add_argument('--disable-features=VizDisplayCompositor')
+    # 网络和更新相关优化
+    options.add_argument('--disable-background-networking')
+    options.add_argument('--disable-background-timer-throttling')
+    options.add_argument('--disable-backgrounding-occluded-windows')
+    options.add_argument('--disable-component-update')
+    options.add_argument('--disable-default-apps')
+    options.add_argument('--disable-extensions')
+    # 日志和崩溃报告优化
+    options.add_argument('--disable-logging')
+    options.add_argument('--disable-crash-reporter')
+    options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+    # 页面DOM就绪即返回，不等待所有图片等资源，之后用显式等待判断需要的元素
+    options.page_load_strategy = 'eager'
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(settings.CRAWLER_PAGE_TIMEOUT * 3)
+    return driver
+
+
+def wait_for_page(driver, css=None, timeout=None):
+    """
+    显式等待页面就绪，代替固定的time.sleep
+
+    Args:
+        css: 需要出现的元素选择器，None时只等待document.readyState
+        timeout: 最长等待秒数
+
+    Returns:
+        bool: 是否在超时前满足条件
+    """
+    timeout = timeout or settings.CRAWLER_PAGE_TIMEOUT
+    try:
+        wait = WebDriverWait(driver, timeout, poll_frequency=0.2)
+        wait.until(lambda d: d.execute_script("return document.readyState") in ("interactive", "complete"))
+        if css:
+            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, css)))
+        return True
+    except Exception:
+        return False
+
+
+#浏览器失效时错误信息中会出现的内容
+_BROKEN_DRIVER_MESSAGES = ('invalid session id', 'session deleted', 'chrome not reachable', 'disconnected',
+                           'no such window', 'target window already closed', 'tab crashed')
+
+def is_driver_broken(error):
+    """判断异常是否说明浏览器本身已经失效（崩溃、会话丢失、连接断开），此时应丢弃浏览器而不是继续使用"""
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, ConnectionError)):
+        return True
+    if isinstance(error, WebDriverException) and not isinstance(error, TimeoutException):
+        message = str(error).lower()
+        return any(text in message for text in _BROKEN_DRIVER_MESSAGES)
+    return False
+
+
+class DomainRateLimiter:
+    """按域名限制请求：同一域名两次请求的最小间隔，以及同时进行的最大请求数"""
+
+    def __init__(self, min_interval=1.0, max_concurrency=2):
+        self.min_interval = min_interval
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._next_time = {}
+        self._semaphores = {}
+
+    def _semaphore(self, domain):
+        with self._lock:
+            if domain not in self._semaphores:
+                self._semaphores[domain] = threading.BoundedSemaphore(self.max_concurrency)
+            return self._semaphores[domain]
+
+    @contextmanager
+    def limit(self, url):
+        domain = urlparse(url).netloc
+        semaphore = self._semaphore(domain)
+        with semaphore:
+            # 预约该域名下一次可请求的时间点，需要时等待
+            with self._lock:
+                now = time.time()
+                start_at = max(now, self._next_time.get(domain, 0))
+                self._next_time[domain] = start_at + self.min_interval
+            if start_at > now:
+                time.sleep(start_at - now)
+            yield
+
+
+class BrowserPool:
+    """固定数量的浏览器实例，按需创建，用完归还复用"""
+
+    def __init__(self, size=None, driver_factory=create_chrome_driver):
+        self.size = size or settings.CRAWLER_WORKERS
+        self.driver_factory = driver_factory
+        self._idle = queue.Queue()
+        self._created = 0
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """取一个空闲的浏览器，没有空闲且未达到上限时创建；已达上限时等待归还，期间有浏览器被丢弃则改为创建"""
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    start_time = time.time()
+                    driver = self.driver_factory()
+                    print(f"✅ 浏览器启动完成，耗时: {time.time() - start_time:.2f} 秒")
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self._all.append(driver)
+                return driver
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+    def _discard(self, driver):
+        """关闭出错的浏览器并从池中移除，腾出的名额可以重新创建"""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            if driver in self._all:
+                self._all.remove(driver)
+                self._created -= 1
+
+    @contextmanager
+    def acquire(self):
+        driver = self._take()
+        try:
+            yield driver
+        except BaseException:
+            # 使用过程中抛出异常的浏览器可能已经失效，不再归还
+            self._discard(driver)
+            raise
+        self._idle.put(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = self._all, []
+            self._created = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self._idle = queue.Queue()
+        print(f"🚪 已关闭 {len(drivers)} 个浏览器")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CrawlerEngine:
+    """
+    用浏览器池并发执行爬取任务
+    所有任务放入同一个队列，N个工作线程各自借用一个浏览器依次取任务执行；
+    浏览器失效时丢弃该浏览器，换一个新的浏览器重试当前任务，最多重试MAX_DRIVER_RETRIES次
+    """
+    MAX_DRIVER_RETRIES = 2
+
+    def __init__(self, pool=None, limiter=None, workers=None):
+        self.pool = pool or BrowserPool()
+        self.limiter = limiter or DomainRateLimiter(settings.CRAWLER_DOMAIN_INTERVAL,
+                                                    settings.CRAWLER_DOMAIN_CONCURRENCY)
+        self.workers = workers or self.pool.size
+
+    def get(self, driver, url, css=None, timeout=None):
+        """遵守域名限速打开页面，并显式等待页面就绪"""
+        with self.limiter.limit(url):
+            driver.get(url)
+        return wait_for_page(driver, css=css, timeout=timeout)
+
+    def map(self, func, items):
+        """
+        对每个item执行func(engine, driver, item)，结果按items的顺序返回，
+        单个任务出错时结果为None
+        """
+        items = list(items)
+        if not items:
+            return []
+        work_queue = queue.Queue()
+        for index, item in enumerate(items):
+            work_queue.put((index, item, 0))
+        results = [None] * len(items)
+
+        def worker():
+            while not work_queue.empty():
+                driver_broken = False
+                try:
+                    with self.pool.acquire() as driver:
+                        while True:
+                            try:
+                                index, item, attempt = work_queue.get_nowait()
+                            except queue.Empty:
+                                return
+                            try:
+                                results[index] = func(self, driver, item)
+                            except Exception as e:
+                                if not is_driver_broken(e):
+                                    print(f"爬取任务出错 {item}: {e}")
+                                    continue
+                                # 浏览器已失效：任务放回队列，异常抛出acquire让浏览器池丢弃该浏览器
+                                if attempt < self.MAX_DRIVER_RETRIES:
+                                    work_queue.put((index, item, attempt + 1))
+                                else:
+                                    print(f"爬取任务出错 {item}: {e}")
+                                driver_broken = True
+                                raise
+                except Exception as e:
+                    if driver_broken:
+                        print(f"⚠️ 浏览器已失效，换一个浏览器继续: {e}")
+                        continue
+                    # 浏览器启动失败时，剩余任务由其他工作线程继续处理
+                    print(f"❌ 无法创建WebDriver: {e}")
+                    return
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as executor:
+            for future in [executor.submit(worker) for _ in range(min(self.workers, len(items)))]:
+                future.result()
+        return results
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
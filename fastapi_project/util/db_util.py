@@ -1,11 +1,17 @@
 import psycopg2
 from psycopg2 import Error
+from psycopg2 import pool as pg_pool
 import re 
 import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
 import chromadb
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, DocumentSummaryIndex
 from llama_index.core import PromptTemplate, get_response_synthesizer, load_index_from_storage
-from llama_index.core import Document, StorageContext
+from llama_index.core import Document, StorageContext, QueryBundle
+from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, FilterOperator
 from llama_index.core.settings import Settings
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
@@ -13,17 +19,18 @@ from llama_index.llms.deepseek import DeepSeek
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.response_synthesizers import ResponseMode
 from fastapi_project.util.chat_util import initialize_llamaindex
+from fastapi_project.util.vector_store import load_vector_store
 from fastapi_project.settings import settings
 
-##获取连接对象
+##获取连接对象（单独的连接，不经过连接池）
 def connect_to_postgres():
     try:
         # 连接到PostgreSQL数据库
         connection = psycopg2.connect(
             user=settings.USERS,
             password=settings.PASSWORD,
-            host="localhost",
-            port="5432",
+            host=settings.DB_HOST,
+            port=settings.DB_PORT,
             database=settings.DATABASE
         )
         return connection
@@ -31,44 +38,170 @@ def connect_to_postgres():
         print(f"连接数据库时出错: {e}")
         return None
 
+##进程级连接池，第一次使用时创建
+_pool = None
+_pool_lock = threading.Lock()
+#ThreadedConnectionPool在连接耗尽时直接报错，用信号量让调用方排队等待
+_pool_semaphore = None
+#记录每个连接最后一次归还的时间，用于判断是否需要健康检查
+_last_used = {}
+
+def get_pool():
+    global _pool, _pool_semaphore
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pg_pool.ThreadedConnectionPool(
+                    settings.DB_POOL_MIN,
+                    settings.DB_POOL_MAX,
+                    user=settings.USERS,
+                    password=settings.PASSWORD,
+                    host=settings.DB_HOST,
+                    port=settings.DB_PORT,
+                    database=settings.DATABASE
+                )
+                _pool_semaphore = threading.BoundedSemaphore(settings.DB_POOL_MAX)
+                print(f"数据库连接池已创建: min={settings.DB_POOL_MIN}, max={settings.DB_POOL_MAX}")
+    return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+            print("数据库连接池已关闭")
+
+def _is_healthy(connection):
+    """连接空闲时间较长时执行SELECT 1确认连接可用"""
+    if connection.closed:
+        return False
+    last_used = _last_used.get(id(connection))
+    if last_used is not None and time.time() - last_used < settings.DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except Error:
+        return False
+
+@contextmanager
+def get_connection():
+    """从连接池借出一个连接，用完自动归还"""
+    pool = get_pool()
+    _pool_semaphore.acquire()
+    connection = None
+    try:
+        connection = pool.getconn()
+        if not _is_healthy(connection):
+            print("连接已失效，重新建立连接")
+            _last_used.pop(id(connection), None)
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+        yield connection
+    finally:
+        if connection is not None:
+            broken = bool(connection.closed)
+            if broken:
+                _last_used.pop(id(connection), None)
+            else:
+                _last_used[id(connection)] = time.time()
+            pool.putconn(connection, close=broken)
+        _pool_semaphore.release()
+
+@contextmanager
+def transaction():
+    """
+    事务范围：正常结束时提交，出现异常时回滚
+
+    用法：
+        with transaction() as cursor:
+            cursor.execute(...)
+    """
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            yield cursor
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
 #执行查询
 def execute_query(query, params=None):
     try:
-        connection = connect_to_postgres()
-        if connection is None:
-            return
-        
-        cursor = connection.cursor()
-        
-        # 执行查询
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-            
-        # 如果是SELECT查询，获取结果
-        if query.strip().upper().startswith('SELECT'):
-            results = cursor.fetchall()
-            # 获取列名
-            column_names = [desc[0] for desc in cursor.description] if cursor.description else []
-            # print("列名:", column_names)
-            # print("查询结果:", results)
-            return results
-        else:
-            # 对于INSERT、UPDATE、DELETE操作，获取受影响的行数
-            affected_rows = cursor.rowcount
-            print(f"操作影响的行数: {affected_rows}")
-            
-        # 提交事务
-        connection.commit()
-        
+        with transaction() as cursor:
+            # 执行查询
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+                
+            # 如果是SELECT查询，获取结果
+            if query.strip().upper().startswith('SELECT'):
+                results = cursor.fetchall()
+                return results
+            else:
+                # 对于INSERT、UPDATE、DELETE操作，获取受影响的行数
+                affected_rows = cursor.rowcount
+                print(f"操作影响的行数: {affected_rows}")
     except Error as e:
         print(f"执行查询时出错: {e}")
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
-            print("数据库连接已关闭")
+
+#execute_query的异步版本，在线程中使用同一个连接池，供async接口调用
+async def aexecute_query(query, params=None):
+    return await asyncio.to_thread(execute_query, query, params)
+
+#批量写入，每个批次使用一个事务，通过execute_values一次发送多行
+def bulk_insert(table, columns, rows, batch_size=None, on_conflict=None):
+    """
+    批量插入数据
+
+    Args:
+        table: 表名
+        columns: 列名列表
+        rows: 待插入的行（元组列表），列数不符的行会被跳过
+        batch_size: 每批行数，默认使用settings.BULK_BATCH_SIZE
+        on_conflict: 冲突处理子句，例如 "ON CONFLICT (url) DO NOTHING"
+
+    Returns:
+        dict: {'inserted': 插入行数, 'skipped': 跳过行数, 'failed_rows': 写入失败的行, 'elapsed': 耗时(秒)}
+    """
+    from psycopg2.extras import execute_values
+    batch_size = batch_size or settings.BULK_BATCH_SIZE
+    start_time = time.time()
+    valid_rows = [tuple(row) for row in rows if row is not None and len(row) == len(columns)]
+    stats = {'inserted': 0, 'skipped': len(rows) - len(valid_rows), 'failed_rows': []}
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {on_conflict or ''} RETURNING 1"
+
+    def insert(batch):
+        try:
+            with transaction() as cursor:
+                # RETURNING 1 用于统计实际写入的行数（ON CONFLICT DO NOTHING 的行不会返回）
+                returned = execute_values(cursor, insert_sql, batch, page_size=len(batch), fetch=True)
+            stats['inserted'] += len(returned)
+            stats['skipped'] += len(batch) - len(returned)
+        except Error as e:
+            if len(batch) == 1:
+                print(f"{table} 写入失败，跳过该行: {e}")
+                stats['skipped'] += 1
+                stats['failed_rows'].append(batch[0])
+                return
+            # 批次回滚后对半拆分重试，只有出错的行被跳过
+            middle = len(batch) // 2
+            insert(batch[:middle])
+            insert(batch[middle:])
+
+    for i in range(0, len(valid_rows), batch_size):
+        insert(valid_rows[i:i + batch_size])
+    stats['elapsed'] = round(time.time() - start_time, 3)
+    print(f"{table} 批量写入完成: 插入 {stats['inserted']} 行，跳过 {stats['skipped']} 行，耗时 {stats['elapsed']} 秒")
+    return stats
 
 #创建article表
 def create_article_table():
@@ -93,7 +226,8 @@ CREATE TABLE IF NOT EXISTS message (
     session_id TEXT,
     history TEXT,
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    abstract TEXT DEFAULT '这是摘要'
+    abstract TEXT DEFAULT '这是摘要',
+    summary TEXT
 );"""
     execute_query(query)
     return None
@@ -101,39 +235,32 @@ CREATE TABLE IF NOT EXISTS message (
 #创建baidu_news表
 
 
-##将指定文件夹中的文件写入pgsql的article表
-def write_to_article(txt_dir):
+##将指定文件夹中的文件批量写入pgsql的article表
+def write_to_article(txt_dir, batch_size=None):
     import os
     from datetime import datetime
 
     # 获取txt_split_file目录下所有txt文件
     txt_files = [f for f in os.listdir(txt_dir) if f.endswith('.txt')]
 
+    rows = []
     for txt_file in txt_files:
         # 构建完整的文件路径
         file_path = os.path.join(txt_dir, txt_file)
         
         # 读取文件内容
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 准备SQL插入语句
-        insert_query = """
-        INSERT INTO article (title, body, tags, updated_at)
-        VALUES (%s, %s, %s, %s)
-        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"读取文件 {txt_file} 失败，跳过: {e}")
+            rows.append(None)
+            continue
         
-        # 准备参数
-        params = (
-            txt_file,  # title
-            content,   # body
-            [],        # tags (空数组)
-            datetime.now()  # updated_at
-        )
-        
-        # 执行插入
-        execute_query(insert_query, params)
-    return None
+        # title, body, tags (空数组), updated_at
+        rows.append((txt_file, content, [], datetime.now()))
+    
+    return bulk_insert('article', ['title', 'body', 'tags', 'updated_at'], rows, batch_size=batch_size)
 
 ##随机生成三条message信息到postgresql数据库的message表
 import uuid
@@ -222,7 +349,7 @@ def generate_simple_index(documents):
     index = VectorStoreIndex(nodes)
     return index
 
-##根据用户提问，使用摘要索引获得相关文档
+##根据用户提问，使用摘要索引获得相关文档，query可以是字符串或已带向量的QueryBundle
 def get_docs_from_summaryindex(doc_sum_index, query, k=3):
     retriever = doc_sum_index.as_retriever(similarity_top_k=k)
     retrieved_nodes = retriever.retrieve(query)
@@ -278,29 +405,73 @@ def save_indexes(index,doc_sum_index):
 def save_news_indexes(doc_sum_index):
     doc_sum_index.storage_context.persist("fastapi_project\\store\\news_summaryindex")
 
-##加载两个index
-def load_indexes():
-    llm, embed_model = initialize_llamaindex(deepseekapi=settings.DEEPSEEK_API)
+##从持久化目录加载单个index，使用全局Settings中已初始化的模型，向量库后端由VECTOR_BACKEND决定
+def load_index(persist_dir):
+    storage_context = StorageContext.from_defaults(persist_dir=persist_dir, vector_store=load_vector_store(persist_dir))
+    return load_index_from_storage(storage_context)
+
+##加载两个index，init_models=False时不重复初始化模型
+def load_indexes(init_models=True):
+    if init_models:
+        llm, embed_model = initialize_llamaindex(deepseekapi=settings.DEEPSEEK_API)
     # 加载VectorStoreIndex
-    storage_context = StorageContext.from_defaults(persist_dir=os.path.join("fastapi_project", "store", "simpleindex"))
-    loaded_simpleindex = load_index_from_storage(storage_context)
+    loaded_simpleindex = load_index(os.path.join("fastapi_project", "store", "simpleindex"))
 
     # 加载DocumentSummaryIndex
-    storage_context = StorageContext.from_defaults(persist_dir=os.path.join("fastapi_project", "store", "summaryindex"))
-    loaded_doc_sum_index = load_index_from_storage(storage_context)
+    loaded_doc_sum_index = load_index(os.path.join("fastapi_project", "store", "summaryindex"))
     return loaded_simpleindex,loaded_doc_sum_index
 
+##两级检索：用户提问只做一次向量化，先用摘要索引选出文档，再只在这些文档的段落中检索
+def retrieve_scored_nodes(loaded_simpleindex, loaded_doc_sum_index, user_query,
+                          doc_k=None, chunk_k=None, min_chunks=None):
+    """
+    Args:
+        doc_k: 摘要索引选出的文档数
+        chunk_k: 在选中文档中检索的段落数
+        min_chunks: 至少返回的段落数，选中文档中的段落不足时，从全部段落的检索结果中按相似度补足
+    Returns:
+        list: [{'node_id', 'doc_id', 'text', 'score'}]，选中文档中的段落在前，各自按相似度从高到低
+    """
+    doc_k = doc_k or settings.VECTOR_DOC_TOP_K
+    chunk_k = chunk_k or settings.VECTOR_CHUNK_TOP_K
+    min_chunks = settings.VECTOR_MIN_CHUNKS if min_chunks is None else min_chunks
+    # 两个检索器共用同一个带向量的QueryBundle，不会再各自调用嵌入模型
+    query_bundle = QueryBundle(query_str=user_query, embedding=Settings.embed_model.get_query_embedding(user_query))
+    selected_doc_ids = [r['ref_doc_id'] for r in get_docs_from_summaryindex(loaded_doc_sum_index, query_bundle, k=doc_k)]
+
+    retrieved = []
+    if selected_doc_ids:
+        filters = MetadataFilters(filters=[
+            MetadataFilter(key='original_doc_id', value=selected_doc_ids, operator=FilterOperator.IN)
+        ])
+        try:
+            retrieved = loaded_simpleindex.as_retriever(similarity_top_k=chunk_k, filters=filters).retrieve(query_bundle)
+        except (NotImplementedError, ValueError) as e:
+            # 向量库不支持该过滤条件时，退回到检索全部段落后按文档过滤
+            print(f"段落检索不支持按文档过滤，改为检索后过滤: {e}")
+            retrieved = [n for n in loaded_simpleindex.as_retriever(similarity_top_k=chunk_k * doc_k).retrieve(query_bundle)
+                         if n.node.metadata.get('original_doc_id') in selected_doc_ids][:chunk_k]
+
+    if len(retrieved) < min_chunks:
+        seen = {n.node.node_id for n in retrieved}
+        for n in loaded_simpleindex.as_retriever(similarity_top_k=min_chunks + len(seen)).retrieve(query_bundle):
+            if len(retrieved) >= min_chunks:
+                break
+            if n.node.node_id not in seen:
+                seen.add(n.node.node_id)
+                retrieved.append(n)
+
+    return [{
+        'node_id': n.node.node_id,
+        'doc_id': n.node.metadata.get('original_doc_id'),
+        'text': n.node.text,
+        'score': n.score if n.score is not None else 0.0
+    } for n in retrieved]
+
 # 创建检索器，检索器只能检索信息，不需要进一步创建搜索或对话引擎
 def get_final_nodes_text(loaded_simpleindex,loaded_doc_sum_index,user_query):
-    res = get_docs_from_summaryindex(loaded_doc_sum_index,query=user_query)
-    selected_doc_ids = [r['ref_doc_id'] for r in res]
-    retriever = loaded_simpleindex.as_retriever(similarity_top_k=5)
-    retrieved_docs = retriever.retrieve(user_query)
-    res_text = ''
-    for nodeWithScore in retrieved_docs:
-        if nodeWithScore.node.metadata['original_doc_id'] in selected_doc_ids:
-            res_text += nodeWithScore.node.text + '\n\n'
-    return res_text
+    nodes = retrieve_scored_nodes(loaded_simpleindex, loaded_doc_sum_index, user_query)
+    return ''.join(node['text'] + '\n\n' for node in nodes)
 
 if __name__=="__main__":
     # print(settings.DEEPSEEK_API)
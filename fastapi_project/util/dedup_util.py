@@ -0,0 +1,241 @@
+"""
+百度热点新闻去重：URL指纹 + 内容SimHash
+- URL指纹：规范化url（去掉#片段和utm_*等跟踪参数，参数排序）后取md5
+- 内容指纹：正文按字符3-gram计算64位SimHash，汉明距离不超过阈值视为近似重复
+- 最近抓取过的url不再重新抓取，直接复用库中的文章；更早抓取过的url通过条件请求重新验证
+- 入库时url已存在或与已有文章近似重复的，不插入新行，只把已有文章标记为本次抓取看到（更新last_seen_at和所属热点）
+- ingest只做判断，写入提交后再用record记录指纹；写入失败的文章下次抓取时仍作为新文章处理
+"""
+import time
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from fastapi_project.settings import settings
+from fastapi_project.util import db_util
+
+_TRACKING_PARAMS = ('utm_', 'spm')
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith(_TRACKING_PARAMS))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+def url_fingerprint(url):
+    return hashlib.md5(normalize_url(url).encode('utf-8')).hexdigest()
+
+def simhash(text, ngram=3):
+    """正文的64位SimHash，返回有符号整数（与postgres的BIGINT一致）"""
+    import numpy as np
+    text = ''.join((text or '').split())
+    shingles = Counter(text[i:i + ngram] for i in range(max(1, len(text) - ngram + 1)))
+    digests = b''.join(hashlib.md5(shingle.encode('utf-8')).digest()[:8] for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    counts = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    # 每一位上：shingle该位为1时加上出现次数，为0时减去
+    weights = counts @ (bits.astype(np.int64) * 2 - 1)
+    return int(np.packbits(weights > 0).view('>i8')[0])
+
+def hamming_distances(hashes, hash_value):
+    """hashes（有符号64位整数数组）中每个值与hash_value的汉明距离"""
+    import numpy as np
+    xor = np.asarray(hashes, dtype=np.int64) ^ np.int64(hash_value)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class NewsDedupStore:
+    """
+    baidu_news的去重索引：在baidu_news上增加url_fp、simhash、last_seen_at三列
+    最近window_days天内文章的指纹加载到内存中，近似重复查找为向量化的汉明距离计算
+    """
+
+    def __init__(self, window_days=None, url_ttl=None, max_distance=None):
+        self.window_days = window_days or settings.DEDUP_WINDOW_DAYS
+        self.url_ttl = settings.DEDUP_URL_TTL if url_ttl is None else url_ttl
+        self.max_distance = settings.DEDUP_SIMHASH_DISTANCE if max_distance is None else max_distance
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_seen = {}  # url_fp -> last_seen_at
+        self._fps = []
+        self._hashes = []
+
+    def _ensure_schema(self):
+        with db_util.transaction() as cursor:
+            cursor.execute("""
+            ALTER TABLE baidu_news ADD COLUMN IF NOT EXISTS url_fp TEXT;
+            ALTER TABLE baidu_news ADD COLUMN IF NOT EXISTS simhash BIGINT;
+            ALTER TABLE baidu_news ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+            UPDATE baidu_news SET last_seen_at = created_at WHERE last_seen_at IS NULL;
+            ALTER TABLE baidu_news ALTER COLUMN last_seen_at SET DEFAULT CURRENT_TIMESTAMP;
+            CREATE INDEX IF NOT EXISTS idx_baidu_news_url_fp ON baidu_news (url_fp);
+            CREATE INDEX IF NOT EXISTS idx_baidu_news_last_seen_at ON baidu_news (last_seen_at);
+            """)
+            # 补齐窗口期内旧文章的指纹
+            cursor.execute("""
+            SELECT DISTINCT ON (url) url, content_text FROM baidu_news
+            WHERE url_fp IS NULL AND url IS NOT NULL AND url <> '' AND last_seen_at > %s
+            """, (datetime.now() - timedelta(days=self.window_days),))
+            missing = cursor.fetchall()
+            if missing:
+                from psycopg2.extras import execute_values
+                execute_values(cursor, """
+                UPDATE baidu_news SET url_fp = v.url_fp, simhash = v.simhash
+                FROM (VALUES %s) AS v(url, url_fp, simhash)
+                WHERE baidu_news.url = v.url AND baidu_news.url_fp IS NULL
+                """, [(url, url_fingerprint(url), simhash(text)) for url, text in missing])
+                print(f"补齐 {len(missing)} 个旧文章的指纹")
+
+    def load(self):
+        """第一次使用时建列并加载窗口期内的指纹"""
+        with self._lock:
+            if self._loaded:
+                return self
+            start_time = time.time()
+            self._ensure_schema()
+            rows = db_util.execute_query("""
+            SELECT url_fp, MAX(simhash), MAX(last_seen_at) FROM baidu_news
+            WHERE url_fp IS NOT NULL AND last_seen_at > %s GROUP BY url_fp
+            """, (datetime.now() - timedelta(days=self.window_days),)) or []
+            for url_fp, hash_value, last_seen_at in rows:
+                self._last_seen[url_fp] = last_seen_at
+                if hash_value is not None:
+                    self._fps.append(url_fp)
+                    self._hashes.append(hash_value)
+            self._loaded = True
+            print(f"加载 {len(rows)} 个新闻指纹，耗时: {time.time() - start_time:.2f} 秒")
+            return self
+
+    def classify(self, urls):
+        """
+        按url是否抓取过分类
+
+        Returns:
+            (fresh, stale): fresh为url_ttl秒内抓取过、本次不需要抓取的url；stale为更早抓取过、需要重新验证的url
+        """
+        self.load()
+        fresh_after = datetime.now() - timedelta(seconds=self.url_ttl)
+        fresh, stale = [], []
+        with self._lock:
+            for url in urls:
+                last_seen = self._last_seen.get(url_fingerprint(url))
+                if last_seen is None:
+                    continue
+                (fresh if last_seen > fresh_after else stale).append(url)
+        return fresh, stale
+
+    def load_articles(self, urls):
+        """从库中读取已抓取的文章，返回{url: (页面标题、文本、作者、网址、链接、日期、长度)}"""
+        if not urls:
+            return {}
+        fps = {url_fingerprint(url): url for url in urls}
+        rows = db_util.execute_query("""
+        SELECT DISTINCT ON (url_fp) url_fp, page_title, content_text, author, site, url, update_time, content_length
+        FROM baidu_news WHERE url_fp = ANY(%s) ORDER BY url_fp, last_seen_at DESC
+        """, (list(fps),)) or []
+        return {fps[row[0]]: (row[1], row[2], row[3], row[4], row[5], str(row[6]) if row[6] else '', row[7])
+                for row in rows}
+
+    def _nearest(self, hash_value, hashes, fps):
+        """返回与hash_value汉明距离不超过max_distance的文章的url_fp"""
+        if len(hashes) == 0:
+            return None
+        distances = hamming_distances(hashes, hash_value)
+        best = int(distances.argmin())
+        return fps[best] if distances[best] <= self.max_distance else None
+
+    def ingest(self, articles, seen_at):
+        """
+        入库前去重
+
+        Args:
+            articles: [(url, content_text)]
+            seen_at: 本次抓取的时间
+        Returns:
+            list: 与articles一一对应，元素为(action, url_fp, simhash, fp)，
+                  action为'insert'（新文章）或'touch'（已有文章，url_fp为已有文章的指纹），fp为文章自身的指纹；
+                  url相同的文章simhash为None
+        """
+        import numpy as np
+        self.load()
+        decisions = []
+        with self._lock:
+            # 已有指纹只转换一次数组，本批新文章单独比较
+            known_hashes, known_fps = np.asarray(self._hashes, dtype=np.int64), list(self._fps)
+            batch_hashes, batch_fps = [], []
+            for url, content_text in articles:
+                # 没有url的文章用正文的md5作为指纹
+                fp = url_fingerprint(url) if url else hashlib.md5((content_text or '').encode('utf-8')).hexdigest()
+                if fp in self._last_seen or fp in batch_fps:
+                    decisions.append(('touch', fp, None, fp))
+                    continue
+                hash_value = simhash(content_text)
+                duplicate_fp = (self._nearest(hash_value, known_hashes, known_fps)
+                                or self._nearest(hash_value, batch_hashes, batch_fps))
+                if duplicate_fp is not None:
+                    decisions.append(('touch', duplicate_fp, hash_value, fp))
+                    continue
+                decisions.append(('insert', fp, hash_value, fp))
+                batch_fps.append(fp)
+                batch_hashes.append(hash_value)
+        return decisions
+
+    def record(self, inserted, touched, seen_at):
+        """
+        写入提交后记录指纹
+
+        Args:
+            inserted: 已插入的文章[(url_fp, simhash)]
+            touched: 已更新的文章的url_fp
+        """
+        with self._lock:
+            for fp, hash_value in inserted:
+                if fp not in self._last_seen and hash_value is not None:
+                    self._fps.append(fp)
+                    self._hashes.append(hash_value)
+                self._last_seen[fp] = seen_at
+            for fp in touched:
+                self._last_seen[fp] = seen_at
+
+    def touch(self, rows, seen_at, batch_id=None):
+        """
+        把已有文章标记为本次抓取看到，并更新为本次的批次、热点和总结
+
+        Args:
+            rows: [(url_fp, hottopic, absrtact, keywords)]
+        Returns:
+            list: 被更新的url_fp（不重复）；库中已不存在的文章不在其中
+        """
+        if not rows:
+            return []
+        from psycopg2.extras import execute_values
+        # 旧数据中同一个url可能有多行，每个url_fp只更新最近看到的一行，其余的行保持不变
+        with db_util.transaction() as cursor:
+            updated = execute_values(cursor, """
+            WITH v(url_fp, hottopic, absrtact, keywords, seen_at, batch_id) AS (VALUES %s),
+            target AS (
+                SELECT DISTINCT ON (b.url_fp) b.ctid AS row_ctid, v.*
+                FROM baidu_news b JOIN v ON b.url_fp = v.url_fp
+                ORDER BY b.url_fp, b.last_seen_at DESC NULLS LAST
+            )
+            UPDATE baidu_news SET last_seen_at = target.seen_at::timestamp, batch_id = target.batch_id::integer,
+                hottopic = target.hottopic, absrtact = target.absrtact, keywords = target.keywords
+            FROM target
+            WHERE baidu_news.ctid = target.row_ctid
+            RETURNING baidu_news.url_fp
+            """, [row + (seen_at, batch_id) for row in rows], page_size=len(rows), fetch=True)
+        return list(dict.fromkeys(row[0] for row in updated))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_dedup_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = NewsDedupStore()
+    return _store
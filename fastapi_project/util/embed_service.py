@@ -0,0 +1,217 @@
+"""
+查询向量化服务：并发请求的查询合并成批，在专用线程中一次前向计算，最近查询的向量保存在LRU缓存中
+- 请求线程提交查询后等待结果；工作线程取到第一个查询后，再等待最多EMBED_BATCH_WINDOW秒收集后续查询，
+  凑满EMBED_MAX_BATCH_SIZE或窗口结束时整批计算，同一批中相同的查询只计算一次
+- 关键词缓存的语义查找和两级向量检索对同一句话只计算一次向量
+- stats()返回吞吐量、批大小、排队时间和缓存命中情况
+- 作为llama_index的embed_model使用；文档向量化（建索引）直接交给原模型，原模型本身按批计算
+"""
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from fastapi_project.settings import settings
+
+_STOP = object()
+#HuggingFaceEmbedding的_embed不是公开接口，版本变化后不可用时改为逐条计算
+_hf_batch_supported = True
+
+
+def _hf_query_batch(model, queries):
+    """
+    HuggingFaceEmbedding只提供单条查询的公开接口get_query_embedding，
+    其内部调用_embed([query], prompt_name='query')；这里直接按批调用_embed，查询指令与单条查询一致
+    """
+    global _hf_batch_supported
+    if _hf_batch_supported:
+        try:
+            embeddings = model._embed(queries, prompt_name='query')
+            if len(embeddings) == len(queries):
+                return embeddings
+            raise TypeError(f"返回 {len(embeddings)} 个向量，应为 {len(queries)} 个")
+        except (AttributeError, TypeError) as e:
+            _hf_batch_supported = False
+            print(f"HuggingFaceEmbedding不支持按批计算查询向量，改为逐条计算: {e}")
+    return [model.get_query_embedding(q) for q in queries]
+
+def embed_query_batch(model, queries):
+    """一次前向计算一批查询的向量"""
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    if isinstance(model, HuggingFaceEmbedding):
+        return _hf_query_batch(model, queries)
+    batch = getattr(model, 'get_query_embedding_batch', None)
+    if batch is not None:
+        return batch(queries)
+    return [model.get_query_embedding(q) for q in queries]
+
+
+class BatchingEmbedding(BaseEmbedding):
+    """
+    包装已加载的嵌入模型
+
+    Args:
+        model: 原嵌入模型（HuggingFaceEmbedding等）
+        window: 收集一批查询的最长等待时间（秒）
+        max_batch_size: 每批最多的查询数
+        workers: 计算线程数，每个线程独立收集和计算一批
+        cache_size: 缓存的查询向量数，0表示不缓存
+    """
+    _model: Any = PrivateAttr()
+    _window: float = PrivateAttr()
+    _max_batch_size: int = PrivateAttr()
+    _cache_size: int = PrivateAttr()
+    _queue: Any = PrivateAttr()
+    _threads: list = PrivateAttr()
+    _cache: Any = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _metrics: dict = PrivateAttr()
+    _started_at: float = PrivateAttr()
+
+    def __init__(self, model, window=None, max_batch_size=None, workers=None, cache_size=None):
+        super().__init__(model_name=getattr(model, 'model_name', 'unknown'))
+        self._model = model
+        self._window = settings.EMBED_BATCH_WINDOW if window is None else window
+        self._max_batch_size = max_batch_size or settings.EMBED_MAX_BATCH_SIZE
+        self._cache_size = settings.EMBED_CACHE_SIZE if cache_size is None else cache_size
+        self._queue = queue.Queue()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'requests': 0, 'cache_hits': 0, 'batches': 0, 'queued': 0, 'embedded': 0,
+                         'queue_time': 0.0, 'max_queue_time': 0.0, 'compute_time': 0.0}
+        self._started_at = time.time()
+        self._threads = [threading.Thread(target=self._run, name=f'embed-worker-{i}', daemon=True)
+                         for i in range(workers or settings.EMBED_WORKERS)]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def class_name(cls):
+        return "BatchingEmbedding"
+
+    @property
+    def model(self):
+        return self._model
+
+    def _cache_get(self, text):
+        with self._lock:
+            self._metrics['requests'] += 1
+            embedding = self._cache.get(text)
+            if embedding is not None:
+                self._cache.move_to_end(text)
+                self._metrics['cache_hits'] += 1
+            return embedding
+
+    def _cache_put(self, embeddings):
+        if self._cache_size <= 0:
+            return
+        with self._lock:
+            for text, embedding in embeddings.items():
+                self._cache[text] = embedding
+                self._cache.move_to_end(text)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _collect(self, first):
+        """从第一个查询开始，在窗口内收集一批；收到停止信号时返回(batch, True)"""
+        batch = [first]
+        deadline = time.perf_counter() + self._window
+        while len(batch) < self._max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stop = self._collect(first)
+            start_time = time.perf_counter()
+            # 调用方已取消（例如超时）的查询不再计算
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                embeddings = dict(zip(texts, embed_query_batch(self._model, texts)))
+            except Exception as e:
+                print(f"查询向量化失败: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for text, future, _ in batch:
+                future.set_result(embeddings[text])
+            self._cache_put(embeddings)
+            queue_times = [start_time - enqueued_at for _, _, enqueued_at in batch]
+            with self._lock:
+                self._metrics['batches'] += 1
+                self._metrics['queued'] += len(batch)
+                self._metrics['embedded'] += len(texts)
+                self._metrics['queue_time'] += sum(queue_times)
+                self._metrics['max_queue_time'] = max(self._metrics['max_queue_time'], max(queue_times))
+                self._metrics['compute_time'] += time.perf_counter() - start_time
+
+    def _submit(self, query):
+        future = Future()
+        embedding = self._cache_get(query)
+        if embedding is not None:
+            future.set_result(embedding)
+        else:
+            self._queue.put((query, future, time.perf_counter()))
+        return future
+
+    def _get_query_embedding(self, query):
+        return self._submit(query).result()
+
+    async def _aget_query_embedding(self, query):
+        return await asyncio.wrap_future(self._submit(query))
+
+    def _get_text_embedding(self, text):
+        return self._model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text):
+        return await self._model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts):
+        return self._model.get_text_embedding_batch(texts)
+
+    def stats(self):
+        with self._lock:
+            m = dict(self._metrics)
+            cache_size = len(self._cache)
+        return {
+            'requests': m['requests'],
+            'cache_hits': m['cache_hits'],
+            'cache_hit_rate': round(m['cache_hits'] / m['requests'], 4) if m['requests'] else 0.0,
+            'cache_size': cache_size,
+            'batches': m['batches'],
+            'embedded': m['embedded'],
+            'avg_batch_size': round(m['queued'] / m['batches'], 2) if m['batches'] else 0.0,
+            'avg_queue_ms': round(m['queue_time'] / m['queued'] * 1000, 3) if m['queued'] else 0.0,
+            'max_queue_ms': round(m['max_queue_time'] * 1000, 3),
+            'avg_batch_ms': round(m['compute_time'] / m['batches'] * 1000, 3) if m['batches'] else 0.0,
+            # 计算线程忙碌时每秒完成的查询数，以及启动以来平均每秒的请求数
+            'throughput': round(m['embedded'] / m['compute_time'], 2) if m['compute_time'] else 0.0,
+            'requests_per_second': round(m['requests'] / max(time.time() - self._started_at, 1e-9), 3),
+            'queue_size': self._queue.qsize()
+        }
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout=5)
@@ -0,0 +1,235 @@
+"""
+ES批量索引：把article表（或ARTICLE_DIR中的txt文件）写入文章索引和段落索引
+- 文章按updated_at顺序流式读取，每chunk_size篇拼成一个_bulk请求（文章文档和它的段落文档），多个请求并发发送，
+  在途的请求数有上限，内存占用与文章总数无关
+- 增量索引：文章索引的_meta中记录已索引到的最大updated_at，下次只索引此后更新的文章；
+  重新索引的文章先删除旧段落，避免文章变短后留下多余的段落
+- 全量重建（--full）：按当前分词器新建带时间戳的索引（如article_20250101120000）并写入，全部写入成功后
+  把别名（ES_INDEX、ES_PARAGRAPH_INDEX）原子地切换到新索引并删除旧索引；新索引创建失败（如分词器插件未安装）
+  或写入有失败时不切换，线上索引不受影响
+- 写入期间关闭refresh，结束后恢复并refresh一次
+- 有写入失败时不推进_meta中的updated_at，再次执行同一命令即可补齐
+
+用法（在项目根目录执行）：
+    python -m fastapi_project.util.es_index                # 从article表增量索引
+    python -m fastapi_project.util.es_index --full         # 全量重建
+    python -m fastapi_project.util.es_index --source dir   # 从ARTICLE_DIR索引，updated_at为文件修改时间
+"""
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+from fastapi_project.settings import settings
+from fastapi_project.util.es_util import ESClient, article_mapping, paragraph_mapping, paragraph_bulk_lines
+
+META_KEY = 'last_updated_at'
+
+
+def iter_articles_from_db(since=None, fetch_size=2000):
+    """用服务端游标按updated_at顺序读取article表，返回(id, title, body, tags, updated_at)"""
+    from fastapi_project.util import db_util
+    query = "SELECT id, title, body, tags, updated_at FROM article"
+    params = None
+    if since is not None:
+        # 用>=：与上次最后一篇同一时刻更新的文章也会重新索引，重复索引按_id覆盖
+        query += " WHERE updated_at >= %s"
+        params = (since,)
+    query += " ORDER BY updated_at NULLS FIRST, id"
+    with db_util.get_connection() as connection:
+        try:
+            with connection.cursor(name='es_index_articles') as cursor:
+                cursor.itersize = fetch_size
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield row
+        finally:
+            connection.rollback()
+
+def iter_articles_from_dir(txt_dir, since=None):
+    """ARTICLE_DIR中的txt文件，文件名作为文章id和标题（与write_to_article一致），修改时间作为updated_at"""
+    entries = []
+    for name in os.listdir(txt_dir):
+        if not name.endswith('.txt'):
+            continue
+        path = os.path.join(txt_dir, name)
+        updated_at = datetime.fromtimestamp(os.path.getmtime(path))
+        if since is None or updated_at >= since:
+            entries.append((updated_at, name, path))
+    for updated_at, name, path in sorted(entries):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                body = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"读取文件 {name} 失败，跳过: {e}")
+            continue
+        yield (name, name, body, [], updated_at)
+
+def article_bulk_lines(index, article):
+    article_id, title, body, tags, updated_at = article
+    return [
+        json.dumps({'index': {'_index': index, '_id': str(article_id)}}),
+        json.dumps({
+            'title': title,
+            'body': body,
+            'tags': list(tags or []),
+            'updated_at': updated_at.isoformat() if updated_at else None
+        }, ensure_ascii=False)
+    ]
+
+def _chunks(articles, chunk_size):
+    chunk = []
+    for article in articles:
+        chunk.append(article)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _bulk_with_retry(client, lines, retries=3):
+    """整个请求失败（连接错误、429、5xx）时退避重试，仍然失败时整批计为失败"""
+    for attempt in range(retries + 1):
+        try:
+            return client.bulk(lines)
+        except httpx.HTTPError as e:
+            if attempt == retries:
+                print(f"_bulk请求失败: {e}")
+                return len(lines) // 2
+            time.sleep(2 ** attempt)
+
+def index_chunk(client, chunk, article_index, paragraph_index=None, incremental=False):
+    """
+    索引一批文章
+
+    Returns:
+        (文章数, 段落数, 失败的文档数)
+    """
+    if paragraph_index and incremental:
+        try:
+            client.delete_by_terms(paragraph_index, 'article_id', [str(article[0]) for article in chunk])
+        except httpx.HTTPError as e:
+            print(f"删除旧段落失败，本批跳过: {e}")
+            return len(chunk), 0, len(chunk)
+    lines = []
+    paragraphs = 0
+    for article in chunk:
+        lines.extend(article_bulk_lines(article_index, article))
+        if paragraph_index:
+            paragraph_lines = paragraph_bulk_lines(paragraph_index, article[0], article[1], article[2])
+            paragraphs += len(paragraph_lines) // 2
+            lines.extend(paragraph_lines)
+    return len(chunk), paragraphs, _bulk_with_retry(client, lines)
+
+def build_indexes(source='db', full=False, chunk_size=None, workers=None, paragraphs=True):
+    """
+    把文章写入ES的文章索引（settings.ES_INDEX）和段落索引（settings.ES_PARAGRAPH_INDEX）
+
+    Args:
+        source: 'db'从article表读取，'dir'从settings.ARTICLE_DIR读取
+        full: 写入新索引后切换别名；索引不存在或数据来源与上次不同时也会自动全量重建
+        chunk_size: 每个_bulk请求包含的文章数
+        workers: 并发发送的_bulk请求数
+        paragraphs: 是否同时写入段落索引
+    Returns:
+        dict: {'articles', 'paragraphs', 'failed', 'elapsed'}
+    """
+    chunk_size = chunk_size or settings.ES_BULK_CHUNK_SIZE
+    workers = workers or settings.ES_BULK_WORKERS
+    client = ESClient(settings.ES_URL, index=settings.ES_INDEX, timeout=settings.ES_TIMEOUT, max_connections=workers)
+    article_index = settings.ES_INDEX
+    paragraph_index = settings.ES_PARAGRAPH_INDEX if paragraphs else None
+    indexes = [(article_index, article_mapping())]
+    if paragraph_index:
+        indexes.append((paragraph_index, paragraph_mapping()))
+    start_time = time.time()
+    targets = {}
+    try:
+        meta = client.get_meta(article_index)
+        if not full and meta.get('source') not in (None, source):
+            print(f"数据来源由 {meta['source']} 变为 {source}，改为全量重建")
+            full = True
+        if not full and not all(client.exists(index) for index, _ in indexes):
+            print("索引不存在，改为全量重建")
+            full = True
+        if full:
+            # 先创建新索引，mapping有问题时在这里失败，不影响别名指向的线上索引
+            suffix = datetime.now().strftime('%Y%m%d%H%M%S')
+            for index, body in indexes:
+                targets[index] = f'{index}_{suffix}'
+                client.create_index(targets[index], body)
+        else:
+            targets = {index: index for index, _ in indexes}
+        since = None if full or not meta.get(META_KEY) else datetime.fromisoformat(meta[META_KEY])
+        print(f"开始{'全量' if since is None else '增量'}索引，来源: {source}，起始updated_at: {since}")
+
+        if source == 'db':
+            articles = iter_articles_from_db(since)
+        else:
+            articles = iter_articles_from_dir(settings.ARTICLE_DIR, since)
+        stats = {'articles': 0, 'paragraphs': 0, 'failed': 0}
+        last_updated_at = since
+
+        def collect(done):
+            for future in done:
+                for key, value in zip(('articles', 'paragraphs', 'failed'), future.result()):
+                    stats[key] += value
+
+        for index in targets.values():
+            client.put_settings(index, {'refresh_interval': '-1'})
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                for chunk in _chunks(articles, chunk_size):
+                    # 读取快于写入时在这里等待，在途请求数不超过workers的两倍
+                    while len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(index_chunk, client, chunk, targets[article_index],
+                                                targets.get(paragraph_index), since is not None))
+                    # 文章按updated_at升序读取，最后一篇的updated_at最大
+                    last_updated_at = chunk[-1][4] or last_updated_at
+                collect(wait(pending)[0])
+        finally:
+            for index in targets.values():
+                client.put_settings(index, {'refresh_interval': None})
+                client.refresh(index)
+
+        if full and (stats['failed'] or not stats['articles']):
+            # 新索引不完整，不切换别名，finally中删除新索引
+            stats['elapsed'] = round(time.time() - start_time, 3)
+            print(f"全量重建写入 {stats['articles']} 篇文章，失败 {stats['failed']} 个文档，不切换别名，线上索引保持不变")
+            return stats
+        if stats['failed']:
+            print(f"有 {stats['failed']} 个文档写入失败，不更新增量起点，请重新执行")
+        elif last_updated_at is not None:
+            client.put_meta(targets[article_index], {'source': source, META_KEY: last_updated_at.isoformat()})
+        if full:
+            for index, _ in indexes:
+                client.switch_alias(index, targets.pop(index))
+        stats['elapsed'] = round(time.time() - start_time, 3)
+        print(f"ES索引完成: {stats}")
+        return stats
+    finally:
+        if full:
+            # 全量重建未完成时删除新建的索引，别名仍指向旧索引
+            for index in targets.values():
+                try:
+                    client.delete_index(index)
+                except httpx.HTTPError as e:
+                    print(f"删除未完成的索引 {index} 失败: {e}")
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把文章批量写入ES的文章索引和段落索引")
+    parser.add_argument('--source', choices=('db', 'dir'), default='db', help="db: article表；dir: ARTICLE_DIR中的txt文件")
+    parser.add_argument('--full', action='store_true', help="写入新索引后切换别名，替换原有索引")
+    parser.add_argument('--chunk-size', type=int, default=None, help="每个_bulk请求包含的文章数")
+    parser.add_argument('--workers', type=int, default=None, help="并发发送的_bulk请求数")
+    parser.add_argument('--no-paragraphs', action='store_true', help="不写入段落索引")
+    args = parser.parse_args()
+    build_indexes(source=args.source, full=args.full, chunk_size=args.chunk_size, workers=args.workers,
+                  paragraphs=not args.no_paragraphs)
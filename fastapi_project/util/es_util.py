@@ -0,0 +1,315 @@
+"""
+Elasticsearch关键词段落检索：所有关键词合并为一个_msearch请求
+- 进程内共享同步和异步两个httpx连接池，复用到ES的连接
+- 段落索引：每篇文章按空行切分，每个段落是一个ES文档，关键词直接检索到带相关性得分的段落，
+  不再下载整篇正文在本地切分查找
+- 没有段落索引时（ES_PARAGRAPH_SEARCH=False，或开启了但段落索引还未建立）在文章索引上检索，正文通过高亮片段返回
+- filter_path去掉响应中用不到的部分
+- 文章索引和段落索引的mapping（中文分词器）及建索引、_bulk、_meta、别名切换等维护接口，供es_index批量建索引使用
+"""
+import re
+import json
+import threading
+import httpx
+from fastapi_project.settings import settings
+
+def text_field(analyzer=None, search_analyzer=None, **extra):
+    """中文全文字段：索引时用analyzer（如ik_max_word、smartcn），查询时用search_analyzer（如ik_smart）"""
+    field = {'type': 'text', **extra}
+    analyzer = analyzer or settings.ES_ANALYZER
+    if analyzer and analyzer != 'standard':
+        field['analyzer'] = analyzer
+        field['search_analyzer'] = search_analyzer or settings.ES_SEARCH_ANALYZER or analyzer
+    return field
+
+def article_mapping():
+    """文章索引：正文检索和高亮都在body字段上"""
+    return {
+        'mappings': {
+            'properties': {
+                'title': text_field(fields={'raw': {'type': 'keyword'}}),
+                'body': text_field(),
+                'tags': {'type': 'keyword'},
+                'updated_at': {'type': 'date'}
+            }
+        }
+    }
+
+def paragraph_mapping():
+    return {
+        'mappings': {
+            'properties': {
+                'article_id': {'type': 'keyword'},
+                'title': text_field(fields={'raw': {'type': 'keyword'}}),
+                'para_no': {'type': 'integer'},
+                'text': text_field()
+            }
+        }
+    }
+
+_PARAGRAPH_SEPARATOR = re.compile(r'\n\s*\n')
+
+def split_paragraphs(body):
+    """按空行切分段落，与原来按两个换行符切分的规则一致，同时兼容Windows换行"""
+    body = (body or '').replace('\r\n', '\n').replace('\r', '\n')
+    return [p.strip() for p in _PARAGRAPH_SEPARATOR.split(body) if p.strip()]
+
+def paragraph_bulk_lines(index, article_id, title, body):
+    """一篇文章的所有段落的_bulk请求行，段落文档id为"文章id_段落序号"，重复索引会覆盖"""
+    lines = []
+    for para_no, text in enumerate(split_paragraphs(body)):
+        lines.append(json.dumps({'index': {'_index': index, '_id': f'{article_id}_{para_no}'}}))
+        lines.append(json.dumps({'article_id': str(article_id), 'title': title, 'para_no': para_no, 'text': text},
+                                ensure_ascii=False))
+    return lines
+
+#只保留解析需要的字段，其余的元数据（_shards、took、_index等）不返回
+MSEARCH_FILTER_PATH = ','.join([
+    'responses.error',
+    'responses.hits.hits._id',
+    'responses.hits.hits._score',
+    'responses.hits.hits._source',
+    'responses.hits.hits.highlight'
+])
+
+NDJSON_HEADERS = {'Content-Type': 'application/x-ndjson'}
+
+
+class ESClient:
+    def __init__(self, base_url, index="article", timeout=3.0, max_connections=10):
+        self.base_url = base_url.rstrip('/')
+        self.index = index
+        self.timeout = timeout
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(base_url=self.base_url, limits=limits, timeout=timeout)
+        self._async_client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=timeout)
+
+    def build_msearch_body(self, kws, k=None, n=None, paragraph=None):
+        """每个关键词一组header和查询"""
+        if settings.ES_PARAGRAPH_SEARCH if paragraph is None else paragraph:
+            return self._build_paragraph_msearch_body(kws, k)
+        return self._build_highlight_msearch_body(kws, k, n)
+
+    @staticmethod
+    def _paragraph_index_missing(data):
+        """段落索引不存在时每个关键词的查询都返回index_not_found_exception"""
+        responses = data.get('responses', [])
+        return bool(responses) and all(
+            response.get('error', {}).get('type') == 'index_not_found_exception' for response in responses)
+
+    def _build_paragraph_msearch_body(self, kws, k=None):
+        """在段落索引中按短语匹配检索，每个关键词返回得分最高的k个段落"""
+        k = k or settings.ES_PARAGRAPH_TOP_K
+        lines = []
+        for kw in kws:
+            lines.append(json.dumps({'index': settings.ES_PARAGRAPH_INDEX}))
+            lines.append(json.dumps({
+                'size': k,
+                'query': {'match_phrase': {'text': kw}},
+                '_source': ['title', 'text']
+            }, ensure_ascii=False))
+        return '\n'.join(lines) + '\n'
+
+    def _build_highlight_msearch_body(self, kws, k=None, n=None):
+        """在文章索引中按短语匹配检索，正文不放入_source，只返回最多n个高亮片段"""
+        k = k or settings.ES_TOP_K
+        n = n or settings.ES_MAX_FRAGMENTS
+        lines = []
+        for kw in kws:
+            lines.append(json.dumps({'index': self.index}))
+            lines.append(json.dumps({
+                'size': k,
+                'query': {'match_phrase': {'body': kw}},
+                '_source': ['title'],
+                'highlight': {
+                    'fields': {
+                        'body': {
+                            'type': 'unified',
+                            'number_of_fragments': n,
+                            'fragment_size': settings.ES_FRAGMENT_SIZE,
+                            'boundary_scanner': 'sentence',
+                            'boundary_scanner_locale': 'zh-CN'
+                        }
+                    },
+                    # 片段直接放入prompt，不需要高亮标签
+                    'pre_tags': [''],
+                    'post_tags': ['']
+                }
+            }, ensure_ascii=False))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def parse_msearch(data, kws):
+        """
+        Returns:
+            list: 与kws顺序一致，每个元素为该关键词的段落列表[{'text', 'score', 'title'}]，按得分从高到低，
+                  出错的关键词为空列表
+        """
+        responses = data.get('responses', [])
+        kw_paragraphs_list = []
+        for kw, response in zip(kws, responses):
+            if 'error' in response:
+                print(f"ES查询关键词'{kw}'出错: {response['error']}")
+                kw_paragraphs_list.append([])
+                continue
+            paragraphs = []
+            for hit in response.get('hits', {}).get('hits', []):
+                source = hit.get('_source', {})
+                score = hit.get('_score') or 0.0
+                if 'text' in source:
+                    paragraphs.append({'text': source['text'], 'score': score, 'title': source.get('title')})
+                for fragment in hit.get('highlight', {}).get('body', []):
+                    paragraphs.append({'text': fragment.strip(), 'score': score, 'title': source.get('title')})
+            kw_paragraphs_list.append(paragraphs)
+        # 响应数量不足时（不应出现）补齐空列表，保持与kws对齐
+        kw_paragraphs_list.extend([] for _ in range(len(kws) - len(kw_paragraphs_list)))
+        return kw_paragraphs_list
+
+    def _msearch(self, kws, k, n, paragraph=None):
+        response = self._client.post('/_msearch', params={'filter_path': MSEARCH_FILTER_PATH},
+                                     content=self.build_msearch_body(kws, k, n, paragraph).encode('utf-8'),
+                                     headers=NDJSON_HEADERS)
+        response.raise_for_status()
+        return response.json()
+
+    async def _amsearch(self, kws, k, n, paragraph=None):
+        response = await self._async_client.post('/_msearch', params={'filter_path': MSEARCH_FILTER_PATH},
+                                                  content=self.build_msearch_body(kws, k, n, paragraph).encode('utf-8'),
+                                                  headers=NDJSON_HEADERS)
+        response.raise_for_status()
+        return response.json()
+
+    def get_scored_paras_from_kws(self, kws, k=None, n=None):
+        if not kws:
+            return []
+        data = self._msearch(kws, k, n)
+        if settings.ES_PARAGRAPH_SEARCH and self._paragraph_index_missing(data):
+            print(f"段落索引 {settings.ES_PARAGRAPH_INDEX} 不存在，改为在文章索引上检索，请执行es_index建立段落索引")
+            data = self._msearch(kws, k, n, paragraph=False)
+        return self.parse_msearch(data, kws)
+
+    async def aget_scored_paras_from_kws(self, kws, k=None, n=None):
+        """一次往返查询所有关键词的相关段落"""
+        if not kws:
+            return []
+        data = await self._amsearch(kws, k, n)
+        if settings.ES_PARAGRAPH_SEARCH and self._paragraph_index_missing(data):
+            print(f"段落索引 {settings.ES_PARAGRAPH_INDEX} 不存在，改为在文章索引上检索，请执行es_index建立段落索引")
+            data = await self._amsearch(kws, k, n, paragraph=False)
+        return self.parse_msearch(data, kws)
+
+    def get_paras_from_kws(self, kws, k=None, n=None):
+        """只返回段落文本，供渲染prompt使用"""
+        return [[p['text'] for p in paragraphs] for paragraphs in self.get_scored_paras_from_kws(kws, k, n)]
+
+    async def aget_paras_from_kws(self, kws, k=None, n=None):
+        return [[p['text'] for p in paragraphs] for paragraphs in await self.aget_scored_paras_from_kws(kws, k, n)]
+
+    def exists(self, index):
+        """索引或别名是否存在"""
+        return self._client.head(f'/{index}').status_code != 404
+
+    def create_index(self, index, body):
+        """按body（mapping和settings）创建索引，分词器不可用等错误时抛出异常"""
+        response = self._client.put(f'/{index}', json=body)
+        if response.is_error:
+            raise httpx.HTTPStatusError(f"创建ES索引 {index} 失败: {response.text}",
+                                        request=response.request, response=response)
+        print(f"已创建ES索引 {index}")
+
+    def ensure_index(self, index, body):
+        """索引不存在时按body（mapping和settings）创建"""
+        if not self.exists(index):
+            self.create_index(index, body)
+
+    def alias_indexes(self, alias):
+        """别名当前指向的索引，别名不存在时返回空列表"""
+        response = self._client.get(f'/_alias/{alias}')
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return list(response.json())
+
+    def switch_alias(self, alias, index):
+        """
+        把别名原子地切换到index，并删除别名原来指向的索引；
+        已有与别名同名的实际索引（旧版本直接按名称创建）时，在同一个请求中删除它
+        """
+        old_indexes = self.alias_indexes(alias)
+        if not old_indexes and self.exists(alias):
+            old_indexes = [alias]
+        actions = [{'add': {'index': index, 'alias': alias}}]
+        actions.extend({'remove_index': {'index': old}} for old in old_indexes if old != index)
+        response = self._client.post('/_aliases', json={'actions': actions}, timeout=max(self.timeout, 60.0))
+        response.raise_for_status()
+        print(f"ES别名 {alias} 已切换到 {index}，删除旧索引: {old_indexes or '无'}")
+
+    def bulk(self, lines):
+        """发送一个_bulk请求，返回失败的条数"""
+        response = self._client.post('/_bulk', params={'filter_path': 'errors,items.*.error'},
+                                     content=('\n'.join(lines) + '\n').encode('utf-8'),
+                                     headers=NDJSON_HEADERS, timeout=max(self.timeout, 60.0))
+        response.raise_for_status()
+        data = response.json()
+        if not data.get('errors'):
+            return 0
+        return sum(1 for item in data.get('items', []) for result in item.values() if 'error' in result)
+
+    def delete_index(self, index):
+        response = self._client.delete(f'/{index}', params={'ignore_unavailable': 'true'})
+        response.raise_for_status()
+
+    def put_settings(self, index, index_settings):
+        """修改索引的动态设置，例如批量写入期间关闭refresh"""
+        response = self._client.put(f'/{index}/_settings', json={'index': index_settings})
+        response.raise_for_status()
+
+    def refresh(self, index):
+        response = self._client.post(f'/{index}/_refresh', timeout=max(self.timeout, 60.0))
+        response.raise_for_status()
+
+    def get_meta(self, index):
+        """读取索引mapping中的_meta，索引不存在时返回空字典"""
+        response = self._client.get(f'/{index}/_mapping')
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        # 通过别名读取时，响应以实际的索引名为键
+        mappings = next(iter(response.json().values()), {})
+        return mappings.get('mappings', {}).get('_meta', {})
+
+    def put_meta(self, index, meta):
+        response = self._client.put(f'/{index}/_mapping', json={'_meta': meta})
+        response.raise_for_status()
+
+    def delete_by_terms(self, index, field, values):
+        """删除field取值在values中的文档，用于重新索引文章前清除旧段落"""
+        response = self._client.post(f'/{index}/_delete_by_query', params={'conflicts': 'proceed', 'refresh': 'false'},
+                                     json={'query': {'terms': {field: list(values)}}},
+                                     timeout=max(self.timeout, 60.0))
+        response.raise_for_status()
+        return response.json().get('deleted', 0)
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        await self._async_client.aclose()
+        self._client.close()
+
+
+_es_client = None
+_es_client_lock = threading.Lock()
+
+def get_es_client():
+    """获取进程内共享的ESClient"""
+    global _es_client
+    if _es_client is None:
+        with _es_client_lock:
+            if _es_client is None:
+                _es_client = ESClient(
+                    base_url=settings.ES_URL,
+                    index=settings.ES_INDEX,
+                    timeout=settings.ES_TIMEOUT
+                )
+    return _es_client
@@ -0,0 +1,165 @@
+"""
+静态页面抓取：先用httpx异步连接池直接GET网页，只有拿不到正文时才交给浏览器渲染
+- 连接复用，可用时开启HTTP/2；响应自动解压gzip/deflate（安装brotli后也支持br）
+- 记录ETag/Last-Modified，重复抓取时发送条件请求，304时复用上次的页面
+- 与浏览器爬取共用按域名的请求间隔和并发数限制
+"""
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from fastapi_project.settings import settings
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ValidatorCache:
+    """按url保存上次响应的ETag、Last-Modified和页面内容，用于条件请求"""
+
+    def __init__(self, max_size=2000):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # url -> {'etag', 'last_modified', 'html'}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url, etag, last_modified, html):
+        if not (etag or last_modified):
+            return
+        with self._lock:
+            self._entries[url] = {'etag': etag, 'last_modified': last_modified, 'html': html}
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def headers(self, url):
+        entry = self.get(url)
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+
+validator_cache = ValidatorCache(max_size=settings.HTTP_CACHE_SIZE)
+
+
+class AsyncDomainLimiter:
+    """DomainRateLimiter的异步版本：同一域名的最小请求间隔和最大并发数"""
+
+    def __init__(self, min_interval=1.0, max_concurrency=2):
+        self.min_interval = min_interval
+        self.max_concurrency = max_concurrency
+        self._next_time = {}
+        self._semaphores = {}
+
+    async def acquire(self, url):
+        domain = urlparse(url).netloc
+        if domain not in self._semaphores:
+            self._semaphores[domain] = asyncio.Semaphore(self.max_concurrency)
+        semaphore = self._semaphores[domain]
+        await semaphore.acquire()
+        now = time.time()
+        start_at = max(now, self._next_time.get(domain, 0))
+        self._next_time[domain] = start_at + self.min_interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+        return semaphore
+
+
+class HttpFetcher:
+    """一次抓取任务共用一个AsyncClient，所有请求复用同一个连接池"""
+
+    def __init__(self, concurrency=None, timeout=None, cache=None, limiter=None):
+        self.concurrency = concurrency or settings.HTTP_FETCH_CONCURRENCY
+        self.timeout = timeout or settings.HTTP_FETCH_TIMEOUT
+        self.cache = cache or validator_cache
+        self.limiter = limiter or AsyncDomainLimiter(settings.CRAWLER_DOMAIN_INTERVAL,
+                                                     settings.CRAWLER_DOMAIN_CONCURRENCY)
+        self._client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.concurrency,
+                              max_keepalive_connections=self.concurrency)
+        self._client = httpx.AsyncClient(http2=_http2_available(), limits=limits, timeout=self.timeout,
+                                         follow_redirects=True, headers={'User-Agent': USER_AGENT})
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    async def fetch(self, url):
+        """
+        抓取一个页面
+
+        Returns:
+            dict: {'url', 'status', 'html'(bytes，编码交给trafilatura识别), 'not_modified'}，失败返回None
+        """
+        async with self._semaphore:
+            domain_semaphore = await self.limiter.acquire(url)
+            try:
+                response = await self._client.get(url, headers=self.cache.headers(url))
+            except Exception as e:
+                # 除网络错误外还有非法URL等，任何一个URL出错都只影响它自己
+                print(f"HTTP抓取失败 {url}: {e}")
+                return None
+            finally:
+                domain_semaphore.release()
+        if response.status_code == 304:
+            entry = self.cache.get(url)
+            if entry is not None:
+                return {'url': url, 'status': 304, 'html': entry['html'], 'not_modified': True}
+            return None
+        if response.status_code != 200 or 'html' not in response.headers.get('content-type', 'text/html'):
+            return None
+        html = response.content
+        self.cache.put(url, response.headers.get('etag'), response.headers.get('last-modified'), html)
+        return {'url': url, 'status': 200, 'html': html, 'not_modified': False}
+
+    async def fetch_all(self, urls):
+        """并发抓取，结果按urls的顺序返回，出错的URL为None"""
+        results = await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                print(f"HTTP抓取失败 {url}: {result}")
+        return [None if isinstance(result, Exception) else result for result in results]
+
+
+def fetch_pages(urls, **kwargs):
+    """
+    同步接口：在独立线程的事件循环中并发抓取urls
+    调用方可能本身运行在事件循环里（如FastAPI接口），所以不直接asyncio.run
+    """
+    urls = list(urls)
+    if not urls:
+        return []
+
+    async def run():
+        async with HttpFetcher(**kwargs) as fetcher:
+            return await fetcher.fetch_all(urls)
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pages = executor.submit(asyncio.run, run()).result()
+    print(f"HTTP抓取 {len(urls)} 个页面，成功 {sum(1 for p in pages if p)} 个，耗时: {time.time() - start_time:.2f} 秒")
+    return pages
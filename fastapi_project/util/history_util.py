@@ -0,0 +1,113 @@
+"""
+对话历史压缩：最近N轮对话原样保留（受token预算限制），更早的对话折叠进滚动摘要
+"""
+import os
+import asyncio
+from fastapi_project.settings import settings
+from fastapi_project.util.llm_gateway import get_llm_gateway
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+def get_tokenizer():
+    """加载本地缓存的bge分词器，只加载一次；加载失败时返回None，按字符数估算"""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(
+                "BAAI/bge-large-zh-v1.5",
+                cache_dir=os.path.abspath("models"),
+                local_files_only=True
+            )
+        except Exception as e:
+            print(f"分词器加载失败，按字符数估算token: {e}")
+            _tokenizer = None
+    return _tokenizer
+
+def count_tokens(text):
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # 中文大约一个字一个token
+        return len(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def count_message_tokens(message):
+    # 额外的4个token近似角色和分隔符的开销
+    return count_tokens(f"{message['role']}: {message['content']}") + 4
+
+def select_history_window(msg_list, summary, max_turns=None, token_budget=None, fold_batch=None):
+    """
+    选择放入prompt的最近对话窗口
+
+    Args:
+        msg_list: 完整的消息列表（包含当前用户发言）
+        summary: 会话的滚动摘要 {'text': 摘要, 'count': 已被摘要的消息数}
+        max_turns: 原样保留的最多轮数（一问一答为一轮）
+        token_budget: 原样保留部分的token上限
+        fold_batch: 窗口外未摘要的消息达到该数量时才折叠，避免每轮都调用一次LLM
+
+    Returns:
+        (window, to_fold): window是原样放入prompt的消息，to_fold是需要折叠进摘要的消息
+    """
+    max_turns = max_turns or settings.HISTORY_MAX_TURNS
+    token_budget = token_budget or settings.HISTORY_TOKEN_BUDGET
+    fold_batch = fold_batch or settings.HISTORY_FOLD_BATCH
+    summarized = summary.get('count', 0)
+    # 从最新的消息往前取，至少保留当前的用户发言
+    start = len(msg_list)
+    used_tokens = 0
+    while start > summarized:
+        tokens = count_message_tokens(msg_list[start - 1])
+        if start < len(msg_list) and (len(msg_list) - start + 1 > max_turns * 2 or used_tokens + tokens > token_budget):
+            break
+        used_tokens += tokens
+        start -= 1
+    pending = msg_list[summarized:start]
+    if len(pending) < fold_batch:
+        # 未摘要的消息还不多，先原样保留；超出token预算时从最早的消息开始丢弃，这些消息仍计为未摘要，下次折叠时合并进摘要
+        pending_tokens = [count_message_tokens(m) for m in pending]
+        used_tokens += sum(pending_tokens)
+        window_start = summarized
+        while window_start < start and used_tokens > token_budget:
+            used_tokens -= pending_tokens[window_start - summarized]
+            window_start += 1
+        return msg_list[window_start:], []
+    return msg_list[start:], pending
+
+def fold_into_summary(summary, to_fold):
+    """把to_fold中的消息合并进已有摘要，返回新的摘要"""
+    if not to_fold:
+        return summary
+    FOLD_SUMMARY_PROMPT = f"""
+    你需要维护一段用户和邹韬奋之间对话的摘要。
+    已有的摘要是：
+    {summary.get('text') or '（无）'}
+    新增的对话是：
+    {format_history(to_fold)}
+    请把新增对话的要点合并进摘要，保留用户关心的问题、提到的人物事件和已经给出的重要结论，不超过300字，仅返回摘要内容：
+    """
+    try:
+        text = get_llm_gateway().complete(FOLD_SUMMARY_PROMPT) or summary.get('text', '')
+    except Exception as e:
+        # 摘要失败时保留原摘要，下次再折叠这些消息
+        print(f"对话摘要更新失败: {e}")
+        return summary
+    return {'text': text, 'count': summary.get('count', 0) + len(to_fold)}
+
+async def afold_into_summary(summary, to_fold):
+    if not to_fold:
+        return summary
+    return await asyncio.to_thread(fold_into_summary, summary, to_fold)
+
+def format_history(messages):
+    return '\n'.join(f"{m['role']}: {m['content']}" for m in messages)
+
+def build_history_prompt(window, summary):
+    """把摘要和最近的对话渲染为prompt中的对话部分"""
+    history_prompt = ''
+    if summary.get('text'):
+        history_prompt += f"更早对话的摘要：{summary['text']}\n"
+    history_prompt += format_history(window)
+    return history_prompt
@@ -0,0 +1,226 @@
+"""
+热点时评后台任务：爬虫 -> 热点总结 -> 入库 -> 检索 -> 生成评论 整个流程作为一个任务在后台执行
+- 提交任务立即返回job_id，通过状态接口查看各阶段进度和耗时，通过结果接口读取保存的结果
+- 同时执行的任务数有上限，且同一时间最多只有一个任务在爬虫
+- 已有未完成的任务时，重复提交返回该任务，不会重新开始爬虫
+- 任务状态和结果保存在topic_job表中，进程重启后仍可读取已完成任务的结果
+"""
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime
+from fastapi_project.settings import settings
+from fastapi_project.util import db_util
+from fastapi_project.util.spider_util import get_baidu_hot_news, aget_topics, save_to_db
+from fastapi_project.util.comment_util import aload_latest_news, aretrieve_ref_resources, agenerate_comment_stream
+from fastapi_project.util.resource_registry import registry
+
+STAGES = ('crawl', 'summarize', 'insert', 'retrieve', 'comment')
+
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = 'queued'  # queued / running / succeeded / failed
+        self.stages = {name: {'status': 'pending', 'elapsed': None, 'done': 0, 'total': None} for name in STAGES}
+        self.results = []
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self._stage_start = {}
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def current_stage(self):
+        for name in STAGES:
+            if self.stages[name]['status'] == 'running':
+                return name
+        return None
+
+    def start_stage(self, name, total=None):
+        self.stages[name].update(status='running', total=total)
+        self._stage_start[name] = time.time()
+
+    def finish_stage(self, name, done=None):
+        stage = self.stages[name]
+        stage['status'] = 'done'
+        stage['elapsed'] = round(time.time() - self._stage_start[name], 3)
+        if done is not None:
+            stage['done'] = done
+
+    def fail(self, error):
+        self.status = 'failed'
+        self.error = error
+        self.finished_at = datetime.now()
+        stage = self.current_stage
+        if stage:
+            self.stages[stage]['status'] = 'failed'
+            self.stages[stage]['elapsed'] = round(time.time() - self._stage_start[stage], 3)
+
+    def sorted_results(self):
+        return sorted(self.results, key=lambda r: r['index'])
+
+    def status_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'stage': self.current_stage,
+            'stages': self.stages,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class PostgresJobStore:
+    """topic_job表保存任务状态和结果，通过db_util的连接池访问"""
+
+    def __init__(self):
+        db_util.execute_query("""
+        CREATE TABLE IF NOT EXISTS topic_job (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            stages TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """)
+
+    def save(self, job):
+        db_util.execute_query("""
+        INSERT INTO topic_job (job_id, status, stages, result, error, created_at, finished_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (job_id) DO UPDATE SET status = EXCLUDED.status, stages = EXCLUDED.stages,
+            result = EXCLUDED.result, error = EXCLUDED.error, finished_at = EXCLUDED.finished_at
+        """, (job.job_id, job.status, json.dumps(job.stages, ensure_ascii=False),
+              json.dumps(job.sorted_results(), ensure_ascii=False) if job.finished else None,
+              job.error, job.created_at, job.finished_at))
+
+    def load(self, job_id):
+        rows = db_util.execute_query(
+            "SELECT job_id, status, stages, result, error, created_at, finished_at FROM topic_job WHERE job_id = %s",
+            (job_id,))
+        if not rows:
+            return None
+        job_id, status, stages, result, error, created_at, finished_at = rows[0]
+        job = Job(job_id)
+        job.status = status
+        job.stages = json.loads(stages) if stages else job.stages
+        job.results = json.loads(result) if result else []
+        job.error = error
+        job.created_at = created_at
+        job.finished_at = finished_at
+        return job
+
+
+class JobManager:
+    def __init__(self, store=None, workers=None, max_jobs=100):
+        self.store = store
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._tasks = set()
+        self._semaphore = asyncio.Semaphore(workers or settings.JOB_WORKERS)
+        self._crawl_lock = asyncio.Lock()
+
+    def _get_store(self):
+        # 第一次使用时才建表，避免导入模块时就连接数据库
+        if self.store is None:
+            self.store = PostgresJobStore()
+        return self.store
+
+    async def _save(self, job):
+        try:
+            await asyncio.to_thread(self._get_store().save, job)
+        except Exception as e:
+            print(f"保存任务 {job.job_id} 状态失败: {e}")
+
+    def active_job(self):
+        for job in self._jobs.values():
+            if not job.finished:
+                return job
+        return None
+
+    def submit(self, force=False):
+        """
+        提交一个热点时评任务
+
+        Args:
+            force: 已有未完成任务时仍然提交新任务（新任务会等前一个任务的爬虫结束）
+        Returns:
+            (job, created): created为False表示返回的是已有的未完成任务
+        """
+        job = self.active_job()
+        if job is not None and not force:
+            return job, False
+        job = Job(uuid.uuid4().hex)
+        self._jobs[job.job_id] = job
+        # 只在内存中保留最近的max_jobs个任务，更早的任务从topic_job表读取
+        for old_id in [j.job_id for j in self._jobs.values() if j.finished][:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[old_id]
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, True
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            return await asyncio.to_thread(self._get_store().load, job_id)
+        except Exception as e:
+            print(f"读取任务 {job_id} 失败: {e}")
+            return None
+
+    async def _run(self, job):
+        async with self._semaphore:
+            job.status = 'running'
+            await self._save(job)
+            try:
+                async with self._crawl_lock:
+                    job.start_stage('crawl')
+                    # 爬虫是阻塞操作，放到线程中执行
+                    news_text = await asyncio.to_thread(get_baidu_hot_news)
+                    # 过滤掉空列表的情况
+                    news_text = {key: value for key, value in news_text.items() if value}
+                    job.finish_stage('crawl', done=len(news_text))
+                await self._save(job)
+
+                job.start_stage('summarize', total=len(news_text))
+                topics = await aget_topics(news_text)
+                job.finish_stage('summarize', done=len(topics))
+
+                job.start_stage('insert')
+                stats = await asyncio.to_thread(save_to_db, topics, news_text)
+                job.finish_stage('insert', done=stats['inserted'])
+                await self._save(job)
+
+                news_list = await aload_latest_news()
+                job.start_stage('retrieve', total=len(news_list))
+                ref_resources = await aretrieve_ref_resources(
+                    registry.news_summary_index, [news['keywords'] for news in news_list])
+                job.finish_stage('retrieve', done=len(ref_resources))
+
+                job.start_stage('comment', total=len(news_list))
+                async for result in agenerate_comment_stream(news_list, ref_resources):
+                    job.results.append(result)
+                    job.stages['comment']['done'] += 1
+                job.finish_stage('comment')
+                job.status = 'succeeded'
+                job.finished_at = datetime.now()
+            except Exception as e:
+                print(f"任务 {job.job_id} 失败: {e}")
+                job.fail(str(e))
+            await self._save(job)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
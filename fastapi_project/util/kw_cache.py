@@ -0,0 +1,154 @@
+"""
+关键词提取结果缓存：相同（或语义相近）的用户提问直接复用get_user_keywords的结果
+- 精确匹配：归一化后的最后一句用户发言 + 前文的短哈希
+- 语义匹配（可选）：精确未命中时，用已加载的bge嵌入模型计算相似度
+"""
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from fastapi_project.settings import settings
+
+#去掉空白和常见中英文标点，"邹韬奋是谁？"和"邹韬奋是谁"视为同一个问题
+_PUNCT_PATTERN = re.compile(r"[\s\.,!?;:'\"，。！？；：、“”‘’（）()《》【】…~～-]+")
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _PUNCT_PATTERN.sub('', text)
+
+
+class KeywordCache:
+    def __init__(self, max_size=1000, ttl=3600, context_turns=1,
+                 semantic=False, similarity_threshold=0.92):
+        """
+        Args:
+            max_size: 最多缓存条数，超过时淘汰最久未使用的条目
+            ttl: 缓存有效期（秒）
+            context_turns: 参与哈希的前文用户发言条数
+            semantic: 是否启用嵌入相似度查找
+            similarity_threshold: 语义命中的余弦相似度阈值
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.context_turns = context_turns
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # key -> {'result', 'context', 'embedding', 'expires'}
+        #语义查找时算出的嵌入先暂存，put时直接复用，避免同一句话嵌入两次
+        self._pending_embeddings = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _split(self, chat_history):
+        """返回(归一化的最后一句用户发言, 前文哈希)"""
+        user_msgs = [m.get('content', '') for m in chat_history if m.get('role') == 'user']
+        if not user_msgs:
+            return None, None
+        utterance = normalize_text(user_msgs[-1])
+        context = user_msgs[-1 - self.context_turns:-1] if self.context_turns > 0 else []
+        context_hash = hashlib.md5('\n'.join(normalize_text(c) for c in context).encode('utf-8')).hexdigest()[:12]
+        return utterance, context_hash
+
+    def _embed(self, utterance):
+        from llama_index.core.settings import Settings
+        return Settings.embed_model.get_query_embedding(utterance)
+
+    def get(self, chat_history):
+        """查询缓存，未命中返回None"""
+        utterance, context_hash = self._split(chat_history)
+        if not utterance:
+            return None
+        key = f"{context_hash}|{utterance}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires'] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['result']
+                del self._entries[key]
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e['context'] == context_hash and e['embedding'] is not None and e['expires'] > now]
+        if self.semantic and candidates:
+            try:
+                embedding = self._embed(utterance)
+            except Exception as e:
+                print(f"关键词缓存计算嵌入失败: {e}")
+                candidates, embedding = [], None
+        if self.semantic and candidates:
+            with self._lock:
+                self._pending_embeddings[key] = embedding
+                while len(self._pending_embeddings) > 32:
+                    self._pending_embeddings.popitem(last=False)
+            best_key, best_score = self._most_similar(embedding, candidates)
+            if best_score >= self.similarity_threshold:
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry is not None:
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return entry['result']
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, chat_history, result):
+        utterance, context_hash = self._split(chat_history)
+        if not utterance:
+            return
+        key = f"{context_hash}|{utterance}"
+        with self._lock:
+            embedding = self._pending_embeddings.pop(key, None)
+        if self.semantic and embedding is None:
+            try:
+                embedding = self._embed(utterance)
+            except Exception as e:
+                print(f"关键词缓存计算嵌入失败: {e}")
+        with self._lock:
+            self._entries[key] = {
+                'result': result,
+                'context': context_hash,
+                'embedding': embedding,
+                'expires': time.time() + self.ttl
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _most_similar(query_embedding, candidates):
+        import numpy as np
+        matrix = np.asarray([e['embedding'] for _, e in candidates], dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(scores))
+        return candidates[best][0], float(scores[best])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.semantic_hits) / total, 4) if total else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+keyword_cache = KeywordCache(
+    max_size=settings.KW_CACHE_SIZE,
+    ttl=settings.KW_CACHE_TTL,
+    context_turns=settings.KW_CACHE_CONTEXT_TURNS,
+    semantic=settings.KW_CACHE_SEMANTIC,
+    similarity_threshold=settings.KW_CACHE_SIMILARITY
+)
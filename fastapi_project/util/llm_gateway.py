@@ -0,0 +1,133 @@
+"""
+统一的LLM调用入口：进程内共享一个同步客户端和一个异步客户端
+- 底层使用httpx连接池（可用时开启HTTP/2），避免每次请求重新建立TLS连接
+- 超时和重试交给openai SDK处理（指数退避）
+- 同步和异步调用共用一个信号量，同时进行的LLM请求总数不超过max_concurrency
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from fastapi_project.settings import settings
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant"
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMGateway:
+    def __init__(self, api_key, base_url, model="deepseek-chat", timeout=60.0,
+                 max_retries=3, max_concurrency=8, max_connections=20):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        http2 = _http2_available()
+        if not http2:
+            print("未安装h2，LLM客户端使用HTTP/1.1连接池")
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        self._http_client = httpx.Client(http2=http2, limits=limits, timeout=timeout)
+        self._async_http_client = httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout,
+                             max_retries=max_retries, http_client=self._http_client)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout,
+                                        max_retries=max_retries, http_client=self._async_http_client)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        # 与同步调用共用同一个信号量；拿不到时让出事件循环稍后重试，不阻塞事件循环，也不占用线程
+        delay = 0.005
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def _messages(prompt, system_prompt):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def chat(self, messages, **kwargs):
+        """同步对话，返回回复文本"""
+        with self._semaphore:
+            response = self.client.chat.completions.create(
+                model=kwargs.pop('model', self.model),
+                messages=messages,
+                stream=False,
+                **kwargs
+            )
+        return response.choices[0].message.content
+
+    async def achat(self, messages, **kwargs):
+        """异步对话，返回回复文本"""
+        async with self._async_slot():
+            response = await self.async_client.chat.completions.create(
+                model=kwargs.pop('model', self.model),
+                messages=messages,
+                stream=False,
+                **kwargs
+            )
+        return response.choices[0].message.content
+
+    def complete(self, prompt, system_prompt=DEFAULT_SYSTEM_PROMPT, **kwargs):
+        """单轮补全：prompt作为用户消息发送"""
+        return self.chat(self._messages(prompt, system_prompt), **kwargs)
+
+    async def acomplete(self, prompt, system_prompt=DEFAULT_SYSTEM_PROMPT, **kwargs):
+        return await self.achat(self._messages(prompt, system_prompt), **kwargs)
+
+    async def astream_chat(self, messages, **kwargs):
+        """异步流式对话，逐段产出增量文本"""
+        async with self._async_slot():
+            stream = await self.async_client.chat.completions.create(
+                model=kwargs.pop('model', self.model),
+                messages=messages,
+                stream=True,
+                **kwargs
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+    def close(self):
+        self._http_client.close()
+
+    async def aclose(self):
+        await self._async_http_client.aclose()
+        self._http_client.close()
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway():
+    """获取进程内共享的LLMGateway"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    api_key=settings.DEEPSEEK_API,
+                    base_url=settings.LLM_BASE_URL,
+                    model=settings.LLM_MODEL,
+                    timeout=settings.LLM_TIMEOUT,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    max_concurrency=settings.LLM_MAX_CONCURRENCY
+                )
+    return _gateway
@@ -0,0 +1,266 @@
+"""
+bge嵌入模型的ONNX Runtime推理：CPU上比PyTorch的HuggingFaceEmbedding更快、占用内存更少
+- export：把bge-large-zh-v1.5导出为ONNX（float32），再做动态int8量化（权重int8，激活在运行时量化）
+- 导出后在一组未参与导出的文本上与PyTorch模型逐条比较余弦相似度，结果和单条查询耗时写入onnx_config.json
+- EMBED_BACKEND=onnx时initialize_llamaindex加载ONNX模型；没有导出或一致性检查未通过（最小余弦相似度低于ONNX_MIN_COSINE）
+  时仍然使用PyTorch模型
+- 池化方式与bge一致：取[CLS]向量并归一化；查询前缀与PyTorch模型实际使用的查询指令一致，
+  export和check时记录到onnx_config.json（旧的导出目录重新执行check即可更新）
+
+用法（在项目根目录执行）：
+    python -m fastapi_project.util.onnx_embedding export   # 导出、量化并检查一致性
+    python -m fastapi_project.util.onnx_embedding check    # 重新检查一致性
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Any
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from fastapi_project.settings import settings
+
+CONFIG_FNAME = 'onnx_config.json'
+FP32_FNAME = 'model.onnx'
+INT8_FNAME = 'model_int8.onnx'
+
+#一致性检查用的查询，与聊天中常见的提问类似
+QUERY_SAMPLES = [
+    "邹韬奋是谁？",
+    "生活周刊是什么时候创办的",
+    "邹韬奋对职业教育有什么看法",
+    "韬奋先生怎样看待青年的苦闷",
+    "抗日救亡运动中的七君子事件",
+    "生活书店的经营理念是什么",
+    "如何看待今天的新闻报道",
+    "邹先生在流亡海外期间写了哪些文章",
+    "你觉得读书有什么用",
+    "怎样才能做一个好的新闻记者",
+]
+
+def model_file_name():
+    return INT8_FNAME if settings.ONNX_QUANTIZED else FP32_FNAME
+
+def held_out_samples(data_dir=os.path.join("fastapi_project", "data"), max_texts=32):
+    """查询样本，以及从语料中按文件名顺序取出的段落（动态量化不需要校准数据，语料中的段落不参与导出）"""
+    texts = []
+    if os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            if not name.endswith('.txt'):
+                continue
+            with open(os.path.join(data_dir, name), 'r', encoding='utf-8', errors='ignore') as f:
+                texts.extend(p.strip() for p in f.read().split('\n\n') if len(p.strip()) > 20)
+            if len(texts) >= max_texts:
+                break
+    return QUERY_SAMPLES, texts[:max_texts]
+
+
+class OnnxBgeEmbedding(BaseEmbedding):
+    """
+    用ONNX Runtime推理的bge嵌入模型
+
+    Args:
+        onnx_dir: export生成的目录（ONNX模型、分词器和onnx_config.json）
+        model_file: model_int8.onnx或model.onnx
+        threads: ONNX Runtime的线程数，0表示由ONNX Runtime决定
+    """
+    max_length: int = 512
+    query_instruction: str = ''
+    text_instruction: str = ''
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: set = PrivateAttr()
+
+    def __init__(self, onnx_dir, model_file=None, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(onnx_dir, CONFIG_FNAME), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        super().__init__(
+            model_name=config['model_name'],
+            max_length=config.get('max_length', 512),
+            query_instruction=config.get('query_instruction') or '',
+            text_instruction=config.get('text_instruction') or ''
+        )
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.ONNX_THREADS if threads is None else threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(os.path.join(onnx_dir, model_file or model_file_name()),
+                                             sess_options=options, providers=['CPUExecutionProvider'])
+        self._tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    @classmethod
+    def class_name(cls):
+        return "OnnxBgeEmbedding"
+
+    def _encode(self, texts):
+        import numpy as np
+        inputs = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='np')
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self._input_names}
+        last_hidden_state = self._session.run(None, feed)[0]
+        cls = last_hidden_state[:, 0]
+        return (cls / np.linalg.norm(cls, axis=1, keepdims=True)).tolist()
+
+    def _get_query_embedding(self, query):
+        return self._encode([self.query_instruction + query])[0]
+
+    async def _aget_query_embedding(self, query):
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    def _get_text_embedding(self, text):
+        return self._encode([self.text_instruction + text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._encode([self.text_instruction + text for text in texts])
+
+    def get_query_embedding_batch(self, queries):
+        """一次前向计算一批查询，供embed_service合并批次时使用"""
+        return self._encode([self.query_instruction + query for query in queries])
+
+
+def _cosines(a, b):
+    import numpy as np
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+
+def _query_latency_ms(model, queries, rounds=3):
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            model.get_query_embedding(query)
+    return round((time.perf_counter() - start_time) / (rounds * len(queries)) * 1000, 3)
+
+def check_agreement(onnx_model, reference, samples=None):
+    """
+    逐条比较ONNX模型与PyTorch模型的向量
+
+    Returns:
+        dict: {'count', 'min_cosine', 'mean_cosine', 'onnx_query_ms', 'torch_query_ms'}
+    """
+    import numpy as np
+    queries, texts = samples or held_out_samples()
+    cosines = list(_cosines(onnx_model.get_query_embedding_batch(queries),
+                            [reference.get_query_embedding(q) for q in queries]))
+    if texts:
+        cosines.extend(_cosines(onnx_model.get_text_embedding_batch(texts), reference.get_text_embedding_batch(texts)))
+    return {
+        'count': len(cosines),
+        'min_cosine': round(float(np.min(cosines)), 6),
+        'mean_cosine': round(float(np.mean(cosines)), 6),
+        'onnx_query_ms': _query_latency_ms(onnx_model, queries),
+        'torch_query_ms': _query_latency_ms(reference, queries)
+    }
+
+def reference_instructions(reference):
+    """
+    PyTorch模型实际使用的查询和文本前缀
+    HuggingFaceEmbedding的query_instruction参数为None时，由SentenceTransformer的prompts按模型名补上bge的查询指令
+    """
+    from llama_index.embeddings.huggingface.utils import (get_query_instruct_for_model_name,
+                                                          get_text_instruct_for_model_name)
+    prompts = getattr(getattr(reference, '_model', None), 'prompts', None) or {}
+    instructions = {}
+    for name, default in (('query', get_query_instruct_for_model_name), ('text', get_text_instruct_for_model_name)):
+        if name in prompts:
+            instructions[name] = prompts[name] or ''
+        else:
+            instructions[name] = getattr(reference, f'{name}_instruction', None) or default(reference.model_name)
+    return instructions['query'], instructions['text']
+
+def _update_config(onnx_dir, **values):
+    path = os.path.join(onnx_dir, CONFIG_FNAME)
+    config = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config.update(values)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return config
+
+def check(onnx_dir=None, cache_dir=None, reference=None):
+    """记录PyTorch模型的查询和文本前缀，对float32和int8两个模型分别检查一致性，结果按文件名写入onnx_config.json"""
+    from fastapi_project.util.chat_util import load_hf_embedding
+    onnx_dir = onnx_dir or settings.ONNX_MODEL_DIR
+    reference = reference or load_hf_embedding(cache_dir or os.path.abspath("models"))
+    # 与PyTorch模型的查询前缀保持一致，否则两者的向量不可比较
+    query_instruction, text_instruction = reference_instructions(reference)
+    _update_config(onnx_dir, query_instruction=query_instruction, text_instruction=text_instruction)
+    agreement = {}
+    for model_file in (FP32_FNAME, INT8_FNAME):
+        if not os.path.exists(os.path.join(onnx_dir, model_file)):
+            continue
+        agreement[model_file] = check_agreement(OnnxBgeEmbedding(onnx_dir, model_file=model_file), reference)
+        agreement[model_file]['size_mb'] = round(os.path.getsize(os.path.join(onnx_dir, model_file)) / 2 ** 20, 1)
+        print(f"{model_file} 一致性检查: {agreement[model_file]}")
+    _update_config(onnx_dir, agreement=agreement)
+    return agreement
+
+def export(onnx_dir=None, cache_dir=None, opset=17):
+    """导出float32的ONNX模型和动态int8量化模型，保存分词器，然后检查一致性"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from fastapi_project.util.chat_util import EMBED_MODEL_NAME, load_hf_embedding
+    onnx_dir = onnx_dir or settings.ONNX_MODEL_DIR
+    cache_dir = cache_dir or os.path.abspath("models")
+    os.makedirs(onnx_dir, exist_ok=True)
+    start_time = time.time()
+
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_NAME, cache_dir=cache_dir, local_files_only=True)
+    model = AutoModel.from_pretrained(EMBED_MODEL_NAME, cache_dir=cache_dir, local_files_only=True).eval()
+    model.config.return_dict = False
+    sample = tokenizer(QUERY_SAMPLES[:2], padding=True, return_tensors='pt')
+    # 与BertModel.forward的参数顺序一致
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    fp32_path = os.path.join(onnx_dir, FP32_FNAME)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), fp32_path,
+                          input_names=input_names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    quantize_dynamic(fp32_path, os.path.join(onnx_dir, INT8_FNAME), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(onnx_dir)
+    del model
+    print(f"ONNX模型导出完成: {onnx_dir}，耗时 {time.time() - start_time:.2f} 秒")
+
+    reference = load_hf_embedding(cache_dir)
+    _update_config(
+        onnx_dir,
+        model_name=EMBED_MODEL_NAME,
+        max_length=min(tokenizer.model_max_length, 512)
+    )
+    return check(onnx_dir, reference=reference)
+
+def load_onnx_embedding(onnx_dir=None):
+    """加载已导出且通过一致性检查的ONNX模型，不满足条件时返回None"""
+    onnx_dir = onnx_dir or settings.ONNX_MODEL_DIR
+    model_file = model_file_name()
+    config_path = os.path.join(onnx_dir, CONFIG_FNAME)
+    if not os.path.exists(os.path.join(onnx_dir, model_file)) or not os.path.exists(config_path):
+        print(f"{onnx_dir} 中没有导出的ONNX模型，使用PyTorch模型，可执行onnx_embedding export导出")
+        return None
+    with open(config_path, 'r', encoding='utf-8') as f:
+        agreement = json.load(f).get('agreement', {}).get(model_file)
+    if agreement is None or agreement['min_cosine'] < settings.ONNX_MIN_COSINE:
+        print(f"{model_file} 未通过一致性检查（{agreement}，要求最小余弦相似度 {settings.ONNX_MIN_COSINE}），使用PyTorch模型")
+        return None
+    embed_model = OnnxBgeEmbedding(onnx_dir, model_file=model_file)
+    print(f"成功加载ONNX嵌入模型 {model_file}，一致性检查: {agreement}")
+    return embed_model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bge嵌入模型的ONNX导出和一致性检查")
+    parser.add_argument('command', choices=('export', 'check'))
+    parser.add_argument('--onnx-dir', default=None, help="默认ONNX_MODEL_DIR")
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    if args.command == 'export':
+        export(args.onnx_dir, opset=args.opset)
+    else:
+        check(args.onnx_dir)
@@ -0,0 +1,75 @@
+"""
+进程内共享资源：嵌入模型和三个索引只在应用启动时加载一次，各接口共用
+"""
+import os
+import time
+import threading
+from llama_index.core.settings import Settings
+from fastapi_project.util.chat_util import initialize_llamaindex
+from fastapi_project.util import db_util
+from fastapi_project.settings import settings
+
+STORE_DIR = os.path.join("fastapi_project", "store")
+
+
+class ResourceRegistry:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.llm = None
+        self.embed_model = None
+        self.simple_index = None
+        self.summary_index = None
+        self.news_summary_index = None
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def _timed(self, name, func, *args, **kwargs):
+        start_time = time.time()
+        result = func(*args, **kwargs)
+        self.timings[name] = round(time.time() - start_time, 3)
+        print(f"加载 {name} 耗时 {self.timings[name]} 秒")
+        return result
+
+    def load(self):
+        """加载嵌入模型和索引，重复调用不会重新加载"""
+        with self._lock:
+            if self._loaded:
+                return self
+            start_time = time.time()
+            # 初始化llm和embed模型，同时写入llama_index的全局Settings
+            self.llm, self.embed_model = self._timed(
+                'embed_model', initialize_llamaindex, deepseekapi=settings.DEEPSEEK_API)
+            if settings.EMBED_BATCHING:
+                # 查询向量化经过合并批次和缓存的服务，全局Settings同时替换，索引检索和关键词缓存都使用它
+                from fastapi_project.util.embed_service import BatchingEmbedding
+                self.embed_model = BatchingEmbedding(self.embed_model)
+                Settings.embed_model = self.embed_model
+            self.simple_index = self._timed(
+                'simpleindex', db_util.load_index, os.path.join(self.store_dir, "simpleindex"))
+            self.summary_index = self._timed(
+                'summaryindex', db_util.load_index, os.path.join(self.store_dir, "summaryindex"))
+            self.news_summary_index = self._timed(
+                'news_summaryindex', db_util.load_index, os.path.join(self.store_dir, "news_summaryindex"))
+            self.timings['total'] = round(time.time() - start_time, 3)
+            self._loaded = True
+            return self
+
+    def status(self):
+        return {'loaded': self._loaded, 'timings': dict(self.timings)}
+
+    def embed_stats(self):
+        stats = getattr(self.embed_model, 'stats', None)
+        return stats() if stats is not None else None
+
+    def close(self):
+        close = getattr(self.embed_model, 'close', None)
+        if close is not None:
+            close()
+
+
+registry = ResourceRegistry()
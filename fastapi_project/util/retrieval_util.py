@@ -0,0 +1,103 @@
+"""
+聊天检索编排：关键词提取、ES段落查询和向量检索并发执行
+"""
+import asyncio
+import time
+from fastapi_project.util.chat_util import (
+    get_user_keywords,
+    build_kw_para_prompt
+)
+from fastapi_project.util.es_util import get_es_client
+from fastapi_project.util import db_util
+from fastapi_project.settings import settings
+
+async def run_stage(stage_name, func, *args, timeout=None, default=None, timings=None, **kwargs):
+    """
+    在线程池中执行一个阻塞的检索阶段，并施加超时预算
+
+    Args:
+        stage_name: 阶段名称，用于记录耗时
+        func: 阻塞函数（LLM、ES、向量检索都是同步调用）
+        timeout: 超时时间（秒），None表示不限制
+        default: 超时或出错时返回的默认值
+        timings: 用于记录各阶段耗时的字典
+
+    Returns:
+        func的返回值，超时或出错时返回default
+    """
+    start_time = time.time()
+    try:
+        # 注意：超时只是不再等待结果，后台线程会自然结束
+        return await asyncio.wait_for(asyncio.to_thread(func, *args, **kwargs), timeout)
+    except asyncio.TimeoutError:
+        print(f"{stage_name} 超时（{timeout}秒），按空结果处理")
+        return default
+    except Exception as e:
+        print(f"{stage_name} 失败: {e}")
+        return default
+    finally:
+        if timings is not None:
+            timings[stage_name] = round(time.time() - start_time, 3)
+
+async def run_async_stage(stage_name, coro, timeout=None, default=None, timings=None):
+    """run_stage的协程版本：直接在事件循环中等待coro，施加超时预算"""
+    start_time = time.time()
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        print(f"{stage_name} 超时（{timeout}秒），按空结果处理")
+        return default
+    except Exception as e:
+        print(f"{stage_name} 失败: {e}")
+        return default
+    finally:
+        if timings is not None:
+            timings[stage_name] = round(time.time() - start_time, 3)
+
+async def get_kw_para_prompt(msg_list, timings=None):
+    """
+    提取关键词后，所有关键词通过一个_msearch请求查询ES，返回渲染好的关键词段落prompt
+    """
+    an_kw = await run_stage('keywords', get_user_keywords, msg_list,
+                            timeout=settings.KEYWORD_TIMEOUT,
+                            default={"is_about_ztaofen": False, "keywords": []},
+                            timings=timings)
+    if not an_kw.get('is_about_ztaofen'):
+        return ""
+    kws = an_kw.get('keywords', [])
+    if not kws:
+        return ""
+    # 无论有几个关键词，都只有一次ES往返
+    kw_paragraphs_list = await run_async_stage('es', get_es_client().aget_paras_from_kws(kws),
+                                               timeout=settings.ES_TIMEOUT,
+                                               default=[[] for _ in kws], timings=timings)
+    return build_kw_para_prompt(kws, kw_paragraphs_list)
+
+async def gather_chat_context(msg_list, user_msg, simple_index, doc_sum_index):
+    """
+    并发获取聊天所需的检索信息。
+    向量检索和关键词提取同时开始，关键词提取完成后立刻并发查询ES，
+    最后一个阶段完成时返回，总耗时取决于最慢的那条链路。
+
+    Args:
+        msg_list: 当前会话的消息列表（包含最新的用户发言）
+        user_msg: 当前用户发言
+        simple_index: 加载好的VectorStoreIndex
+        doc_sum_index: 加载好的DocumentSummaryIndex
+
+    Returns:
+        (KW_PARA_PROMPT, res, timings): 关键词段落prompt、向量检索文本、各阶段耗时
+    """
+    timings = {}
+    start_time = time.time()
+    # 复制一份消息列表，避免后续追加回复时影响后台线程
+    history = list(msg_list)
+    KW_PARA_PROMPT, res = await asyncio.gather(
+        get_kw_para_prompt(history, timings=timings),
+        run_stage('vector', db_util.get_final_nodes_text, simple_index, doc_sum_index,
+                  user_query=user_msg, timeout=settings.VECTOR_TIMEOUT,
+                  default="", timings=timings)
+    )
+    timings['total'] = round(time.time() - start_time, 3)
+    print(f"检索各阶段耗时: {timings}")
+    return KW_PARA_PROMPT, res, timings
@@ -0,0 +1,486 @@
+"""
+会话存储：内存LRU/TTL缓存 + 带版本号的持久化后端
+本地测试使用SQLite后端，生产环境使用postgres的message表
+每个会话保存完整的消息列表history，以及较早对话的滚动摘要summary：{'text': 摘要, 'count': 已被摘要的消息数}
+多个uvicorn worker共用同一个后端，后端中的数据为准：
+- 每行带version，每次写入加一；写入时带上本地加载时的版本，版本不一致说明其他worker写入过，
+  此时在后端的历史之后接上本地新增的消息再写入，不会覆盖其他worker的对话
+- get时核对后端的版本，不一致时重新加载；消息列表的修改（set/append）立即写入后端
+"""
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from fastapi_project.util import db_util
+from fastapi_project.settings import settings
+
+
+def _empty_summary():
+    return {'text': '', 'count': 0}
+
+def _loads_summary(summary_json):
+    return json.loads(summary_json) if summary_json else _empty_summary()
+
+
+class SQLiteSessionBackend:
+    """使用SQLite文件保存会话，表结构与postgres的message表一致"""
+
+    def __init__(self, path="fastapi_project/sessions.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        with self._lock:
+            self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS message (
+                user_id TEXT,
+                session_id TEXT,
+                history TEXT,
+                update_time TIMESTAMP,
+                abstract TEXT DEFAULT '这是摘要',
+                summary TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, session_id)
+            )""")
+            # 兼容没有summary、version列的旧数据库文件
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(message)")]
+            if 'summary' not in columns:
+                self._conn.execute("ALTER TABLE message ADD COLUMN summary TEXT")
+            if 'version' not in columns:
+                self._conn.execute("ALTER TABLE message ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._conn.commit()
+
+    def load(self, user_id, session_id):
+        """返回(history, summary, version)，会话不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, summary, version FROM message WHERE user_id = ? AND session_id = ?",
+                (user_id, session_id)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] else []), _loads_summary(row[1]), row[2]
+
+    def version(self, user_id, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM message WHERE user_id = ? AND session_id = ?",
+                                     (user_id, session_id)).fetchone()
+        return None if row is None else row[0]
+
+    def save(self, user_id, session_id, history, summary, version=None):
+        """
+        version为本地加载时的版本，None表示本地新建的会话
+        Returns:
+            写入后的版本；后端的版本已变化（其他worker写入过、会话已存在或已被删除）时返回None
+        """
+        history_json = json.dumps(history, ensure_ascii=False)
+        summary_json = json.dumps(summary, ensure_ascii=False)
+        with self._lock:
+            if version is None:
+                cursor = self._conn.execute("""
+                INSERT INTO message (user_id, session_id, history, summary, update_time, version)
+                VALUES (?, ?, ?, ?, ?, 1) ON CONFLICT (user_id, session_id) DO NOTHING
+                """, (user_id, session_id, history_json, summary_json, datetime.now()))
+            else:
+                cursor = self._conn.execute("""
+                UPDATE message SET history = ?, summary = ?, update_time = ?, version = version + 1
+                WHERE user_id = ? AND session_id = ? AND version = ?
+                """, (history_json, summary_json, datetime.now(), user_id, session_id, version))
+            self._conn.commit()
+        if cursor.rowcount != 1:
+            return None
+        return 1 if version is None else version + 1
+
+    def delete(self, user_id, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM message WHERE user_id = ? AND session_id = ?",
+                               (user_id, session_id))
+            self._conn.commit()
+
+    def list_sessions(self, user_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT session_id, update_time, abstract FROM message WHERE user_id = ?",
+                (user_id,)).fetchall()
+
+    def update_abstract(self, user_id, session_id, abstract):
+        with self._lock:
+            self._conn.execute("UPDATE message SET abstract = ? WHERE user_id = ? AND session_id = ?",
+                               (abstract, user_id, session_id))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresSessionBackend:
+    """使用postgres的message表保存会话，通过db_util的连接池访问"""
+
+    def __init__(self):
+        # 兼容没有summary、version列的旧message表
+        db_util.execute_query("""
+        ALTER TABLE message ADD COLUMN IF NOT EXISTS summary TEXT;
+        ALTER TABLE message ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
+        """)
+
+    def load(self, user_id, session_id):
+        with db_util.transaction() as cursor:
+            cursor.execute("SELECT history, summary, version FROM message WHERE user_id = %s AND session_id = %s",
+                           (user_id, session_id))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] else []), _loads_summary(row[1]), row[2]
+
+    def version(self, user_id, session_id):
+        with db_util.transaction() as cursor:
+            cursor.execute("SELECT version FROM message WHERE user_id = %s AND session_id = %s",
+                           (user_id, session_id))
+            row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def save(self, user_id, session_id, history, summary, version=None):
+        """与SQLiteSessionBackend.save相同，版本不一致时返回None"""
+        history_json = json.dumps(history, ensure_ascii=False)
+        summary_json = json.dumps(summary, ensure_ascii=False)
+        with db_util.transaction() as cursor:
+            if version is None:
+                # message表没有主键，不存在时才插入
+                cursor.execute("""
+                INSERT INTO message (user_id, session_id, history, summary, version)
+                SELECT %s, %s, %s, %s, 1
+                WHERE NOT EXISTS (SELECT 1 FROM message WHERE user_id = %s AND session_id = %s)
+                """, (user_id, session_id, history_json, summary_json, user_id, session_id))
+            else:
+                cursor.execute("""
+                UPDATE message SET history = %s, summary = %s, update_time = CURRENT_TIMESTAMP, version = version + 1
+                WHERE user_id = %s AND session_id = %s AND version = %s
+                """, (history_json, summary_json, user_id, session_id, version))
+            # 旧message表可能有重复行，只要有更新就算写入成功
+            if cursor.rowcount == 0:
+                return None
+        return 1 if version is None else version + 1
+
+    def delete(self, user_id, session_id):
+        db_util.execute_query("DELETE FROM message WHERE user_id = %s AND session_id = %s",
+                              (user_id, session_id))
+
+    def list_sessions(self, user_id):
+        return db_util.execute_query(
+            "SELECT session_id, update_time, abstract FROM message WHERE user_id = %s",
+            (user_id,)) or []
+
+    def update_abstract(self, user_id, session_id, abstract):
+        db_util.execute_query("UPDATE message SET abstract = %s WHERE user_id = %s AND session_id = %s",
+                              (abstract, user_id, session_id))
+
+    def close(self):
+        pass
+
+
+def _new_entry(history, summary, version=None):
+    # base：history中已写入后端（版本为version）的消息数，之后的是本地新增的消息
+    return {'history': history, 'summary': summary, 'version': version,
+            'base': len(history) if version is not None else 0, 'last_access': time.time()}
+
+
+class SessionStore:
+    """
+    会话存储
+    - 内存层：按(user_id, session_id)缓存消息列表，超过max_sessions时淘汰最久未使用的会话，
+      超过ttl秒未访问的会话也会被淘汰
+    - 持久层：set/append立即写入后端；摘要的修改和写入失败的会话标记为dirty，
+      由后台线程每flush_interval秒写入后端；淘汰的dirty会话先移入_evicted，在锁外写入后端，
+      写入失败时保留并在下次flush时重试，写入完成前再次访问会直接取回内存中的数据
+    - 会话在第一次访问时才从后端加载，之后每次get核对后端的版本
+    """
+
+    def __init__(self, backend, max_sessions=1000, ttl=1800, flush_interval=5.0):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # (user_id, session_id) -> {'history': [...], 'summary': {...}, 'version', 'base', 'last_access'}
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._evicted = {}  # 已淘汰但还未写入后端的会话
+        self._deleted = set()  # 已删除的会话，删除时正在写入的会话写入后再删除一次
+        self._lock = threading.RLock()
+        # 同一个会话的写入串行执行，不同会话按key分到不同的锁上
+        self._save_locks = [threading.Lock() for _ in range(64)]
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(target=self._write_behind_loop, daemon=True)
+        self._writer.start()
+
+    def get(self, user_id, session_id, create=False):
+        """获取会话的消息列表；会话不存在时返回None，create=True时创建空会话"""
+        return self._get(user_id, session_id, create=create, refresh=True)
+
+    def _get(self, user_id, session_id, create=False, refresh=False):
+        """refresh=True时核对后端的版本，其他worker写入或删除过该会话时重新加载"""
+        key = (user_id, session_id)
+        history, cached_version = None, None
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                entry = self._evicted.pop(key, None)
+                if entry is not None:
+                    # 淘汰后还没写入后端，后端中的数据是旧的，直接放回缓存
+                    self._put(key, entry)
+                    self._dirty.add(key)
+            if entry is not None:
+                entry['last_access'] = time.time()
+                self._cache.move_to_end(key)
+                # 本地有未写入的修改时以本地为准，写入时再与后端合并
+                if not refresh or key in self._dirty or entry['version'] is None:
+                    history = entry['history']
+                    entry = None
+                else:
+                    cached_version = entry['version']
+        if history is not None:
+            self._flush_evicted()
+            return history
+        if entry is not None and self.backend.version(user_id, session_id) == cached_version:
+            return entry['history']
+        # 缓存未命中或已过期时从后端加载，加载过程不持有锁
+        loaded = self.backend.load(user_id, session_id)
+        with self._lock:
+            current = self._cache.get(key)
+            # 加载期间可能已有其他请求写入了该会话
+            if current is not None and (current is not entry or key in self._dirty):
+                return current['history']
+            if loaded is None:
+                if current is not None:
+                    # 其他worker删除了该会话
+                    self._cache.pop(key)
+                if not create:
+                    return None
+                self._deleted.discard(key)
+                current = _new_entry([], _empty_summary())
+                self._put(key, current)
+                self._dirty.add(key)
+            else:
+                history, summary, version = loaded
+                if current is None:
+                    current = _new_entry(history, summary, version)
+                    self._put(key, current)
+                else:
+                    # 原地更新，调用方持有的列表也能看到最新的历史
+                    current['history'][:] = history
+                    current.update(summary=summary, version=version, base=len(history))
+            history = current['history']
+        self._flush_evicted()
+        return history
+
+    def set(self, user_id, session_id, history):
+        """替换会话的消息列表并立即写入后端，其他worker随后读取时能拿到这一轮对话"""
+        key = (user_id, session_id)
+        # 会话可能已被淘汰，先重新载入，保留已保存的滚动摘要和版本
+        self._get(user_id, session_id, create=True)
+        with self._lock:
+            entry = self._cache.get(key) or self._evicted.pop(key, None)
+            if entry is None:
+                entry = _new_entry(history, _empty_summary())
+            entry['history'] = history
+            if self._cache.get(key) is not entry:
+                self._put(key, entry)
+            self._dirty.add(key)
+            self._deleted.discard(key)
+        self.flush([key])
+
+    def get_summary(self, user_id, session_id):
+        """获取会话的滚动摘要 {'text': ..., 'count': ...}"""
+        self._get(user_id, session_id, create=True)
+        with self._lock:
+            entry = self._cache.get((user_id, session_id))
+            return dict(entry['summary']) if entry is not None else _empty_summary()
+
+    def set_summary(self, user_id, session_id, summary):
+        """摘要的修改由后台线程或下一次set写入后端"""
+        key = (user_id, session_id)
+        self._get(user_id, session_id, create=True)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return
+            entry['summary'] = summary
+            self._dirty.add(key)
+
+    def append(self, user_id, session_id, message):
+        key = (user_id, session_id)
+        history = self._get(user_id, session_id, create=True)
+        with self._lock:
+            history.append(message)
+            self._dirty.add(key)
+        self.flush([key])
+
+    def create(self, user_id, session_id):
+        """创建空会话并立即写入后端，使其马上出现在历史列表中"""
+        self.set(user_id, session_id, [])
+
+    def delete(self, user_id, session_id):
+        key = (user_id, session_id)
+        with self._lock:
+            self._cache.pop(key, None)
+            self._evicted.pop(key, None)
+            self._dirty.discard(key)
+            self._deleted.add(key)
+        self.backend.delete(user_id, session_id)
+
+    def user_sessions(self, user_id):
+        """返回内存中该用户的所有会话 {session_id: history}"""
+        with self._lock:
+            return {sid: entry['history'] for (uid, sid), entry in self._cache.items() if uid == user_id}
+
+    def list_sessions(self, user_id):
+        """列出后端中该用户的会话 [(session_id, update_time, abstract)]，先写入该用户未落盘的修改"""
+        with self._lock:
+            keys = [key for key in self._dirty if key[0] == user_id]
+            keys.extend(key for key in self._evicted if key[0] == user_id)
+        self.flush(keys)
+        return self.backend.list_sessions(user_id)
+
+    def update_abstract(self, user_id, session_id, abstract):
+        self.backend.update_abstract(user_id, session_id, abstract)
+
+    def flush(self, keys=None):
+        """把dirty的会话写入后端，keys为None时写入全部"""
+        with self._lock:
+            dirty_keys = list(self._dirty) if keys is None else [key for key in keys if key in self._dirty]
+            pending = []
+            for key in dirty_keys:
+                self._dirty.discard(key)
+                entry = self._cache.get(key)
+                if entry is not None:
+                    pending.append((key, entry))
+        for key, entry in pending:
+            try:
+                self._save(key, entry)
+            except Exception as e:
+                print(f"会话 {key[0]}/{key[1]} 写入失败，稍后重试: {e}")
+                with self._lock:
+                    if self._cache.get(key) is entry:
+                        self._dirty.add(key)
+        return len(pending) + self._flush_evicted(keys)
+
+    def _save(self, key, entry, max_attempts=3):
+        """
+        把一个会话写入后端
+        后端的版本与本地不一致（其他worker写入过）时，在后端的历史之后接上本地新增的消息，摘要取较新的一份，再写入；
+        本地加载后会话在后端被删除的，不再写入
+        """
+        with self._save_locks[hash(key) % len(self._save_locks)]:
+            with self._lock:
+                history, summary = list(entry['history']), dict(entry['summary'])
+                version, base = entry['version'], entry['base']
+            local_base, remote_history = base, None
+            for _ in range(max_attempts):
+                new_version = self.backend.save(key[0], key[1], history, summary, version)
+                if new_version is not None:
+                    break
+                loaded = self.backend.load(key[0], key[1])
+                if loaded is None:
+                    if version is None:
+                        continue
+                    print(f"会话 {key[0]}/{key[1]} 已被删除，不再写入")
+                    with self._lock:
+                        if self._cache.get(key) is entry:
+                            self._cache.pop(key)
+                        self._dirty.discard(key)
+                    return
+                remote_history, remote_summary, version = loaded
+                history = remote_history + history[base:]
+                if remote_summary.get('count', 0) > summary.get('count', 0):
+                    summary = remote_summary
+                base = len(remote_history)
+            else:
+                raise RuntimeError("其他worker同时在写入该会话")
+            with self._lock:
+                if remote_history is not None:
+                    # 写入期间本地新追加的消息保留在最后
+                    entry['history'][:] = remote_history + entry['history'][local_base:]
+                    entry['summary'] = summary
+                entry['version'] = new_version
+                entry['base'] = len(history)
+                deleted = key in self._deleted
+        if deleted:
+            # 写入过程中会话被删除
+            self.backend.delete(key[0], key[1])
+
+    def _flush_evicted(self, keys=None):
+        """把已淘汰的会话写入后端，写入在锁外进行；失败的会话保留在_evicted中，下次重试"""
+        with self._lock:
+            if not self._evicted:
+                return 0
+            pending = [(key, entry) for key, entry in self._evicted.items() if keys is None or key in keys]
+        saved = 0
+        for key, entry in pending:
+            try:
+                self._save(key, entry)
+                saved += 1
+                with self._lock:
+                    # 写入期间会话可能已被重新访问并放回缓存
+                    if self._evicted.get(key) is entry:
+                        del self._evicted[key]
+            except Exception as e:
+                print(f"淘汰会话 {key} 时写入失败，稍后重试: {e}")
+        return saved
+
+    def stats(self):
+        with self._lock:
+            return {'cached_sessions': len(self._cache), 'dirty_sessions': len(self._dirty),
+                    'evicted_unsaved': len(self._evicted)}
+
+    def close(self):
+        self._stop_event.set()
+        self._writer.join(timeout=self.flush_interval + 1)
+        self.flush()
+        self.backend.close()
+
+    def _put(self, key, entry):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_sessions:
+            self._evict(next(iter(self._cache)))
+
+    def _evict(self, key):
+        """从缓存中移除会话，未落盘的会话移入_evicted，由_flush_evicted在锁外写入"""
+        entry = self._cache.pop(key)
+        if key in self._dirty:
+            self._dirty.discard(key)
+            self._evicted[key] = entry
+
+    def _evict_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._cache.items() if now - entry['last_access'] > self.ttl]
+            for key in expired:
+                self._evict(key)
+        self._flush_evicted()
+        return len(expired)
+
+    def _write_behind_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._evict_expired()
+            except Exception as e:
+                print(f"会话后台写入出错: {e}")
+
+
+def create_session_store():
+    """根据settings.SESSION_BACKEND创建会话存储"""
+    if settings.SESSION_BACKEND == "sqlite":
+        backend = SQLiteSessionBackend(settings.SESSION_SQLITE_PATH)
+    elif settings.SESSION_BACKEND == "postgres":
+        backend = PostgresSessionBackend()
+    else:
+        raise ValueError(f"不支持的会话后端: {settings.SESSION_BACKEND}")
+    return SessionStore(
+        backend,
+        max_sessions=settings.SESSION_CACHE_SIZE,
+        ttl=settings.SESSION_TTL,
+        flush_interval=settings.SESSION_FLUSH_INTERVAL
+    )
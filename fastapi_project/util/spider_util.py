@@ -1,34 +1,155 @@
-from .db_util import execute_query,write_to_article
+from .db_util import write_to_article,bulk_insert
 from ..settings import settings
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 import time
 import psycopg2
 from psycopg2 import Error
 # 结合 Selenium 和 Trafilatura 的完整解决方案
 import time
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from openai import OpenAI
+from .llm_gateway import get_llm_gateway
+from .crawler_engine import CrawlerEngine, BrowserPool, wait_for_page, is_driver_broken
+from .fetch_util import fetch_pages
+from .dedup_util import get_dedup_store, simhash
+from .crawl_batch import start_batch, finish_batch
+import threading
+import importlib.util
+import re
+import json
+import random
+import asyncio
+from copy import deepcopy
 
-def selenium_trafilatura_extract(url, driver=None, wait_time=3, save_html=False):
+#可选的提取输出：basic/advanced/json为正文（对应不同的trafilatura参数），metadata为元数据
+#调用方通过outputs声明需要哪些，页面只解析一次，没声明的输出不计算
+EXTRACTION_PROFILES = {
+    'basic': {},
+    'advanced': {
+        'favor_precision': True,    # 提高精确度
+        'favor_recall': False,      # 降低召回率，提高质量
+        'include_comments': False,  # 不包含评论
+        'include_tables': True,     # 包含表格
+        'include_formatting': True, # 保留基本格式
+        'include_links': False,     # 不包含链接
+        'include_images': False     # 不包含图片
+    },
+    'json': {
+        'output_format': 'json',    # JSON格式输出
+        'include_formatting': True
+    }
+}
+ALL_OUTPUTS = ('basic', 'advanced', 'json', 'metadata')
+#爬取热点新闻时只用到高级提取的正文和元数据
+ARTICLE_OUTPUTS = ('advanced', 'metadata')
+
+def trafilatura_extract_html(html_content, url, page_title=None, html_file_path=None, outputs=ALL_OUTPUTS):
+    """
+    用 Trafilatura 从已获取的HTML中提取中文内容，浏览器渲染和HTTP直接抓取的页面共用
+
+    Args:
+        html_content (str|bytes): 页面HTML，bytes时由trafilatura识别编码
+        url (str): 页面URL
+        page_title (str): 浏览器中的页面标题，None时使用提取到的标题
+        outputs (tuple): 需要的输出，取自ALL_OUTPUTS
+
+    Returns:
+        dict: 包含提取内容和元数据的字典，未请求的输出为None
+    """
+    try:
+        import trafilatura
+        from trafilatura.utils import load_html
+    except ImportError:
+        return {
+            'success': False,
+            'error': 'trafilatura未安装，请运行: pip install trafilatura',
+            'url': url
+        }
+    
+    # 使用 Trafilatura 提取内容
+    print("🔍 使用 Trafilatura 提取内容...")
+    
+    # HTML只解析一次，各个输出共用解析好的DOM树
+    tree = load_html(html_content)
+    if tree is None:
+        return {
+            'success': False,
+            'error': 'HTML解析失败',
+            'url': url
+        }
+    
+    # 提取元数据（只读取DOM树，要在正文提取修改DOM树之前进行）
+    metadata = trafilatura.extract_metadata(tree, default_url=url) if 'metadata' in outputs else None
+    
+    # 正文提取会清理DOM树，最后一个输出直接使用原树，其余使用副本
+    texts = {}
+    text_outputs = [name for name in EXTRACTION_PROFILES if name in outputs]
+    for i, name in enumerate(text_outputs):
+        source = tree if i == len(text_outputs) - 1 else deepcopy(tree)
+        texts[name] = trafilatura.extract(source, url=url, **EXTRACTION_PROFILES[name])
+    extracted_text = texts.get('basic')
+    advanced_text = texts.get('advanced')
+    structured_data = texts.get('json')
+    main_text = extracted_text or advanced_text
+    
+    # 组织返回结果
+    result = {
+        'success': True,
+        'url': url,
+        'page_title': page_title or (metadata.title if metadata else None),
+        'selenium_title': page_title,
+        'extracted_title': metadata.title if metadata else page_title,
+        'basic_text': extracted_text,
+        'advanced_text': advanced_text,
+        'structured_data': structured_data,
+        'metadata': {
+            'title': metadata.title if metadata else None,
+            'author': metadata.author if metadata else None,
+            'date': metadata.date if metadata else None,
+            'description': metadata.description if metadata else None,
+            'sitename': metadata.sitename if metadata else None,
+            'language': metadata.language if metadata else None,
+            'url': metadata.url if metadata else url
+        },
+        'statistics': {
+            'html_length': len(html_content),
+            'basic_text_length': len(extracted_text) if extracted_text else 0,
+            'advanced_text_length': len(advanced_text) if advanced_text else 0,
+            'has_content': bool(main_text and len(main_text) > 50)
+        },
+        'html_file_path': html_file_path,
+        'processing_time': time.time()
+    }
+    
+    # 输出提取结果摘要
+    if main_text:
+        print(f"✅ 内容提取成功!")
+        print(f"   基础提取: {len(extracted_text) if extracted_text else 0} 字符")
+        print(f"   高级提取: {len(advanced_text) if advanced_text else 0} 字符")
+        print(f"   提取标题: {result['extracted_title']}")
+        print(f"   内容预览: {main_text[:100]}...")
+    else:
+        print(f"❌ 内容提取失败或内容为空")
+        result['success'] = False
+        result['error'] = '提取的内容为空'
+    
+    return result
+
+def selenium_trafilatura_extract(url, driver=None, wait_time=3, save_html=False, outputs=ALL_OUTPUTS):
     """
     使用 Selenium 获取网页 HTML，然后用 Trafilatura 提取中文内容
     
     Args:
         url (str): 目标网页URL
         driver: Selenium WebDriver对象，如果为None会创建新的
-        wait_time (int): 页面加载等待时间（秒）
+        wait_time (int): 页面加载的最长等待时间（秒），页面就绪后立即继续
         save_html (bool): 是否保存HTML文件到本地
+        outputs (tuple): 需要的提取输出，见trafilatura_extract_html
     
     Returns:
         dict: 包含提取内容和元数据的字典
     """
     
-    # 检查是否安装了trafilatura
-    try:
-        import trafilatura
-    except ImportError:
+    # 检查是否安装了trafilatura，未安装时不必启动浏览器
+    if importlib.util.find_spec('trafilatura') is None:
         return {
             'success': False,
             'error': 'trafilatura未安装，请运行: pip install trafilatura',
@@ -63,15 +184,8 @@ def selenium_trafilatura_extract(url, driver=None, wait_time=3, save_html=False)
         # 访问网页
         driver.get(url)
         
-        # 等待页面加载
-        time.sleep(wait_time)
-        
-        # 等待body元素加载完成
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-        except:
+        # 显式等待页面就绪和body元素加载完成，不再固定等待
+        if not wait_for_page(driver, css="body", timeout=wait_time):
             print("⚠️ 页面加载可能不完整，继续处理...")
         
         # 获取页面标题
@@ -100,78 +214,13 @@ def selenium_trafilatura_extract(url, driver=None, wait_time=3, save_html=False)
             except Exception as e:
                 print(f"⚠️ HTML保存失败: {e}")
         
-        # 使用 Trafilatura 提取内容
-        print("🔍 使用 Trafilatura 提取内容...")
-        
-        # 基础文本提取
-        extracted_text = trafilatura.extract(html_content)
-        
-        # 提取元数据
-        metadata = trafilatura.extract_metadata(html_content)
-        
-        # 高级提取（包含更多选项）
-        advanced_text = trafilatura.extract(
-            html_content,
-            favor_precision=True,    # 提高精确度
-            favor_recall=False,      # 降低召回率，提高质量
-            include_comments=False,  # 不包含评论
-            include_tables=True,     # 包含表格
-            include_formatting=True, # 保留基本格式
-            include_links=False,     # 不包含链接
-            include_images=False     # 不包含图片
-        )
-        
-        # 提取结构化数据
-        structured_data = trafilatura.extract(
-            html_content,
-            output_format='json',    # JSON格式输出
-            include_formatting=True
-        )
-        
-        # 组织返回结果
-        result = {
-            'success': True,
-            'url': url,
-            'page_title': page_title,
-            'selenium_title': page_title,
-            'extracted_title': metadata.title if metadata else page_title,
-            'basic_text': extracted_text,
-            'advanced_text': advanced_text,
-            'structured_data': structured_data,
-            'metadata': {
-                'title': metadata.title if metadata else None,
-                'author': metadata.author if metadata else None,
-                'date': metadata.date if metadata else None,
-                'description': metadata.description if metadata else None,
-                'sitename': metadata.sitename if metadata else None,
-                'language': metadata.language if metadata else None,
-                'url': metadata.url if metadata else url
-            },
-            'statistics': {
-                'html_length': len(html_content),
-                'basic_text_length': len(extracted_text) if extracted_text else 0,
-                'advanced_text_length': len(advanced_text) if advanced_text else 0,
-                'has_content': bool(extracted_text and len(extracted_text) > 50)
-            },
-            'html_file_path': html_file_path,
-            'processing_time': time.time()
-        }
-        
-        # 输出提取结果摘要
-        if extracted_text:
-            print(f"✅ 内容提取成功!")
-            print(f"   基础提取: {len(extracted_text)} 字符")
-            print(f"   高级提取: {len(advanced_text) if advanced_text else 0} 字符")
-            print(f"   提取标题: {result['extracted_title']}")
-            print(f"   内容预览: {extracted_text[:100]}...")
-        else:
-            print(f"❌ 内容提取失败或内容为空")
-            result['success'] = False
-            result['error'] = '提取的内容为空'
-        
-        return result
+        return trafilatura_extract_html(html_content, url, page_title=page_title,
+                                        html_file_path=html_file_path, outputs=outputs)
         
     except Exception as e:
+        # 浏览器已失效时交给调用方（CrawlerEngine）丢弃该浏览器并重试
+        if not driver_created and is_driver_broken(e):
+            raise
         error_msg = f"处理过程中出错: {str(e)}"
         print(f"❌ {error_msg}")
         return {
@@ -257,239 +306,214 @@ def batch_selenium_trafilatura_extract(urls, driver=None, wait_time=3, max_urls=
     return results
 
 
-def get_baidu_hot_news():
-    # 优化Chrome启动配置，提高启动速度
-    options = webdriver.ChromeOptions()
-    # 基础性能优化选项
-    options.add_argument('--headless') #不需要界面
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--disable-web-security')
-    options.add_argument('--disable-features=VizDisplayCompositor')
-    # 网络和更新相关优化
-    options.add_argument('--disable-background-networking')
-    options.add_argument('--disable-background-timer-throttling')
-    options.add_argument('--disable-backgrounding-occluded-windows')
-    options.add_argument('--disable-component-update')
-    options.add_argument('--disable-default-apps')
-    options.add_argument('--disable-extensions')
-    # 日志和崩溃报告优化
-    options.add_argument('--disable-logging')
-    options.add_argument('--disable-crash-reporter')
-    # 如果不需要界面可以启用无头模式（会更快）
-    # options.add_argument('--headless')
-
-    with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-        f.write("🚀 正在启动Chrome浏览器...\n")
-    start_time = time.time()
-    driver = webdriver.Chrome(options=options)
-    end_time = time.time()
-    with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-        f.write(f"✅ Chrome启动完成，耗时: {end_time - start_time:.2f} 秒\n")
-
-    driver.implicitly_wait(0.5)
-    #进入首页找到热点页面
-    #进入百度页面
-    driver.get("https://www.baidu.com")
-    # 使用CSS选择器定位a标签，然后获取href属性
-    # 根据图片中的HTML结构，a标签有class="title-content tag-width c-link c-font-medium c-line-clamp1"
-    #urls = driver.find_elements(by=By.CSS_SELECTOR, value="a.title-content.tag-width.c-link.c-font-medium.c-line-clamp1")
-    urls = driver.find_elements(by=By.CSS_SELECTOR, value="a.title-content.c-link.c-font-medium.c-line-clamp1")
-    #urls =urls+urls2
-    specific_news = {}
-    #获取百度首页的热点url列表
-    hot_href_list = []  #每一个打开都是具体热点新闻页面
-    hot_text_list = []
-    specific_news = {}
-    for url in urls:
-        text = url.text
-        href = url.get_attribute('href')
-        hot_href_list.append(href)
-        hot_text_list.append(text)
-    href_value_list=[]
-    for url,hot_text in zip(hot_href_list,hot_text_list):
-        #打开热点列表中的一个
-        driver.get(url)
-        time.sleep(1)
-        #获取"更多消息"的url
-        # 获取页面第一个h3标签（class='t'），然后获取该h3标签中的a标签的href值
-        #这是普通的查看更多消息url
-        try:
-                # 使用CSS选择器定位第一个class为't'的h3标签
-            h3_element = driver.find_element(by=By.CSS_SELECTOR, value="h3.t")
-            
-            # 在h3标签内查找a标签
-            a_element = h3_element.find_element(by=By.TAG_NAME, value="a")
-            
-            # 获取a标签的href属性值
-            href_value = a_element.get_attribute('href')
-            # href_value_list.append(href_value)
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f'更多消息 {href_value}\n')
-        except Exception as e:
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"获取元素时出错: {e}\n")
-            href_value = None
+_log_lock = threading.Lock()
+
+def _log(msg):
+    #多个浏览器线程同时写日志，加锁避免内容交错
+    with _log_lock:
+        with open('selenium_log.txt', 'a', encoding='utf-8') as f:
+            f.write(msg)
+
+def _collect_topic_news(engine, driver, hot_item):
+    """在一个浏览器中处理一个热点：分别从"更多消息"和"查看完整"两个入口收集新闻(url, 标题)"""
+    url, hot_text = hot_item
+    single_new_list = []
+    #打开热点列表中的一个
+    engine.get(driver, url, css="h3.t")
+    #获取"更多消息"的url
+    # 获取页面第一个h3标签（class='t'），然后获取该h3标签中的a标签的href值
+    #这是普通的查看更多消息url
+    try:
+        # 使用CSS选择器定位第一个class为't'的h3标签
+        h3_element = driver.find_element(by=By.CSS_SELECTOR, value="h3.t")
+        # 在h3标签内查找a标签，获取a标签的href属性值
+        a_element = h3_element.find_element(by=By.TAG_NAME, value="a")
+        href_value = a_element.get_attribute('href')
+        _log(f'更多消息 {href_value}\n')
+    except Exception as e:
+        if is_driver_broken(e):
+            raise
+        _log(f"获取元素时出错: {e}\n")
+        href_value = None
+    if href_value:
+        engine.get(driver, href_value, css="[aria-label]")
+        _log(f'进入热点{hot_text}页面\n')
+        _log(f"更多消息页面标题: {driver.title}\n")
+        # 获取页面所有包含aria-label属性的元素
+        elements_with_aria_label = driver.find_elements(by=By.CSS_SELECTOR, value="[aria-label]")
+        _log(f"找到 {len(elements_with_aria_label)} 个包含aria-label属性的元素\n" + "=" * 80 + "\n")
+        # 检查元素结构，寻找a标签-span标签-span标签-span标签的模式
+        for i, element in enumerate(elements_with_aria_label, 1):
+            # 从第三个元素开始检查，并确保有足够的后续元素
+            if i >= 2 and i + 3 <= len(elements_with_aria_label):
+                current_element = element
+                next_element_1 = elements_with_aria_label[i]
+                next_element_2 = elements_with_aria_label[i+1]
+                next_element_3 = elements_with_aria_label[i+2]
+                # 检查是否符合 a-span-span-span 的模式
+                if (current_element.tag_name == 'a' and next_element_1.tag_name == 'span' and
+                    next_element_2.tag_name == 'span' and next_element_3.tag_name == 'span'):
+                    try:
+                        # 获取第一个a标签的href和text
+                        a_href = current_element.get_attribute('href')
+                        a_text = current_element.text.strip()
+                        # 获取第二个span标签的aria-label值（发布时间）
+                        second_span_aria_label = next_element_1.get_attribute('aria-label')
+                        _log(f"{second_span_aria_label}\n")
+                        if second_span_aria_label and (('天' in second_span_aria_label) or ('小时' in second_span_aria_label) or ('分钟' in second_span_aria_label)):
+                            _log('--加入列表--\n')
+                            single_new_list.append((a_href,a_text))
+                    except Exception as e:
+                        if is_driver_broken(e):
+                            raise
+                        _log(f"处理符合模式的元素组时出错: {e}\n")
+    if not single_new_list:
+        _log(f'{hot_text}查看更多模式下没有找到符合循环模式的新闻url\n')
+    #再次打开热点页面，获取查看完整新闻模式的url
+    complete_list = []
+    engine.get(driver, url, css="[aria-label]")
+    try:
+        # 获取新页面中第一个有aria-label属性，且属性值中有'查看完整'的a标签中，取得a标签的href值
+        href_value = None
+        for element in driver.find_elements(by=By.CSS_SELECTOR, value="a[aria-label]"):
+            aria_label_value = element.get_attribute('aria-label')
+            if aria_label_value and '查看完整' in aria_label_value:
+                href_value = element.get_attribute('href')
+                _log(f"找到包含'查看完整'的a标签，href: {href_value}\n")
+                break
+        _log(f"查看完整模式下找到的新闻列表入口，href: {href_value}\n")
         if href_value:
-            driver.get(href_value)
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f'进入热点{hot_text}页面\n')
-            title = driver.title
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"更多消息页面标题: {title}\n")
-            # 获取页面所有包含aria-label属性的元素
-            elements_with_aria_label = driver.find_elements(by=By.CSS_SELECTOR, value="[aria-label]")
-
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"找到 {len(elements_with_aria_label)} 个包含aria-label属性的元素\n")
-                f.write("=" * 80 + "\n")
-            single_new_list=[]
-            # 遍历每个元素并打印其原始HTML代码
-            for i, element in enumerate(elements_with_aria_label, 1):
-                # try:
-                #     # 获取元素的aria-label属性值
-                #     aria_label_value = element.get_attribute('aria-label')
-                #     # 获取元素的原始HTML代码
-                #     html_code = element.get_attribute('outerHTML')
-                    
-                #     # 将数据写入txt文件
-                #     with open('aria_label_data.txt', 'a', encoding='utf-8') as f:
-                #         f.write(f"元素 {i}:\n")
-                #         f.write(f"aria-label值: {aria_label_value}\n")
-                #         f.write(f"HTML代码: {html_code}\n")
-                #         f.write("-" * 50 + "\n")
-                # except Exception as e:
-                #     print(f"处理第 {i} 个元素时出错: {e}")
-                #     print("-" * 50)    
-                # 检查元素结构，寻找a标签-span标签-span标签-span标签的模式
-                if i >= 2:  # 从第三个元素开始检查
-                    # 检查当前元素及其后3个元素是否形成a-span-span-span模式
-                    if i + 3 <= len(elements_with_aria_label):  # 确保有足够的后续元素
-                        current_element = element
-                        next_element_1 = elements_with_aria_label[i]  # 当前元素
-                        next_element_2 = elements_with_aria_label[i+1]  # 后一个元素
-                        next_element_3 = elements_with_aria_label[i+2]  # 后两个元素
-                        
-                        # 检查标签类型
-                        current_tag = current_element.tag_name
-                        next_tag_1 = next_element_1.tag_name
-                        next_tag_2 = next_element_2.tag_name
-                        next_tag_3 = next_element_3.tag_name
-                        
-                        # 检查是否符合 a-span-span-span 的模式
-                        if (current_tag == 'a' and next_tag_1 == 'span' and 
-                            next_tag_2 == 'span' and next_tag_3 == 'span'):
-                            
-                            try:
-                                # 获取第一个a标签的href和text
-                                a_href = current_element.get_attribute('href')
-                                a_text = current_element.text.strip()
-                                
-                                # 获取第二个span标签的aria-label值
-                                second_span_aria_label = next_element_1.get_attribute('aria-label')
-                                with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                                    f.write(f"{second_span_aria_label}\n")
-                                
-                                # 将符合条件的数据写入文件
-                                with open('filtered_aria_label_data.txt', 'a', encoding='utf-8') as f:
-                                    f.write(f"符合模式的元素组 {i//4}:\n")
-                                    f.write(f"a标签href: {a_href}\n")
-                                    f.write(f"a标签text: {a_text}\n")
-                                    f.write(f"第二个span的aria-label: {second_span_aria_label}\n")
-                                    f.write("=" * 50 + "\n")
-                                
-                                # print(f"找到符合模式的元素组 {i//4}: a标签href={a_href}, text={a_text}, 第二个span的aria-label={second_span_aria_label}")
-                                if second_span_aria_label and (('天' in second_span_aria_label) or ('小时' in second_span_aria_label) or ('分钟' in second_span_aria_label)):
-                                    with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                                        f.write('--加入列表--\n')
-                                    single_new_list.append((href_value,a_text))
-                            except Exception as e:
-                                with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                                    f.write(f"处理符合模式的元素组时出错: {e}\n")
-        if len(single_new_list)>0:
-                specific_news[hot_text]=single_new_list
+            engine.get(driver, href_value, css="a[class*='content']")
+        # 获取页面所有class中含有content的a标签（class包含content但不一定完全等于content）
+        for element in driver.find_elements(by=By.CSS_SELECTOR, value="a[class*='content']"):
+            complete_list.append((element.get_attribute('href'),element.text.strip()))
+        if complete_list:
+            _log(f'{hot_text}查看完整模式下找到符合循环模式的新闻url：\n{complete_list}\n')
         else:
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f'{hot_text}查看更多模式下没有找到符合循环模式的新闻url\n')
-        #再次打开页面，获取查看完整新闻模式的url
-        #打开热点列表中的一个
-        single_new_list=[]
-        driver.get(url)
-        time.sleep(1)
+            _log(f'{hot_text}查看完整模式下没有找到符合循环模式的新闻url\n')
+    except Exception as e:
+        if is_driver_broken(e):
+            raise
+        _log(f"处理查看完整模式时出错: {e}\n")
+    return single_new_list + complete_list
+
+def _to_info(res, min_length=0):
+    """提取结果转为(页面标题、文本、作者、网址、链接、日期、长度)，正文为空或少于min_length字时返回None"""
+    if not res.get('advanced_text') or res['statistics']['advanced_text_length'] < min_length:
+        return None
+    return (res['page_title'],res['advanced_text'],res['metadata']['author'],res['metadata']['sitename'],res['url'],res['metadata']['date'],res['statistics']['advanced_text_length'])
+
+def _extract_article(engine, driver, url):
+    """在浏览器中打开新闻页面并提取正文"""
+    with engine.limiter.limit(url):
+        res = selenium_trafilatura_extract(url=url,driver=driver,outputs=ARTICLE_OUTPUTS)
+    if 'advanced_text' not in res:
+        print(f" {res.get('error')}")
+        return None
+    return _to_info(res)
+
+def extract_articles(urls, engine, dedup_store=None):
+    """
+    先用HTTP直接抓取静态页面提取正文，提取不到正文的页面再交给浏览器池渲染
+    提供dedup_store时，最近抓取过的url直接复用库中的文章；更早抓取过的url重新验证，页面未修改(304)时复用库中的文章
+
+    Returns:
+        list: 与urls顺序一致的(页面标题、文本、作者、网址、链接、日期、长度)，失败为None
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    results = {}
+    stored = {}
+    if dedup_store is not None:
         try:
-            # 获取新页面中第一个有aria-label属性，且属性值中有'查看完整'的a标签中，取得a标签的href值
-            elements_with_aria_label = driver.find_elements(by=By.CSS_SELECTOR, value="[aria-label]")
-            # 查找第一个包含'查看完整'的a标签
-            for element in elements_with_aria_label:
-                aria_label_value = element.get_attribute('aria-label')
-                tag_name = element.tag_name
-                # 检查是否是a标签且aria-label包含'查看完整'
-                if tag_name == 'a' and aria_label_value and '查看完整' in aria_label_value:
-                    href_value = element.get_attribute('href')
-                    with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                        f.write(f"找到包含'查看完整'的a标签，href: {href_value}\n")
-                    break
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"查看完整模式下找到的新闻列表入口，href: {href_value}\n")
-            if href_value:
-                driver.get(href_value)
-                time.sleep(1)
-            # 获取页面所有class中含有content的a标签（class包含content但不一定完全等于content）
-            elements_with_content_class = driver.find_elements(by=By.CSS_SELECTOR, value="a[class*='content']")
-            for element in elements_with_content_class:
-                href_value = element.get_attribute('href')
-                text_content = element.text.strip()
-                single_new_list.append((href_value,text_content))
-                # class_value = element.get_attribute('class')
-                # html_code = element.get_attribute('outerHTML')
-                # with open('content_class_data.txt', 'a', encoding='utf-8') as f:
-                #     f.write(f"元素 {i}:\n")
-            if len(single_new_list)>0:
-                    if hot_text in specific_news:
-                        specific_news[hot_text]=specific_news[hot_text]+single_new_list
-                    else:
-                        specific_news[hot_text]=single_new_list
-                    with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                        f.write(f'{hot_text}查看完整模式下找到符合循环模式的新闻url：\n{single_new_list}\n')
-            else:
-                with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                    f.write(f'{hot_text}查看更多模式下没有找到符合循环模式的新闻url\n')
+            fresh, stale = dedup_store.classify(unique_urls)
+            stored = dedup_store.load_articles(fresh + stale)
+            results = {url: stored[url] for url in fresh if url in stored}
         except Exception as e:
-            with open('selenium_log.txt', 'a', encoding='utf-8') as f:
-                f.write(f"处理查看完整模式时出错: {e}\n")
-    news_text = {}
-    for key in specific_news.keys():
-        print(f"=========处理{key}的新闻======")
-        url_list =[]
-        info_list =[]
-        for href,text in specific_news[key]:
-            url_list.append(href)
-        for url in url_list:
-            try:
-                res = selenium_trafilatura_extract(url=url,driver=driver)
-                #页面标题、文本、作者、网址、链接、日期、长度
-                info_list.append((res['page_title'],res['advanced_text'],res['metadata']['author'],res['metadata']['sitename'],res['url'],res['metadata']['date'],res['statistics']['advanced_text_length']))
-            except Exception as e:
-                print(f" {e}")
-        news_text[key] = info_list
+            print(f"读取已抓取的文章失败，全部重新抓取: {e}")
+            results, stored = {}, {}
+    reused = len(results)
+    to_fetch = [url for url in unique_urls if url not in results]
+    fallback = []
+    for url, page in zip(to_fetch, fetch_pages(to_fetch)):
+        info = None
+        if page is not None:
+            if page['not_modified'] and url in stored:
+                info = stored[url]
+                reused += 1
+            else:
+                try:
+                    info = _to_info(trafilatura_extract_html(page['html'], url, outputs=ARTICLE_OUTPUTS),
+                                    settings.HTTP_MIN_TEXT_LENGTH)
+                except Exception as e:
+                    print(f"静态页面提取出错 {url}: {e}")
+        if info is None:
+            fallback.append(url)
+        else:
+            results[url] = info
+    _log(f"复用已抓取文章 {reused} 篇，HTTP抓取提取正文 {len(results) - reused} 篇，{len(fallback)} 篇交给浏览器渲染\n")
+    for url, info in zip(fallback, engine.map(_extract_article, fallback)):
+        results[url] = info
+    return [results.get(url) for url in urls]
+
+def get_baidu_hot_news(workers=None):
+    """
+    爬取百度热点新闻：
+    1.一个浏览器打开百度首页获取热点列表
+    2.浏览器池并发处理每个热点，收集新闻url
+    3.所有新闻url放入同一个队列，由浏览器池并发提取正文
+
+    Returns:
+        dict: {热点: [(页面标题、文本、作者、网址、链接、日期、长度), ...]}
+    """
+    start_time = time.time()
+    with CrawlerEngine(BrowserPool(size=workers)) as engine:
+        #进入百度首页找到热点url列表
+        def get_hot_list(engine, driver, home_url):
+            engine.get(driver, home_url, css="a.title-content.c-link.c-font-medium.c-line-clamp1")
+            # 使用CSS选择器定位a标签，然后获取href属性
+            urls = driver.find_elements(by=By.CSS_SELECTOR, value="a.title-content.c-link.c-font-medium.c-line-clamp1")
+            return [(url.get_attribute('href'), url.text) for url in urls]
+        hot_list = engine.map(get_hot_list, ["https://www.baidu.com"])[0] or []
+        _log(f"获取到 {len(hot_list)} 个热点\n")
+        #每个热点一个任务，并发收集新闻url
+        topic_news = engine.map(_collect_topic_news, hot_list)
+        specific_news = {}
+        for (url, hot_text), news_list in zip(hot_list, topic_news):
+            if news_list:
+                specific_news[hot_text] = specific_news.get(hot_text, []) + news_list
+        #所有新闻url先走HTTP抓取，剩下的放入同一个浏览器队列提取正文，结果再按热点归类
+        tasks = [(key, href) for key in specific_news for href, text in specific_news[key] if href]
+        infos = extract_articles([href for key, href in tasks], engine, dedup_store=get_dedup_store())
+    news_text = {key: [] for key in specific_news}
+    for (key, href), info in zip(tasks, infos):
+        if info is not None:
+            news_text[key].append(info)
+    _log(f"热点新闻爬取完成，共 {len(tasks)} 篇，耗时: {time.time() - start_time:.2f} 秒\n")
     return news_text
 
-def save_to_db(res,news_text):
-    import datetime
-    import json
-    json_list =[json.loads(json_str.replace('```json\n', '').replace('\n```', '')) for json_str in res]
-    # 准备插入数据的SQL语句 (PostgreSQL使用%s占位符)
-    insert_sql = """
-    INSERT INTO baidu_news (hottopic, page_title, content_text, author, site, url, update_time, content_length,absrtact,keywords)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s,%s,%s)
+def save_to_db(res,news_text,batch_size=None):
     """
+    入库前用url指纹和内容SimHash去重：新文章插入，已有文章（url相同或内容近似重复）只更新为本次看到
+
+    Args:
+        res: get_topics返回的{热点: {'abstract', 'keywords'}}
+        news_text: get_baidu_hot_news返回的{热点: 新闻列表}
+
+    Returns:
+        dict: {'batch_id', 'inserted', 'skipped', 'touched', 'elapsed'}
+    """
+    import datetime
+    #本次入库和更新的文章属于同一个爬虫批次
+    seen_at = datetime.datetime.now()
+    columns = ['hottopic', 'page_title', 'content_text', 'author', 'site', 'url',
+               'update_time', 'content_length', 'absrtact', 'keywords']
+    rows = []
 
-    # 遍历news_text字典，将数据插入数据库
-    i = 0
+    # 遍历news_text字典，整理出所有待插入的行，最后批量写入
     for hottopic, news_list in news_text.items():     
-        abstract = json_list[i].get('abstract', '无数据')
-        keywords = json_list[i].get('keywords', '无数据')
+        topic = res.get(hottopic, TOPIC_FALLBACK)
+        abstract = topic.get('abstract', '无数据')
+        keywords = topic.get('keywords', '无数据')
         for news_item in news_list:
             try:
                 # 解包元组数据
@@ -512,56 +536,142 @@ def save_to_db(res,news_text):
                 
                 content_length = content_length if content_length else 0
                 
-                # 执行插入操作
-                execute_query(insert_sql, (hottopic, page_title, content_text, author, site, url, processed_update_time, content_length,abstract,keywords))
-                print(f"成功插入: {hottopic} - {page_title}")
-                
+                rows.append((hottopic, page_title, content_text, author, site, url, processed_update_time, content_length,abstract,keywords))
                 
             except Exception as e:
-                print(f"插入失败 {hottopic}: {e}")
-        i+=1
+                print(f"整理数据失败 {hottopic}: {e}")
+                rows.append(None)
+
+    failed = rows.count(None)
+    rows = [row for row in rows if row is not None]
+    dedup_store = get_dedup_store()
+    decisions = dedup_store.ingest([(row[5], row[2]) for row in rows], seen_at)
+    batch_id = start_batch(seen_at)
+    insert_columns = columns + ['url_fp', 'simhash', 'last_seen_at', 'batch_id']
+    new_rows, touch_rows, inserted_fps = [], [], set()
+    #已有文章在库中不存在时（被删除或指纹过期）改为插入本次抓到的文章
+    fallback_rows = {}
+    for row, (action, url_fp, hash_value, fp) in zip(rows, decisions):
+        if action == 'insert':
+            new_rows.append(row + (url_fp, hash_value, seen_at, batch_id))
+            inserted_fps.add(url_fp)
+        elif url_fp not in inserted_fps:
+            # 同一篇文章在本次出现在多个热点下时，保留第一次插入时的热点
+            touch_rows.append((url_fp, row[0], row[8], row[9]))
+            fallback_rows.setdefault(url_fp, (row, fp, hash_value))
+    stats = bulk_insert('baidu_news', insert_columns, new_rows, batch_size=batch_size)
+    stats['skipped'] += failed
+    touched_fps = dedup_store.touch(touch_rows, seen_at, batch_id)
+    stats['touched'] = len(touched_fps)
+    reinsert_rows = []
+    for url_fp in fallback_rows.keys() - set(touched_fps):
+        row, fp, hash_value = fallback_rows[url_fp]
+        if fp not in inserted_fps:
+            inserted_fps.add(fp)
+            reinsert_rows.append(row + (fp, simhash(row[2]) if hash_value is None else hash_value, seen_at, batch_id))
+    if reinsert_rows:
+        print(f"{len(reinsert_rows)} 篇已有文章在库中不存在，改为插入")
+        reinserted = bulk_insert('baidu_news', insert_columns, reinsert_rows, batch_size=batch_size)
+        for key in ('inserted', 'skipped', 'failed_rows'):
+            stats[key] += reinserted[key]
+        new_rows += reinsert_rows
+    # 只有提交成功的文章才记录指纹，写入失败的下次仍按新文章处理
+    url_fp_index = len(columns)
+    failed_fps = {row[url_fp_index] for row in stats['failed_rows']}
+    dedup_store.record([(row[url_fp_index], row[url_fp_index + 1]) for row in new_rows
+                        if row[url_fp_index] not in failed_fps], touched_fps, seen_at)
+    finish_batch(batch_id, len(news_text), stats['inserted'], stats['touched'])
+    stats['batch_id'] = batch_id
+    print(f"批次 {batch_id} 数据插入完成！插入 {stats['inserted']} 条，已有文章更新 {stats['touched']} 条，跳过 {stats['skipped']} 条，耗时 {stats['elapsed']} 秒")
+    return stats
+
 
-    print("数据插入完成！")
 
 
+#主题总结的返回格式：两个非空字符串字段
+TOPIC_SCHEMA = {'abstract': str, 'keywords': str}
+TOPIC_FALLBACK = {'abstract': '无数据', 'keywords': '无数据'}
+_JSON_OBJECT_PATTERN = re.compile(r'\{.*\}', re.S)
 
+def parse_topic_json(text):
+    """
+    严格解析主题总结，允许外层包裹```json代码块
+
+    Returns:
+        dict: {'abstract': 摘要, 'keywords': 关键词}
+    Raises:
+        ValueError: 不是JSON对象，或缺少字段、字段类型不符
+    """
+    match = _JSON_OBJECT_PATTERN.search(text or '')
+    if match is None:
+        raise ValueError(f'回复中没有JSON对象: {text!r}')
+    data = json.loads(match.group(0))
+    if not isinstance(data, dict):
+        raise ValueError(f'回复不是JSON对象: {text!r}')
+    # 关键词偶尔会以列表返回，统一为逗号分隔的字符串
+    if isinstance(data.get('keywords'), list):
+        data['keywords'] = '，'.join(str(k) for k in data['keywords'])
+    topic = {}
+    for field, field_type in TOPIC_SCHEMA.items():
+        value = data.get(field)
+        if not isinstance(value, field_type) or not value.strip():
+            raise ValueError(f'字段{field}缺失或格式错误: {text!r}')
+        topic[field] = value.strip()
+    return topic
+
+def build_topic_prompt(key, info_list):
+    #拼接文本
+    raw_texts = ''
+    for i,info in enumerate(info_list):
+        # 检查info[1]是否为None，如果是则使用空字符串
+        content_text = info[1] if info[1] is not None else ''
+        if content_text:  # 只有当内容不为空时才添加
+            raw_texts += f'第{i+1}篇：'+'\n'+content_text + '\n\n'
+    GET_TOPICS_PROMPT = """
+    下面是关于“{key}”的一些新闻报道，根据这些新闻，进行新闻内容总结，总结内容不超过50字，并提取出5个主题关键词。
+    返回json数据。
+    示例返回形式：{"abstract":"人社部宣布，自从2025年6月起，个人养老金需要缴纳3%的个人所得税",
+    "keywords":"民生，税务，政府，养老金，上调税率"}
+    新闻报道是：{raw_texts}。
+    你的回答：
+    """
+    GET_TOPICS_PROMPT = GET_TOPICS_PROMPT.replace('{key}',key)
+    GET_TOPICS_PROMPT = GET_TOPICS_PROMPT.replace('{raw_texts}',raw_texts)
+    return GET_TOPICS_PROMPT
+
+async def asummarize_topic(key, info_list, semaphore, max_retries=None):
+    """总结一个热点，调用失败或解析失败时退避重试，最终失败返回TOPIC_FALLBACK"""
+    max_retries = settings.TOPIC_MAX_RETRIES if max_retries is None else max_retries
+    prompt = build_topic_prompt(key, info_list)
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                # 使用JSON输出模式，prompt中已包含"json"字样
+                system_msg = await get_llm_gateway().acomplete(prompt, response_format={'type': 'json_object'})
+            return parse_topic_json(system_msg)
+        except Exception as e:
+            print(f"热点“{key}”总结失败（第{attempt + 1}次）: {e}")
+            if attempt < max_retries:
+                await asyncio.sleep(min(2 ** attempt, 8) + random.random())
+    return dict(TOPIC_FALLBACK)
+
+async def aget_topics(news_text, concurrency=None, max_retries=None):
+    """
+    并发总结所有热点
+
+    Returns:
+        dict: {热点: {'abstract': 摘要, 'keywords': 关键词}}，与news_text的key一一对应
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.TOPIC_CONCURRENCY)
+    keys = list(news_text.keys())
+    start_time = time.time()
+    topics = await asyncio.gather(*(asummarize_topic(key, news_text[key], semaphore, max_retries) for key in keys))
+    print(f"总结 {len(keys)} 个热点，耗时: {time.time() - start_time:.2f} 秒")
+    return dict(zip(keys, topics))
 
 def get_topics(news_text):
-    topics_list = []
-    # news_text的列表有可能有空值
-    for key in news_text.keys():
-        info_list = news_text[key]
-        #拼接文本
-        raw_texts = ''
-        for i,info in enumerate(info_list):
-            # 检查info[1]是否为None，如果是则使用空字符串
-            content_text = info[1] if info[1] is not None else ''
-            if content_text:  # 只有当内容不为空时才添加
-                raw_texts += f'第{i+1}篇：'+'\n'+content_text + '\n\n'
-        #获取topics
-        GET_TOPICS_PROMPT = """
-        下面是关于“{key}”的一些新闻报道，根据这些新闻，进行新闻内容总结，总结内容不超过50字，并提取出5个主题关键词。
-        返回json数据。
-        示例返回形式：{"abstract":"人社部宣布，自从2025年6月起，个人养老金需要缴纳3%的个人所得税",
-        "keywords":"民生，税务，政府，养老金，上调税率"}
-        新闻报道是：{raw_texts}。
-        你的回答：
-        """
-        GET_TOPICS_PROMPT = GET_TOPICS_PROMPT.replace('{key}',key)
-        GET_TOPICS_PROMPT = GET_TOPICS_PROMPT.replace('{raw_texts}',raw_texts)
-        #print('GET_TOPICS_PROMPT',GET_TOPICS_PROMPT)
-        client = OpenAI(api_key=settings.DEEPSEEK_API, base_url="https://api.deepseek.com")
-        response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content":GET_TOPICS_PROMPT },
-        ],
-        stream=False
-        )
-        system_msg = response.choices[0].message.content
-        topics_list.append(system_msg)
-    return topics_list
+    """aget_topics的同步版本，供脚本使用"""
+    return asyncio.run(aget_topics(news_text))
 if __name__ == "__main__":
     news_text = get_baidu_hot_news()
     # 过滤掉空列表的情况
@@ -0,0 +1,528 @@
+"""
+可替换的向量库后端：llama_index默认的SimpleVectorStore把向量以JSON浮点数列表保存，加载时要全部解析成Python列表，
+每次查询都在Python中对所有向量计算余弦相似度，语料增长后加载时间和查询延迟都线性增长
+- VECTOR_BACKEND=hnsw：hnswlib的HNSW近似最近邻索引（hnsw_vector_store.bin/.json）
+- VECTOR_BACKEND=mmap：归一化后连续存放的float16/float32矩阵（mmap_vector_store.npy/.json），
+  以内存映射方式加载，不解析向量，多个uvicorn worker共享同一份页缓存；查询为分块的矩阵向量乘法，结果精确
+- 新文件与原来的default__vector_store.json放在同一目录，原文件保留，改回VECTOR_BACKEND=simple即可切回
+- 新文件中记录保存时default__vector_store.json和docstore.json的修改时间和大小；索引重建后两者不一致，
+  加载时给出提示并改用默认向量库，重新执行convert即可
+- 查询返回的id就是node_id，索引的index_struct和docstore不需要改动
+- 召回率和延迟的取舍：HNSW_M、HNSW_EF_CONSTRUCTION在建索引时生效，HNSW_EF_SEARCH在查询时生效，
+  数值越大召回率越高、速度越慢；convert命令会输出与精确检索对比的召回率和查询耗时
+- 带元数据过滤的查询（两级检索限定在选中的几篇文档内）只涉及少量段落，直接在这些段落上精确计算
+
+把已有的索引转换为HNSW或mmap格式（在项目根目录执行）：
+    python -m fastapi_project.util.vector_store convert fastapi_project/store/simpleindex fastapi_project/store/summaryindex fastapi_project/store/news_summaryindex
+    python -m fastapi_project.util.vector_store convert --backend mmap --dtype float16 fastapi_project/store/simpleindex
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from typing import Any
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+    MetadataFilters,
+    FilterOperator,
+    FilterCondition
+)
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from fastapi_project.settings import settings
+
+SIMPLE_STORE_FNAME = 'default__vector_store.json'
+HNSW_INDEX_FNAME = 'hnsw_vector_store.bin'
+HNSW_META_FNAME = 'hnsw_vector_store.json'
+MMAP_VECTORS_FNAME = 'mmap_vector_store.npy'
+MMAP_META_FNAME = 'mmap_vector_store.json'
+DOCSTORE_FNAME = 'docstore.json'
+
+
+def check_filters(filters):
+    """只支持AND条件下的EQ和IN过滤，其余情况抛出NotImplementedError，由调用方退回到检索后过滤"""
+    if filters is None:
+        return
+    if filters.condition not in (None, FilterCondition.AND):
+        raise NotImplementedError(f"不支持的过滤条件组合: {filters.condition}")
+    for f in filters.filters:
+        if isinstance(f, MetadataFilters) or f.operator not in (FilterOperator.EQ, FilterOperator.IN):
+            raise NotImplementedError(f"不支持的过滤条件: {f}")
+
+def match_filters(metadata, filters):
+    if filters is None:
+        return True
+    for f in filters.filters:
+        value = metadata.get(f.key)
+        if f.operator == FilterOperator.EQ and value != f.value:
+            return False
+        if f.operator == FilterOperator.IN and value not in f.value:
+            return False
+    return True
+
+def node_metadata(node):
+    """与SimpleVectorStore的metadata_dict一致的元数据"""
+    meta = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+    meta.pop('_node_content', None)
+    return meta
+
+def normalize(vectors, dtype='float32'):
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12
+    return vectors.astype(dtype)
+
+def source_signature(persist_dir):
+    """索引目录中原向量库和docstore的修改时间和大小，用于判断转换后的向量库是否过期"""
+    signature = {}
+    for fname in (SIMPLE_STORE_FNAME, DOCSTORE_FNAME):
+        path = os.path.join(persist_dir, fname)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[fname] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+def _write_atomic(path, write):
+    """先写临时文件再改名：其他worker已映射的旧文件不受影响，重新加载时读到完整的新文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class HnswVectorStore(BasePydanticVectorStore):
+    """
+    HNSW向量库，label为内部的连续整数，通过node_ids表对应到node_id
+
+    Args:
+        dim: 向量维度
+        hnsw_m: 每个节点的邻居数，越大召回率越高、索引越大
+        ef_construction: 建索引时的候选集大小
+        ef_search: 查询时的候选集大小，小于top_k时按top_k
+    """
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    dim: int
+    hnsw_m: int
+    ef_construction: int
+    ef_search: int
+
+    _index: Any = PrivateAttr()
+    _node_ids: list = PrivateAttr()  # label -> node_id，已删除的为None
+    _labels: dict = PrivateAttr()  # node_id -> label
+    _ref_doc_ids: dict = PrivateAttr()  # node_id -> ref_doc_id
+    _metadata: dict = PrivateAttr()  # node_id -> metadata，与SimpleVectorStore的metadata_dict一致
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, dim, hnsw_m=None, ef_construction=None, ef_search=None, max_elements=1024, index=None):
+        import hnswlib
+        super().__init__(
+            dim=dim,
+            hnsw_m=hnsw_m or settings.HNSW_M,
+            ef_construction=ef_construction or settings.HNSW_EF_CONSTRUCTION,
+            ef_search=ef_search or settings.HNSW_EF_SEARCH
+        )
+        if index is None:
+            index = hnswlib.Index(space='cosine', dim=dim)
+            index.init_index(max_elements=max_elements, M=self.hnsw_m, ef_construction=self.ef_construction)
+        index.set_ef(self.ef_search)
+        self._index = index
+        self._node_ids = []
+        self._labels = {}
+        self._ref_doc_ids = {}
+        self._metadata = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "HnswVectorStore"
+
+    @property
+    def client(self):
+        return self._index
+
+    def _register(self, labels, node_ids, ref_doc_ids, metadata):
+        for label, node_id, ref_doc_id, meta in zip(labels, node_ids, ref_doc_ids, metadata):
+            old_label = self._labels.get(node_id)
+            if old_label is not None:
+                # 重复添加同一node时以新向量为准
+                self._index.mark_deleted(old_label)
+                self._node_ids[old_label] = None
+            self._labels[node_id] = label
+            self._ref_doc_ids[node_id] = ref_doc_id
+            self._metadata[node_id] = meta
+
+    def _add_vectors(self, node_ids, embeddings, ref_doc_ids, metadata):
+        import numpy as np
+        with self._lock:
+            start = len(self._node_ids)
+            end = start + len(node_ids)
+            if end > self._index.get_max_elements():
+                self._index.resize_index(max(end, self._index.get_max_elements() * 2))
+            labels = list(range(start, end))
+            self._index.add_items(np.asarray(embeddings, dtype=np.float32), np.asarray(labels))
+            self._node_ids.extend(node_ids)
+            self._register(labels, node_ids, ref_doc_ids, metadata)
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        self._add_vectors([node.node_id for node in nodes], [node.get_embedding() for node in nodes],
+                          [node.ref_doc_id for node in nodes], [node_metadata(node) for node in nodes])
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        with self._lock:
+            for node_id in [n for n, r in self._ref_doc_ids.items() if r == ref_doc_id]:
+                label = self._labels.pop(node_id)
+                self._index.mark_deleted(label)
+                self._node_ids[label] = None
+                self._ref_doc_ids.pop(node_id)
+                self._metadata.pop(node_id, None)
+
+    def _query_subset(self, query, embedding):
+        """在满足过滤条件的少量向量上精确计算余弦相似度"""
+        import numpy as np
+        doc_ids = set(query.doc_ids or [])
+        node_ids = set(query.node_ids or [])
+        labels = [label for label, node_id in enumerate(self._node_ids)
+                  if node_id is not None
+                  and (not doc_ids or self._ref_doc_ids.get(node_id) in doc_ids)
+                  and (not node_ids or node_id in node_ids)
+                  and match_filters(self._metadata.get(node_id, {}), query.filters)]
+        if not labels:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        vectors = np.asarray(self._index.get_items(labels), dtype=np.float32)
+        similarities = vectors @ embedding / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(embedding) + 1e-12)
+        order = np.argsort(-similarities)[:query.similarity_top_k]
+        return VectorStoreQueryResult(similarities=[float(similarities[i]) for i in order],
+                                      ids=[self._node_ids[labels[i]] for i in order])
+
+    def query(self, query: VectorStoreQuery, **kwargs):
+        import numpy as np
+        if query.query_embedding is None:
+            raise ValueError("HnswVectorStore只支持带向量的查询")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(f"HnswVectorStore不支持{query.mode}查询")
+        check_filters(query.filters)
+        embedding = np.asarray(query.query_embedding, dtype=np.float32)
+        if query.filters is not None or query.doc_ids or query.node_ids:
+            return self._query_subset(query, embedding)
+
+        k = min(query.similarity_top_k, len(self._labels))
+        if k == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        if k > self._index.ef:
+            with self._lock:
+                self._index.set_ef(max(k, self._index.ef))
+        labels, distances = self._index.knn_query(embedding, k=k)
+        # cosine空间中的距离为1-余弦相似度
+        return VectorStoreQueryResult(similarities=[1.0 - float(d) for d in distances[0]],
+                                      ids=[self._node_ids[int(label)] for label in labels[0]])
+
+    def save(self, persist_dir):
+        os.makedirs(persist_dir, exist_ok=True)
+        with self._lock:
+            self._index.save_index(os.path.join(persist_dir, HNSW_INDEX_FNAME))
+            meta = {
+                'dim': self.dim,
+                'hnsw_m': self.hnsw_m,
+                'ef_construction': self.ef_construction,
+                'node_ids': self._node_ids,
+                'ref_doc_ids': self._ref_doc_ids,
+                'metadata': self._metadata,
+                'source': source_signature(persist_dir)
+            }
+        with open(os.path.join(persist_dir, HNSW_META_FNAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    def persist(self, persist_path, fs=None):
+        # StorageContext.persist传入的是default__vector_store.json的路径，HNSW文件写在同一目录，不覆盖原文件
+        self.save(os.path.dirname(persist_path))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, ef_search=None, meta=None):
+        import hnswlib
+        if meta is None:
+            with open(os.path.join(persist_dir, HNSW_META_FNAME), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        index = hnswlib.Index(space='cosine', dim=meta['dim'])
+        index.load_index(os.path.join(persist_dir, HNSW_INDEX_FNAME))
+        store = cls(dim=meta['dim'], hnsw_m=meta['hnsw_m'], ef_construction=meta['ef_construction'],
+                    ef_search=ef_search, index=index)
+        store._node_ids = meta['node_ids']
+        store._labels = {node_id: label for label, node_id in enumerate(meta['node_ids']) if node_id is not None}
+        store._ref_doc_ids = meta['ref_doc_ids']
+        store._metadata = meta['metadata']
+        return store
+
+    @classmethod
+    def from_simple_store(cls, simple_store, **kwargs):
+        """用SimpleVectorStore中已有的向量建索引，不需要重新调用嵌入模型"""
+        data = simple_store.data
+        node_ids = list(data.embedding_dict)
+        if not node_ids:
+            raise ValueError("向量库为空，无法确定向量维度")
+        store = cls(dim=len(data.embedding_dict[node_ids[0]]), max_elements=len(node_ids), **kwargs)
+        store._add_vectors(node_ids, [data.embedding_dict[n] for n in node_ids],
+                           [data.text_id_to_ref_doc_id.get(n) for n in node_ids],
+                           [(data.metadata_dict or {}).get(n, {}) for n in node_ids])
+        return store
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    归一化后的向量按行连续存放在一个矩阵中，第i行对应node_ids[i]，余弦相似度即矩阵与查询向量的点积
+    从文件加载时矩阵是只读的内存映射，新增向量后矩阵变为内存中的数组，保存后重新加载才回到内存映射
+
+    Args:
+        dtype: 矩阵的存储类型，float16体积和内存占用减半，对top-k排序的影响可以忽略
+    """
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    dtype: str
+
+    _matrix: Any = PrivateAttr()
+    _alive: Any = PrivateAttr()  # 每行是否有效，删除的行置为False
+    _node_ids: list = PrivateAttr()  # 行号 -> node_id，已删除的为None
+    _rows: dict = PrivateAttr()  # node_id -> 行号
+    _ref_doc_ids: dict = PrivateAttr()
+    _metadata: dict = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    # 全库查询时每次转换为float32计算的行数，限制临时内存
+    block_rows: int = 8192
+
+    def __init__(self, matrix=None, node_ids=None, ref_doc_ids=None, metadata=None, dtype=None):
+        import numpy as np
+        super().__init__(dtype=dtype or settings.VECTOR_MMAP_DTYPE)
+        self._node_ids = list(node_ids or [])
+        self._matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+        self._alive = np.ones(len(self._node_ids), dtype=bool)
+        self._rows = {node_id: row for row, node_id in enumerate(self._node_ids)}
+        self._ref_doc_ids = dict(ref_doc_ids or {})
+        self._metadata = dict(metadata or {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return self._matrix
+
+    def _add_vectors(self, node_ids, embeddings, ref_doc_ids, metadata):
+        import numpy as np
+        rows = normalize(embeddings, self.dtype)
+        with self._lock:
+            start = len(self._node_ids)
+            self._matrix = rows if start == 0 else np.concatenate([self._matrix, rows])
+            self._alive = np.concatenate([self._alive, np.ones(len(node_ids), dtype=bool)])
+            for row, node_id, ref_doc_id, meta in zip(range(start, start + len(node_ids)), node_ids, ref_doc_ids, metadata):
+                old_row = self._rows.get(node_id)
+                if old_row is not None:
+                    # 重复添加同一node时以新向量为准
+                    self._alive[old_row] = False
+                    self._node_ids[old_row] = None
+                self._node_ids.append(node_id)
+                self._rows[node_id] = row
+                self._ref_doc_ids[node_id] = ref_doc_id
+                self._metadata[node_id] = meta
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        self._add_vectors([node.node_id for node in nodes], [node.get_embedding() for node in nodes],
+                          [node.ref_doc_id for node in nodes], [node_metadata(node) for node in nodes])
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        with self._lock:
+            for node_id in [n for n, r in self._ref_doc_ids.items() if r == ref_doc_id]:
+                row = self._rows.pop(node_id)
+                self._alive[row] = False
+                self._node_ids[row] = None
+                self._ref_doc_ids.pop(node_id)
+                self._metadata.pop(node_id, None)
+
+    def query(self, query: VectorStoreQuery, **kwargs):
+        import numpy as np
+        if query.query_embedding is None:
+            raise ValueError("MmapVectorStore只支持带向量的查询")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(f"MmapVectorStore不支持{query.mode}查询")
+        check_filters(query.filters)
+        embedding = normalize(query.query_embedding)
+        with self._lock:
+            matrix, alive, node_ids = self._matrix, self._alive.copy(), list(self._node_ids)
+
+        if query.filters is not None or query.doc_ids or query.node_ids:
+            # 只读取满足过滤条件的行
+            doc_ids = set(query.doc_ids or [])
+            wanted = set(query.node_ids or [])
+            rows = np.asarray([row for row, node_id in enumerate(node_ids)
+                               if node_id is not None
+                               and (not doc_ids or self._ref_doc_ids.get(node_id) in doc_ids)
+                               and (not wanted or node_id in wanted)
+                               and match_filters(self._metadata.get(node_id, {}), query.filters)], dtype=np.int64)
+            similarities = matrix[rows].astype(np.float32) @ embedding if len(rows) else np.zeros(0, dtype=np.float32)
+        else:
+            rows = np.flatnonzero(alive)
+            similarities = np.empty(len(node_ids), dtype=np.float32)
+            for start in range(0, len(node_ids), self.block_rows):
+                similarities[start:start + self.block_rows] = \
+                    matrix[start:start + self.block_rows].astype(np.float32) @ embedding
+            similarities = similarities[rows]
+
+        k = min(query.similarity_top_k, len(rows))
+        if k == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return VectorStoreQueryResult(similarities=[float(similarities[i]) for i in top],
+                                      ids=[node_ids[rows[i]] for i in top])
+
+    def save(self, persist_dir):
+        """只保存有效的行，删除的行在保存时压缩掉"""
+        import numpy as np
+        os.makedirs(persist_dir, exist_ok=True)
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            matrix = np.ascontiguousarray(self._matrix[rows], dtype=self.dtype)
+            node_ids = [self._node_ids[row] for row in rows]
+            meta = {
+                'dtype': self.dtype,
+                'node_ids': node_ids,
+                'ref_doc_ids': {n: self._ref_doc_ids.get(n) for n in node_ids},
+                'metadata': {n: self._metadata.get(n, {}) for n in node_ids},
+                'source': source_signature(persist_dir)
+            }
+        _write_atomic(os.path.join(persist_dir, MMAP_VECTORS_FNAME), lambda f: np.save(f, matrix))
+        _write_atomic(os.path.join(persist_dir, MMAP_META_FNAME),
+                      lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+
+    def persist(self, persist_path, fs=None):
+        # 与HnswVectorStore相同，写在default__vector_store.json所在目录，不覆盖原文件
+        self.save(os.path.dirname(persist_path))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, meta=None):
+        import numpy as np
+        if meta is None:
+            with open(os.path.join(persist_dir, MMAP_META_FNAME), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        matrix = np.load(os.path.join(persist_dir, MMAP_VECTORS_FNAME), mmap_mode='r')
+        return cls(matrix=matrix, node_ids=meta['node_ids'], ref_doc_ids=meta['ref_doc_ids'],
+                   metadata=meta['metadata'], dtype=meta['dtype'])
+
+    @classmethod
+    def from_simple_store(cls, simple_store, dtype=None):
+        data = simple_store.data
+        node_ids = list(data.embedding_dict)
+        if not node_ids:
+            raise ValueError("向量库为空")
+        store = cls(dtype=dtype)
+        store._add_vectors(node_ids, [data.embedding_dict[n] for n in node_ids],
+                           [data.text_id_to_ref_doc_id.get(n) for n in node_ids],
+                           [(data.metadata_dict or {}).get(n, {}) for n in node_ids])
+        return store
+
+
+#后端名 -> (向量库类, 判断是否已转换的文件)
+BACKENDS = {
+    'hnsw': (HnswVectorStore, HNSW_META_FNAME),
+    'mmap': (MmapVectorStore, MMAP_META_FNAME)
+}
+
+def load_vector_store(persist_dir, backend=None):
+    """
+    按VECTOR_BACKEND返回索引使用的向量库
+
+    Returns:
+        HnswVectorStore或MmapVectorStore，None表示使用llama_index默认的SimpleVectorStore
+    """
+    backend = backend or settings.VECTOR_BACKEND
+    if backend == 'simple':
+        return None
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的向量库后端: {backend}")
+    store_cls, meta_fname = BACKENDS[backend]
+    meta_path = os.path.join(persist_dir, meta_fname)
+    if not os.path.exists(meta_path):
+        print(f"{persist_dir} 中没有{backend}向量库，使用默认向量库，可执行vector_store convert生成")
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    # 转换后索引被重建过（原向量库或docstore有变化），node_id可能已经对不上
+    if meta.get('source') != source_signature(persist_dir):
+        print(f"警告: {persist_dir} 中的{backend}向量库与当前索引不一致（索引转换后被重建过），"
+              f"使用默认向量库，请重新执行vector_store convert")
+        return None
+    return store_cls.from_persist_dir(persist_dir, meta=meta)
+
+def evaluate_recall(simple_store, store, k=5, sample=100):
+    """用库中已有的向量作为查询，对比store与float32精确检索的top-k，返回召回率和平均查询耗时（毫秒）"""
+    import numpy as np
+    data = simple_store.data
+    node_ids = list(data.embedding_dict)
+    k = min(k, len(node_ids))
+    matrix = np.asarray([data.embedding_dict[n] for n in node_ids], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    queries = matrix[np.random.default_rng(0).choice(len(node_ids), size=min(sample, len(node_ids)), replace=False)]
+    hits = 0
+    exact_time = store_time = 0.0
+    for query in queries:
+        start_time = time.perf_counter()
+        exact = {node_ids[i] for i in np.argsort(-(matrix @ query))[:k]}
+        exact_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=k))
+        store_time += time.perf_counter() - start_time
+        hits += len(exact & set(result.ids))
+    return {
+        'recall': round(hits / (len(queries) * k), 4),
+        'exact_ms': round(exact_time / len(queries) * 1000, 3),
+        'store_ms': round(store_time / len(queries) * 1000, 3)
+    }
+
+def convert(persist_dir, backend='hnsw', hnsw_m=None, ef_construction=None, ef_search=None, dtype=None, k=5):
+    """读取persist_dir中的default__vector_store.json，在同目录下生成backend格式的向量库"""
+    start_time = time.time()
+    simple_store = SimpleVectorStore.from_persist_path(os.path.join(persist_dir, SIMPLE_STORE_FNAME))
+    if backend == 'hnsw':
+        store = HnswVectorStore.from_simple_store(simple_store, hnsw_m=hnsw_m, ef_construction=ef_construction,
+                                                  ef_search=ef_search)
+        params = f"M={store.hnsw_m}，ef_construction={store.ef_construction}，ef_search={store.ef_search}"
+    elif backend == 'mmap':
+        store = MmapVectorStore.from_simple_store(simple_store, dtype=dtype)
+        params = f"dtype={store.dtype}"
+    else:
+        raise ValueError(f"未知的向量库后端: {backend}")
+    store.save(persist_dir)
+    print(f"{persist_dir}: {len(simple_store.data.embedding_dict)} 个向量转换为{backend}，{params}，"
+          f"耗时 {time.time() - start_time:.2f} 秒")
+    print(f"{persist_dir}: top{k} {evaluate_recall(simple_store, store, k=k)}")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量库后端工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help="把索引目录中的default__vector_store.json转换为HNSW或mmap格式")
+    convert_parser.add_argument('persist_dirs', nargs='+')
+    convert_parser.add_argument('--backend', choices=tuple(BACKENDS), default='hnsw')
+    convert_parser.add_argument('--m', type=int, default=None, help="每个节点的邻居数，默认HNSW_M")
+    convert_parser.add_argument('--ef-construction', type=int, default=None, help="默认HNSW_EF_CONSTRUCTION")
+    convert_parser.add_argument('--ef-search', type=int, default=None, help="评估召回率时使用，默认HNSW_EF_SEARCH")
+    convert_parser.add_argument('--dtype', choices=('float16', 'float32'), default=None, help="mmap矩阵的存储类型，默认VECTOR_MMAP_DTYPE")
+    convert_parser.add_argument('--k', type=int, default=5, help="评估召回率的top-k")
+    args = parser.parse_args()
+    for persist_dir in args.persist_dirs:
+        convert(persist_dir, backend=args.backend, hnsw_m=args.m, ef_construction=args.ef_construction,
+                ef_search=args.ef_search, dtype=args.dtype, k=args.k)
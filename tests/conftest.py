@@ -0,0 +1,94 @@
+"""
+测试公共配置
+- settings中没有默认值的字段用占位值填充，测试不会访问这些外部服务
+- pg_db：每个测试一个空的postgres数据库；设置TEST_DATABASE_URL时使用该实例，否则用pgserver启动临时实例，都没有时跳过
+"""
+import os
+import sys
+import uuid
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+for _name in ('DEEPSEEK_API', 'USERS', 'PASSWORD', 'DATABASE', 'ARTICLE_DIR', 'ALIBABA_CLOUD_ACCESS_KEY_ID',
+              'ALIBABA_CLOUD_ACCESS_KEY_SECRET', 'DASHSCOPE_API_KEY', 'DASHSCOPE_BASE_URL'):
+    os.environ.setdefault(_name, 'test')
+
+
+@pytest.fixture(scope='session')
+def pg_server(tmp_path_factory):
+    """返回postgres实例的连接参数dict"""
+    psycopg2 = pytest.importorskip('psycopg2')
+    url = os.environ.get('TEST_DATABASE_URL')
+    server = None
+    if not url:
+        pgserver = pytest.importorskip('pgserver')
+        try:
+            server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+        except Exception as e:
+            pytest.skip(f"无法启动临时postgres: {e}")
+        url = server.get_uri()
+    params = psycopg2.extensions.parse_dsn(url)
+    yield params
+    if server is not None:
+        server.cleanup()
+
+
+@pytest.fixture
+def pg_db(pg_server, monkeypatch):
+    """创建一个空数据库，并让db_util的连接池连接到它"""
+    import psycopg2
+    from fastapi_project.settings import settings
+    from fastapi_project.util import db_util
+
+    name = 'test_' + uuid.uuid4().hex[:12]
+    admin = psycopg2.connect(**pg_server)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE "{name}"')
+
+    db_util.close_pool()
+    monkeypatch.setattr(settings, 'USERS', pg_server.get('user', 'postgres'))
+    monkeypatch.setattr(settings, 'PASSWORD', pg_server.get('password', ''))
+    monkeypatch.setattr(settings, 'DB_HOST', pg_server.get('host', 'localhost'))
+    monkeypatch.setattr(settings, 'DB_PORT', str(pg_server.get('port', '5432')))
+    monkeypatch.setattr(settings, 'DATABASE', name)
+    yield name
+
+    db_util.close_pool()
+    with admin.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    admin.close()
+
+
+@pytest.fixture
+def baidu_news(pg_db):
+    """创建爬虫写入的baidu_news表（只含入库用到的列），返回插入旧数据的函数"""
+    from fastapi_project.util import db_util, crawl_batch
+
+    db_util.execute_query("""
+    CREATE TABLE baidu_news (
+        id SERIAL PRIMARY KEY,
+        hottopic TEXT,
+        page_title TEXT,
+        content_text TEXT,
+        author TEXT,
+        site TEXT,
+        url TEXT,
+        update_time DATE,
+        content_length INTEGER,
+        absrtact TEXT,
+        keywords TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""")
+    crawl_batch._schema_ready = False
+
+    def insert(hottopic, url, created_at, content_text='正文', content_length=200):
+        db_util.execute_query("""
+        INSERT INTO baidu_news (hottopic, page_title, content_text, url, content_length, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """, (hottopic, hottopic, content_text, url, content_length, created_at))
+    yield insert
+    crawl_batch._schema_ready = False
@@ -0,0 +1,44 @@
+"""crawl_batch：第一次建表时把已有的最新一批文章登记为一个批次"""
+from datetime import datetime, timedelta
+from fastapi_project.util import db_util, crawl_batch
+
+
+def _latest_topics():
+    return sorted(row[1] for row in db_util.execute_query(crawl_batch.LATEST_BATCH_NEWS_QUERY))
+
+
+def test_migration_registers_latest_minute_as_batch(baidu_news):
+    latest = datetime.now().replace(second=0, microsecond=0) - timedelta(hours=1)
+    baidu_news('更早', 'http://a', latest - timedelta(days=1))
+    # 同一次爬取的文章在同一分钟内先后写入
+    baidu_news('最新1', 'http://b', latest + timedelta(seconds=5))
+    baidu_news('最新2', 'http://c', latest + timedelta(seconds=40))
+    baidu_news('太短', 'http://d', latest + timedelta(seconds=50), content_length=10)
+
+    crawl_batch.ensure_schema()
+
+    assert _latest_topics() == ['最新1', '最新2']
+    batches = db_util.execute_query("SELECT batch_id, started_at, finished_at FROM crawl_batches")
+    assert len(batches) == 1
+    assert batches[0][1] == latest
+
+
+def test_migration_runs_once_and_new_batches_take_over(baidu_news):
+    baidu_news('旧', 'http://a', datetime.now() - timedelta(days=1))
+    crawl_batch.ensure_schema()
+    crawl_batch._schema_ready = False
+    crawl_batch.ensure_schema()
+    assert len(db_util.execute_query("SELECT batch_id FROM crawl_batches")) == 1
+
+    batch_id = crawl_batch.start_batch(datetime.now())
+    baidu_news('新', 'http://b', datetime.now())
+    db_util.execute_query("UPDATE baidu_news SET batch_id = %s WHERE url = 'http://b'", (batch_id,))
+    # 批次完成前仍读取上一批
+    assert _latest_topics() == ['旧']
+    crawl_batch.finish_batch(batch_id, 1, 1, 0)
+    assert _latest_topics() == ['新']
+
+
+def test_migration_on_empty_table(baidu_news):
+    crawl_batch.ensure_schema()
+    assert db_util.execute_query("SELECT batch_id FROM crawl_batches") == []
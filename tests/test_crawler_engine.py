@@ -0,0 +1,97 @@
+"""crawler_engine：浏览器池丢弃失效的浏览器，CrawlerEngine换新浏览器重试任务"""
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException, TimeoutException, WebDriverException
+from fastapi_project.util.crawler_engine import BrowserPool, CrawlerEngine, DomainRateLimiter, is_driver_broken
+
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+def _pool(size=1):
+    created = []
+
+    def factory():
+        created.append(FakeDriver(len(created)))
+        return created[-1]
+    return BrowserPool(size=size, driver_factory=factory), created
+
+
+def _engine(pool):
+    return CrawlerEngine(pool=pool, limiter=DomainRateLimiter(0, 10), workers=pool.size)
+
+
+def test_acquire_reuses_driver():
+    pool, created = _pool()
+    with pool.acquire() as first:
+        pass
+    with pool.acquire() as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+
+
+def test_acquire_discards_driver_on_error():
+    pool, created = _pool()
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            raise RuntimeError('boom')
+    assert created[0].quit_called
+    with pool.acquire() as driver:
+        assert driver is created[1]
+    assert pool._created == 1
+
+
+def test_is_driver_broken():
+    assert is_driver_broken(InvalidSessionIdException('invalid session id'))
+    assert is_driver_broken(WebDriverException('chrome not reachable'))
+    assert not is_driver_broken(TimeoutException('timeout: disconnected'))
+    assert not is_driver_broken(WebDriverException('no such element'))
+    assert not is_driver_broken(ValueError('invalid session id'))
+
+
+def test_map_retries_item_on_fresh_driver():
+    pool, created = _pool()
+    seen = []
+
+    def func(engine, driver, item):
+        seen.append((driver.number, item))
+        if driver.number == 0 and item == 'b':
+            raise InvalidSessionIdException('invalid session id')
+        return item.upper()
+
+    assert _engine(pool).map(func, ['a', 'b', 'c']) == ['A', 'B', 'C']
+    # 失败的任务放回队列末尾，由新浏览器处理
+    assert seen == [(0, 'a'), (0, 'b'), (1, 'c'), (1, 'b')]
+    assert created[0].quit_called and not created[1].quit_called
+
+
+def test_map_gives_up_after_max_retries():
+    pool, created = _pool()
+
+    def func(engine, driver, item):
+        if item == 'bad':
+            raise WebDriverException('tab crashed')
+        return item
+
+    assert _engine(pool).map(func, ['bad', 'ok']) == [None, 'ok']
+    # 第一次执行加上MAX_DRIVER_RETRIES次重试，每次都换一个新浏览器
+    assert len(created) == CrawlerEngine.MAX_DRIVER_RETRIES + 1
+    assert all(driver.quit_called for driver in created)
+
+
+def test_map_keeps_driver_on_ordinary_error():
+    pool, created = _pool()
+
+    def func(engine, driver, item):
+        if item == 'bad':
+            raise ValueError('parse error')
+        return item
+
+    assert _engine(pool).map(func, ['bad', 'ok']) == [None, 'ok']
+    assert len(created) == 1
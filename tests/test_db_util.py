@@ -0,0 +1,28 @@
+"""db_util.bulk_insert：批次出错时对半拆分重试，只跳过出错的行"""
+from fastapi_project.util import db_util
+
+
+def _create_table():
+    db_util.execute_query("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER CHECK (value >= 0))")
+
+
+def test_bulk_insert_splits_failed_batch(pg_db):
+    _create_table()
+    rows = [(i, -1 if i in (3, 7) else i) for i in range(10)]
+    stats = db_util.bulk_insert('items', ['id', 'value'], rows, batch_size=4)
+    assert stats['inserted'] == 8
+    assert stats['skipped'] == 2
+    assert sorted(stats['failed_rows']) == [(3, -1), (7, -1)]
+    ids = [row[0] for row in db_util.execute_query("SELECT id FROM items ORDER BY id")]
+    assert ids == [0, 1, 2, 4, 5, 6, 8, 9]
+
+
+def test_bulk_insert_counts_conflicts_and_bad_rows(pg_db):
+    _create_table()
+    db_util.bulk_insert('items', ['id', 'value'], [(1, 1)])
+    rows = [(1, 1), (2, 2), (3,), None]
+    stats = db_util.bulk_insert('items', ['id', 'value'], rows, on_conflict="ON CONFLICT (id) DO NOTHING")
+    assert stats['inserted'] == 1
+    # 冲突的一行 + 列数不符的一行 + None
+    assert stats['skipped'] == 3
+    assert stats['failed_rows'] == []
@@ -0,0 +1,54 @@
+"""dedup_util：url规范化、SimHash近似重复，以及touch对旧数据中重复行的处理"""
+from datetime import datetime, timedelta
+from fastapi_project.util import db_util, crawl_batch
+from fastapi_project.util.dedup_util import NewsDedupStore, url_fingerprint, simhash, hamming_distances
+
+
+def test_url_fingerprint_ignores_tracking_params_and_fragment():
+    assert (url_fingerprint('HTTP://News.example.com/a?b=2&utm_source=x&a=1#top')
+            == url_fingerprint('http://news.example.com/a?a=1&b=2'))
+    assert url_fingerprint('http://news.example.com/a?a=1') != url_fingerprint('http://news.example.com/a?a=2')
+
+
+def test_simhash_near_duplicates_are_close():
+    text = ('今天上午，市政府召开新闻发布会，介绍了今年上半年全市经济运行情况。会议指出，上半年全市地区生产总值同比增长百分之五点六，'
+            '规模以上工业增加值增长百分之六点一，社会消费品零售总额增长百分之七点二，固定资产投资保持稳定增长。'
+            '下一步将继续加大对实体经济的支持力度，推动重点项目建设。')
+    near = text.replace('下一步', '下阶段')
+    other = '球队在昨晚的比赛中以三比一战胜对手，提前一轮锁定了小组第一的位置。主教练在赛后表示，球员们在场上展现了良好的精神面貌。'
+    # 空白字符不影响指纹
+    assert simhash(text) == simhash(text.replace('。', '。\n  '))
+    distances = hamming_distances([simhash(near), simhash(other)], simhash(text))
+    assert distances[0] * 3 < distances[1]
+
+
+def test_touch_updates_one_row_per_fingerprint(baidu_news):
+    now = datetime.now()
+    url = 'http://news.example.com/a'
+    # 旧数据：同一个url被重复插入过
+    baidu_news('旧热点', url, now - timedelta(days=2))
+    baidu_news('旧热点', url, now - timedelta(days=1))
+    baidu_news('其他', 'http://news.example.com/b', now - timedelta(days=1))
+    store = NewsDedupStore(window_days=30, url_ttl=0).load()
+    crawl_batch.ensure_schema()
+    batch_id = crawl_batch.start_batch(now)
+    fp = url_fingerprint(url)
+
+    touched = store.touch([(fp, '新热点', '摘要', '关键词'), (fp, '新热点', '摘要', '关键词'),
+                           (url_fingerprint('http://news.example.com/gone'), '新热点', '摘要', '关键词')],
+                          now, batch_id)
+
+    assert touched == [fp]
+    rows = db_util.execute_query("SELECT hottopic, batch_id, created_at FROM baidu_news WHERE url = %s ORDER BY created_at",
+                                 (url,))
+    # 只更新最近看到的一行
+    assert [(row[0], row[1]) for row in rows] == [('旧热点', None), ('新热点', batch_id)]
+
+
+def test_touch_without_batch(baidu_news):
+    baidu_news('旧热点', 'http://news.example.com/a', datetime.now())
+    store = NewsDedupStore(window_days=30).load()
+    crawl_batch.ensure_schema()
+    fp = url_fingerprint('http://news.example.com/a')
+    assert store.touch([(fp, '新热点', '摘要', '关键词')], datetime.now()) == [fp]
+    assert store.touch([], datetime.now()) == []
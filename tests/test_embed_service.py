@@ -0,0 +1,50 @@
+"""embed_service：查询按批计算，HuggingFaceEmbedding的私有接口不可用时逐条计算"""
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from fastapi_project.util import embed_service
+from fastapi_project.util.embed_service import BatchingEmbedding, embed_query_batch
+
+
+class FakeHFEmbedding(HuggingFaceEmbedding):
+    """不加载模型的HuggingFaceEmbedding，向量为[查询长度, 是否带查询指令]"""
+
+    def _embed(self, sentences, prompt_name=None):
+        return [[float(len(s)), float(prompt_name == 'query')] for s in sentences]
+
+
+class OldFakeHFEmbedding(FakeHFEmbedding):
+    """_embed没有prompt_name参数的版本"""
+
+    def _embed(self, sentences):
+        raise AssertionError("不应在没有查询指令的情况下计算")
+
+    def _get_query_embedding(self, query):
+        return [float(len(query)), 1.0]
+
+
+@pytest.fixture(autouse=True)
+def reset_batch_flag(monkeypatch):
+    monkeypatch.setattr(embed_service, '_hf_batch_supported', True)
+
+
+def test_hf_batch_uses_query_prompt():
+    model = FakeHFEmbedding.model_construct()
+    assert embed_query_batch(model, ['a', 'bb']) == [[1.0, 1.0], [2.0, 1.0]]
+
+
+def test_hf_batch_falls_back_to_single_queries():
+    model = OldFakeHFEmbedding.model_construct()
+    assert embed_query_batch(model, ['a', 'bb']) == [[1.0, 1.0], [2.0, 1.0]]
+    assert embed_service._hf_batch_supported is False
+
+
+def test_batching_embedding_matches_model():
+    model = MockEmbedding(embed_dim=4)
+    embedding = BatchingEmbedding(model, window=0.01, max_batch_size=8, workers=1, cache_size=10)
+    try:
+        assert embedding.get_query_embedding('查询') == model.get_query_embedding('查询')
+        assert embedding.get_query_embedding('查询') == model.get_query_embedding('查询')
+        assert embedding.stats()['cache_hits'] == 1
+    finally:
+        embedding.close()
@@ -0,0 +1,91 @@
+"""es_util：msearch请求体、响应解析，以及段落索引不存在时回退到文章索引"""
+import json
+import asyncio
+import httpx
+from fastapi_project.settings import settings
+from fastapi_project.util.es_util import ESClient
+
+
+def _queries(body):
+    lines = [json.loads(line) for line in body.strip().split('\n')]
+    return lines[0::2], lines[1::2]
+
+
+def test_highlight_body_uses_phrase_match():
+    client = ESClient('http://es:9200', index='article')
+    headers, queries = _queries(client.build_msearch_body(['邹韬奋', '生活周刊'], k=2, n=3, paragraph=False))
+    assert headers == [{'index': 'article'}, {'index': 'article'}]
+    assert queries[0]['query'] == {'match_phrase': {'body': '邹韬奋'}}
+    assert queries[1]['size'] == 2
+    assert queries[1]['highlight']['fields']['body']['number_of_fragments'] == 3
+    assert queries[1]['_source'] == ['title']
+
+
+def test_paragraph_body_queries_paragraph_index():
+    client = ESClient('http://es:9200', index='article')
+    headers, queries = _queries(client.build_msearch_body(['邹韬奋'], k=4, paragraph=True))
+    assert headers == [{'index': settings.ES_PARAGRAPH_INDEX}]
+    assert queries[0] == {'size': 4, 'query': {'match_phrase': {'text': '邹韬奋'}}, '_source': ['title', 'text']}
+
+
+def test_parse_msearch():
+    data = {'responses': [
+        {'hits': {'hits': [
+            {'_score': 2.0, '_source': {'title': 'A'}, 'highlight': {'body': [' 片段一 ', '片段二']}},
+            {'_score': 1.0, '_source': {'title': 'B', 'text': '段落'}},
+        ]}},
+        {'error': {'type': 'search_phase_execution_exception'}},
+    ]}
+    assert ESClient.parse_msearch(data, ['a', 'b', 'c']) == [
+        [{'text': '片段一', 'score': 2.0, 'title': 'A'},
+         {'text': '片段二', 'score': 2.0, 'title': 'A'},
+         {'text': '段落', 'score': 1.0, 'title': 'B'}],
+        [],
+        [],
+    ]
+
+
+def _mock_client(handler):
+    client = ESClient('http://es:9200', index='article')
+    transport = httpx.MockTransport(handler)
+    client._client = httpx.Client(base_url=client.base_url, transport=transport)
+    client._async_client = httpx.AsyncClient(base_url=client.base_url, transport=transport)
+    return client
+
+
+def _fallback_handler(requested):
+    def handler(request):
+        headers, _ = _queries(request.content.decode('utf-8'))
+        requested.append(headers[0]['index'])
+        if headers[0]['index'] == settings.ES_PARAGRAPH_INDEX:
+            return httpx.Response(200, json={'responses': [
+                {'error': {'type': 'index_not_found_exception'}, 'status': 404} for _ in headers]})
+        return httpx.Response(200, json={'responses': [
+            {'hits': {'hits': [{'_score': 1.0, '_source': {'title': 'A'}, 'highlight': {'body': ['片段']}}]}}
+            for _ in headers]})
+    return handler
+
+
+def test_falls_back_to_article_index_when_paragraph_index_missing(monkeypatch):
+    monkeypatch.setattr(settings, 'ES_PARAGRAPH_SEARCH', True)
+    requested = []
+    client = _mock_client(_fallback_handler(requested))
+    assert client.get_paras_from_kws(['a', 'b']) == [['片段'], ['片段']]
+    assert requested == [settings.ES_PARAGRAPH_INDEX, 'article']
+
+
+def test_async_falls_back_to_article_index(monkeypatch):
+    monkeypatch.setattr(settings, 'ES_PARAGRAPH_SEARCH', True)
+    requested = []
+    client = _mock_client(_fallback_handler(requested))
+    assert asyncio.run(client.aget_paras_from_kws(['a'])) == [['片段']]
+    assert requested == [settings.ES_PARAGRAPH_INDEX, 'article']
+
+
+def test_paragraph_search_off_queries_article_index_only(monkeypatch):
+    monkeypatch.setattr(settings, 'ES_PARAGRAPH_SEARCH', False)
+    requested = []
+    client = _mock_client(_fallback_handler(requested))
+    assert client.get_paras_from_kws(['a']) == [['片段']]
+    assert client.get_paras_from_kws([]) == []
+    assert requested == ['article']
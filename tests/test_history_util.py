@@ -0,0 +1,54 @@
+"""history_util.select_history_window：窗口大小、token预算和折叠批次"""
+import pytest
+from fastapi_project.util import history_util
+from fastapi_project.util.history_util import select_history_window
+
+
+@pytest.fixture(autouse=True)
+def fixed_tokens(monkeypatch):
+    # 每条消息固定10个token，不依赖本地分词器
+    monkeypatch.setattr(history_util, 'count_message_tokens', lambda message: 10)
+
+
+def _messages(n):
+    return [{'role': 'user' if i % 2 == 0 else 'system', 'content': str(i)} for i in range(n)]
+
+
+def test_folds_messages_outside_window():
+    msg_list = _messages(11)
+    window, to_fold = select_history_window(msg_list, {'text': '', 'count': 0},
+                                            max_turns=2, token_budget=1000, fold_batch=4)
+    assert window == msg_list[7:]
+    assert to_fold == msg_list[:7]
+
+
+def test_keeps_pending_messages_until_fold_batch():
+    msg_list = _messages(11)
+    window, to_fold = select_history_window(msg_list, {'text': '', 'count': 0},
+                                            max_turns=2, token_budget=1000, fold_batch=10)
+    assert window == msg_list
+    assert to_fold == []
+
+
+def test_token_budget_limits_window():
+    msg_list = _messages(11)
+    window, to_fold = select_history_window(msg_list, {'text': '', 'count': 0},
+                                            max_turns=10, token_budget=35, fold_batch=100)
+    assert window == msg_list[-3:]
+    assert to_fold == []
+
+
+def test_skips_already_summarized_messages():
+    msg_list = _messages(11)
+    window, to_fold = select_history_window(msg_list, {'text': '摘要', 'count': 6},
+                                            max_turns=2, token_budget=1000, fold_batch=4)
+    assert window == msg_list[6:]
+    assert to_fold == []
+
+
+def test_always_keeps_current_message():
+    msg_list = _messages(3)
+    window, to_fold = select_history_window(msg_list, {'text': '', 'count': 0},
+                                            max_turns=2, token_budget=5, fold_batch=1)
+    assert window == msg_list[-1:]
+    assert to_fold == msg_list[:-1]
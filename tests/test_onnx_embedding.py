@@ -0,0 +1,49 @@
+"""onnx_embedding：查询前缀与PyTorch模型实际使用的一致，ONNX与PyTorch的查询向量一致"""
+import os
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from fastapi_project.settings import settings
+from fastapi_project.util import onnx_embedding
+from fastapi_project.util.onnx_embedding import reference_instructions
+
+BGE_QUERY_INSTRUCTION = '为这个句子生成表示以用于检索相关文章：'
+
+
+def test_instructions_from_sentence_transformer_prompts():
+    reference = SimpleNamespace(model_name='BAAI/bge-large-zh-v1.5', query_instruction=None, text_instruction=None,
+                                _model=SimpleNamespace(prompts={'query': '查询：', 'text': ''}))
+    assert reference_instructions(reference) == ('查询：', '')
+
+
+def test_instructions_default_to_model_name():
+    # query_instruction为None时HuggingFaceEmbedding实际使用的是bge的默认查询指令
+    reference = SimpleNamespace(model_name='BAAI/bge-large-zh-v1.5', query_instruction=None, text_instruction=None)
+    assert reference_instructions(reference) == (BGE_QUERY_INSTRUCTION, '')
+
+
+def test_explicit_instruction_wins_without_prompts():
+    reference = SimpleNamespace(model_name='BAAI/bge-large-zh-v1.5', query_instruction='问：', text_instruction=None)
+    assert reference_instructions(reference)[0] == '问：'
+
+
+def test_onnx_query_embedding_matches_torch():
+    """需要已导出的ONNX模型和本地缓存的bge权重"""
+    pytest.importorskip('onnxruntime')
+    onnx_dir = settings.ONNX_MODEL_DIR
+    model_file = onnx_embedding.model_file_name()
+    if not os.path.exists(os.path.join(onnx_dir, model_file)):
+        pytest.skip(f"{onnx_dir} 中没有导出的ONNX模型")
+    from fastapi_project.util.chat_util import load_hf_embedding
+    try:
+        reference = load_hf_embedding(os.path.abspath("models"))
+    except Exception as e:
+        pytest.skip(f"无法加载本地的bge模型: {e}")
+    onnx_embedding.check(onnx_dir, reference=reference)
+    onnx_model = onnx_embedding.OnnxBgeEmbedding(onnx_dir, model_file=model_file)
+    assert onnx_model.query_instruction == reference_instructions(reference)[0]
+    queries = onnx_embedding.QUERY_SAMPLES[:3]
+    onnx_vectors = np.asarray([onnx_model.get_query_embedding(q) for q in queries])
+    torch_vectors = np.asarray([reference.get_query_embedding(q) for q in queries])
+    cosines = np.sum(onnx_vectors * torch_vectors, axis=1)
+    assert cosines.min() >= settings.ONNX_MIN_COSINE
@@ -0,0 +1,94 @@
+"""两个SessionStore共用一个SQLite文件，模拟两个uvicorn worker"""
+import pytest
+from fastapi_project.util.session_store import SQLiteSessionBackend, SessionStore
+
+
+@pytest.fixture
+def workers(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    stores = [SessionStore(SQLiteSessionBackend(path), flush_interval=3600) for _ in range(2)]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def _turn(store, text):
+    """按main.py中/chat的方式完成一轮对话：复制历史，追加后整体写回"""
+    msg_list = list(store.get('u', 's', create=True))
+    msg_list.append({'role': 'user', 'content': text})
+    msg_list.append({'role': 'system', 'content': 're:' + text})
+    store.set('u', 's', msg_list)
+
+
+def test_get_reads_through_after_other_worker_writes(workers):
+    a, b = workers
+    _turn(a, '1')
+    assert b.get('u', 's') == a.get('u', 's')
+    _turn(b, '2')
+    # a的缓存里只有第一轮，get时应发现版本变化并重新加载
+    assert [m['content'] for m in a.get('u', 's')] == ['1', 're:1', '2', 're:2']
+
+
+def test_stale_write_is_merged_not_overwritten(workers):
+    a, b = workers
+    _turn(a, '1')
+    stale = list(b.get('u', 's'))
+    _turn(a, '2')
+    # b基于旧版本写入，第二轮不能丢
+    stale.append({'role': 'user', 'content': '3'})
+    b.set('u', 's', stale)
+    contents = [m['content'] for m in a.get('u', 's')]
+    assert contents == ['1', 're:1', '2', 're:2', '3']
+    assert b.get('u', 's') == a.get('u', 's')
+
+
+def test_new_session_created_concurrently_keeps_both(workers):
+    a, b = workers
+    a_list = list(a.get('u', 's', create=True))
+    b_list = list(b.get('u', 's', create=True))
+    a.set('u', 's', a_list + [{'role': 'user', 'content': 'a'}])
+    b.set('u', 's', b_list + [{'role': 'user', 'content': 'b'}])
+    assert [m['content'] for m in a.get('u', 's')] == ['a', 'b']
+
+
+def test_delete_is_seen_by_other_worker(workers):
+    a, b = workers
+    _turn(a, '1')
+    assert b.get('u', 's')
+    a.delete('u', 's')
+    assert b.get('u', 's') is None
+    # 删除前没落盘的摘要也不能把会话写回来
+    a.set_summary('u', 's', {'text': 'x', 'count': 1})
+    a.delete('u', 's')
+    a.flush()
+    assert b.get('u', 's') is None
+
+
+def test_delete_during_save_does_not_resurrect(workers, monkeypatch):
+    a, _ = workers
+    _turn(a, '1')
+    backend = a.backend
+    original_save = backend.save
+
+    def save_then_delete(*args, **kwargs):
+        result = original_save(*args, **kwargs)
+        # 模拟写入返回前另一个请求删除了会话
+        monkeypatch.setattr(backend, 'save', original_save)
+        a.delete('u', 's')
+        return result
+
+    monkeypatch.setattr(backend, 'save', save_then_delete)
+    _turn(a, '2')
+    assert backend.load('u', 's') is None
+    assert a.get('u', 's') is None
+
+
+def test_evicted_session_is_saved_and_reloaded(tmp_path):
+    store = SessionStore(SQLiteSessionBackend(str(tmp_path / 's.db')), max_sessions=1, flush_interval=3600)
+    try:
+        store.set_summary('u', 's1', {'text': 'old', 'count': 2})
+        store.get('u', 's2', create=True)
+        assert store.stats()['cached_sessions'] == 1
+        assert store.get_summary('u', 's1') == {'text': 'old', 'count': 2}
+    finally:
+        store.close()
@@ -0,0 +1,98 @@
+"""vector_store：HNSW和mmap向量库的召回率，以及索引重建后不再加载过期的转换结果"""
+import os
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery, MetadataFilters, MetadataFilter
+from fastapi_project.util import vector_store
+from fastapi_project.util.vector_store import HnswVectorStore, MmapVectorStore, SIMPLE_STORE_FNAME, convert, evaluate_recall, load_vector_store
+
+pytest.importorskip('hnswlib')
+
+
+def _simple_store(count=300, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim))
+    store = SimpleVectorStore()
+    store.add([TextNode(id_=f'n{i}', text=f'段落{i}', embedding=vectors[i].tolist(), metadata={'doc': f'd{i % 10}'},
+                        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f'd{i % 10}')})
+               for i in range(count)])
+    return store
+
+
+@pytest.fixture
+def persist_dir(tmp_path):
+    _simple_store().persist(str(tmp_path / SIMPLE_STORE_FNAME))
+    return str(tmp_path)
+
+
+def test_hnsw_recall():
+    simple_store = _simple_store()
+    store = HnswVectorStore.from_simple_store(simple_store, ef_search=100)
+    assert evaluate_recall(simple_store, store, k=5)['recall'] >= 0.95
+
+
+def test_hnsw_query_returns_node_ids():
+    simple_store = _simple_store()
+    store = HnswVectorStore.from_simple_store(simple_store)
+    query = simple_store.data.embedding_dict['n7']
+    result = store.query(VectorStoreQuery(query_embedding=query, similarity_top_k=3))
+    assert result.ids[0] == 'n7'
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_load_converted_store(persist_dir):
+    assert load_vector_store(persist_dir, backend='hnsw') is None
+    convert(persist_dir, backend='hnsw')
+    assert isinstance(load_vector_store(persist_dir, backend='hnsw'), HnswVectorStore)
+    assert load_vector_store(persist_dir, backend='simple') is None
+
+
+def test_stale_converted_store_is_ignored(persist_dir):
+    convert(persist_dir, backend='hnsw')
+    # 索引重建后原向量库文件变化，转换结果中的node_id可能已经对不上
+    _simple_store(count=200, seed=1).persist(os.path.join(persist_dir, SIMPLE_STORE_FNAME))
+    assert load_vector_store(persist_dir, backend='hnsw') is None
+    convert(persist_dir, backend='hnsw')
+    assert load_vector_store(persist_dir, backend='hnsw') is not None
+
+
+def test_docstore_change_marks_store_stale(persist_dir):
+    docstore = os.path.join(persist_dir, vector_store.DOCSTORE_FNAME)
+    with open(docstore, 'w', encoding='utf-8') as f:
+        f.write('{}')
+    convert(persist_dir, backend='hnsw')
+    with open(docstore, 'w', encoding='utf-8') as f:
+        f.write('{"changed": true}')
+    assert load_vector_store(persist_dir, backend='hnsw') is None
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16'])
+def test_mmap_recall(dtype):
+    simple_store = _simple_store()
+    store = MmapVectorStore.from_simple_store(simple_store, dtype=dtype)
+    # 精确检索，float16只有相似度很接近的结果顺序可能不同
+    assert evaluate_recall(simple_store, store, k=5)['recall'] >= (1.0 if dtype == 'float32' else 0.98)
+
+
+def test_mmap_filtered_query_and_delete():
+    simple_store = _simple_store()
+    store = MmapVectorStore.from_simple_store(simple_store, dtype='float32')
+    query = simple_store.data.embedding_dict['n7']
+    filters = MetadataFilters(filters=[MetadataFilter(key='doc', value='d3')])
+    result = store.query(VectorStoreQuery(query_embedding=query, similarity_top_k=5, filters=filters))
+    assert len(result.ids) == 5
+    assert all(int(node_id[1:]) % 10 == 3 for node_id in result.ids)
+    store.delete('d7')
+    result = store.query(VectorStoreQuery(query_embedding=query, similarity_top_k=10))
+    assert len(result.ids) == 10
+    assert all(int(node_id[1:]) % 10 != 7 for node_id in result.ids)
+
+
+def test_mmap_save_and_reload(persist_dir):
+    convert(persist_dir, backend='mmap', dtype='float16')
+    store = load_vector_store(persist_dir, backend='mmap')
+    assert isinstance(store, MmapVectorStore)
+    assert isinstance(store.client, np.memmap)
+    simple_store = SimpleVectorStore.from_persist_path(os.path.join(persist_dir, SIMPLE_STORE_FNAME))
+    assert evaluate_recall(simple_store, store, k=5)['recall'] >= 0.98